@@ -0,0 +1,104 @@
+import os
+import threading
+import zipfile
+
+# ---------------------------------------------------------------------
+# Streaming ZIP Packaging
+# ---------------------------------------------------------------------
+
+part_overhead = 1024 * 1024  # Room left in a part for headers and the central directory
+
+
+class StreamingZip:
+    """
+    ZIP archive that is filled while a batch renders: `add` appends each
+    finished video as soon as it exists, so closing the archive after the
+    last render only writes the central directory.
+
+    Entries are stored, not deflated. MP4 is already compressed, so DEFLATE
+    costs CPU time and saves almost nothing. Files are copied in chunks,
+    so memory use does not depend on video size.
+
+    With `max_size` (bytes) the archive is split into parts that each stay
+    under it, `<name>-1.zip`, `<name>-2.zip`, ..., every part a complete
+    ZIP of its own; a single file larger than `max_size` gets a part to
+    itself. An archive that fits in one part is written to `path`.
+
+    Parts are written to `<part>.partial` and renamed on close, so a
+    half-written archive is never offered for download.
+    """
+
+    def __init__(self, path, max_size=None):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.max_size = max_size
+        self.names = []
+        self.paths = []  # Final paths of the parts, set by `close`
+        self._parts = []  # Partial paths, in order
+        self._part_names = []  # Entries in the current part
+        self._lock = threading.Lock()
+        self._zip = None
+        self._start_part()
+
+    def _part_path(self, number):
+        stem, ext = os.path.splitext(self.path)
+        return f"{stem}-{number}{ext}"
+
+    def _start_part(self):
+        partial_path = f"{self._part_path(len(self._parts) + 1)}.partial"
+        self._zip = zipfile.ZipFile(partial_path, "w", compression=zipfile.ZIP_STORED, allowZip64=True)
+        self._parts.append(partial_path)
+        self._part_names = []
+
+    def add(self, file_path, arcname=None):
+        """
+        Appends `file_path` under `arcname` (default: its file name; repeated
+        names get a numeric suffix). Safe to call from several threads.
+        """
+        arcname = arcname or os.path.basename(file_path)
+        with self._lock:
+            stem, ext = os.path.splitext(arcname)
+            counter = 1
+            while arcname in self.names:
+                arcname = f"{stem}_{counter}{ext}"
+                counter += 1
+            if self.max_size and self._part_names:
+                written = self._zip.fp.tell()
+                if written + os.path.getsize(file_path) + part_overhead > self.max_size:
+                    self._zip.close()
+                    self._start_part()
+            self._zip.write(file_path, arcname)
+            self.names.append(arcname)
+            self._part_names.append(arcname)
+        return arcname
+
+    def close(self):
+        """
+        Finishes the archive and moves its parts into place. Returns their
+        paths: [path] when it fits in one part.
+        """
+        with self._lock:
+            self._zip.close()
+            if len(self._parts) == 1:
+                self.paths = [self.path]
+            else:
+                self.paths = [self._part_path(number) for number in range(1, len(self._parts) + 1)]
+            for partial_path, path in zip(self._parts, self.paths):
+                os.replace(partial_path, path)
+        return self.paths
+
+    def abort(self):
+        with self._lock:
+            self._zip.close()
+            for partial_path in self._parts:
+                if os.path.exists(partial_path):
+                    os.remove(partial_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
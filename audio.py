@@ -0,0 +1,68 @@
+import io
+import wave
+
+import numpy as np
+from moviepy.audio.AudioClip import AudioClip
+
+from tts import read_wav
+
+# ---------------------------------------------------------------------
+# In-Memory Narration Audio
+# ---------------------------------------------------------------------
+#
+# Narration arrives from TTS as WAV bytes and stays in memory as integer
+# PCM: the duration comes from the header's sample count, and MoviePy
+# reads it through PCMAudioClip, which converts to float only the chunk
+# of samples it is asked for. No MP3 encode/decode and no audio file.
+
+pcm_dtypes = {2: "<i2", 4: "<i4"}  # Sample width in bytes -> little-endian PCM dtype
+
+
+def wav_duration(wav_data):
+    """
+    Duration in seconds of a WAV payload, from its header alone.
+    """
+    with wave.open(io.BytesIO(wav_data), "rb") as wav:
+        return wav.getnframes() / wav.getframerate()
+
+
+def decode_wav(wav_data):
+    """
+    Returns (samples, sample rate) of a WAV payload, with samples as an
+    integer array of shape (frames, channels) over the raw PCM.
+    """
+    (channels, sample_width, sample_rate), frames = read_wav(wav_data)
+    if sample_width not in pcm_dtypes:
+        raise ValueError(f"Unsupported WAV sample width: {sample_width * 8} bit")
+    samples = np.frombuffer(frames, dtype=pcm_dtypes[sample_width]).reshape(-1, channels)
+    return samples, sample_rate
+
+
+class PCMAudioClip(AudioClip):
+    """
+    Audio clip over integer PCM samples (frames x channels). Unlike
+    AudioArrayClip it keeps the samples as integers (a quarter of the memory
+    of float64 for 16 bit) and scales each requested chunk to [-1, 1).
+    """
+
+    def __init__(self, samples, sample_rate):
+        frame_count, channels = samples.shape
+        scale = 1.0 / -np.iinfo(samples.dtype).min
+        self.samples = samples
+
+        def frame_function(t):
+            index = np.round(np.asarray(t) * sample_rate).astype(int)
+            if index.ndim == 0:
+                if 0 <= index < frame_count:
+                    return samples[index] * scale
+                return np.zeros(channels)
+            in_range = (index >= 0) & (index < frame_count)
+            chunk = np.zeros((len(index), channels))
+            chunk[in_range] = samples[index[in_range]] * scale
+            return chunk
+
+        super().__init__(frame_function, duration=frame_count / sample_rate, fps=sample_rate)
+
+    @classmethod
+    def from_wav(cls, wav_data):
+        return cls(*decode_wav(wav_data))
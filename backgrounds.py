@@ -0,0 +1,310 @@
+import hashlib
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: the index is only locked within the process
+    fcntl = None
+
+from moviepy.config import FFMPEG_BINARY
+from moviepy.video.io.ffmpeg_reader import ffmpeg_parse_infos
+
+# ---------------------------------------------------------------------
+# Background Proxy Library
+# ---------------------------------------------------------------------
+
+video_folder = "assets/background_videos"
+proxy_dir = "assets/cache/proxies"
+index_path = "assets/cache/background_index.json"
+
+proxy_width = 1080
+proxy_height = 1920
+proxy_fps = 24
+proxy_gop = 24  # One keyframe per second keeps seeks into the proxy cheap
+
+
+def list_backgrounds(folder=video_folder):
+    return sorted(f for f in os.listdir(folder) if f.endswith(".mp4"))
+
+
+def proxy_path_for(source_path, directory=proxy_dir):
+    """
+    Returns the proxy path for `source_path`. The name encodes the source
+    path plus its size and mtime, so editing or replacing a background
+    automatically points to a new proxy.
+    """
+    stat = os.stat(source_path)
+    source_id = hashlib.sha1(os.path.abspath(source_path).encode("utf-8")).hexdigest()[:12]
+    version = hashlib.sha1(f"{stat.st_size}:{stat.st_mtime_ns}".encode("utf-8")).hexdigest()[:12]
+    stem = os.path.splitext(os.path.basename(source_path))[0]
+    return os.path.join(directory, f"{stem}-{source_id}-{version}.mp4")
+
+
+def build_proxy(source_path, proxy_path):
+    """
+    Transcodes `source_path` into a 1080x1920, 24 fps, short-GOP H.264 proxy
+    (scaled to the reel height and centre-cropped, without audio).
+    """
+    os.makedirs(os.path.dirname(proxy_path), exist_ok=True)
+    tmp_path = f"{proxy_path}.{os.getpid()}.{threading.get_ident()}.tmp.mp4"
+
+    cmd = [
+        FFMPEG_BINARY, "-y", "-hide_banner", "-loglevel", "error",
+        "-i", source_path,
+        "-vf", f"scale=-2:{proxy_height},crop={proxy_width}:{proxy_height},fps={proxy_fps},setsar=1",
+        "-an",
+        "-c:v", "libx264", "-preset", "veryfast", "-crf", "18", "-pix_fmt", "yuv420p",
+        "-g", str(proxy_gop), "-keyint_min", str(proxy_gop), "-sc_threshold", "0",
+        "-movflags", "+faststart",
+        tmp_path,
+    ]
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise RuntimeError(
+            f"ffmpeg failed to build a proxy for {source_path}:\n"
+            + result.stderr.decode("utf-8", errors="replace")
+        )
+
+    os.replace(tmp_path, proxy_path)
+    remove_stale_proxies(proxy_path)
+    return proxy_path
+
+
+def remove_stale_proxies(proxy_path):
+    """
+    Deletes older proxies of the same source (same name and source id,
+    different size/mtime version).
+    """
+    directory, name = os.path.split(proxy_path)
+    prefix = name.rsplit("-", 1)[0] + "-"
+    for other in os.listdir(directory):
+        if other != name and other.startswith(prefix) and other.endswith(".mp4") and ".tmp" not in other:
+            try:
+                os.remove(os.path.join(directory, other))
+            except OSError:
+                pass
+
+
+def get_proxy(source_path):
+    """
+    Returns an up-to-date proxy for `source_path`, building it on first use.
+    """
+    proxy_path = proxy_path_for(source_path)
+    if not os.path.exists(proxy_path):
+        build_proxy(source_path, proxy_path)
+    return proxy_path
+
+
+def build_all_proxies(folder=video_folder):
+    """
+    Preprocesses every background in `folder`, skipping up-to-date proxies.
+    """
+    proxies = []
+    for name in list_backgrounds(folder):
+        source_path = os.path.join(folder, name)
+        proxy_path = proxy_path_for(source_path)
+        if os.path.exists(proxy_path):
+            print(f"Up to date: {name}")
+        else:
+            print(f"Building proxy: {name}")
+            build_proxy(source_path, proxy_path)
+        proxies.append(proxy_path)
+    return proxies
+
+
+# ---------------------------------------------------------------------
+# Background Index & Segment Selection
+# ---------------------------------------------------------------------
+
+_index_lock = threading.Lock()
+
+
+@contextmanager
+def locked_index(path=index_path):
+    """
+    Holds the index lock for a read-modify-write of the index at `path`:
+    a thread lock, plus an exclusive lock on `path`.lock so that worker
+    processes do not overwrite each other's updates.
+    """
+    with _index_lock:
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(f"{path}.lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def probe_keyframes(path):
+    """
+    Returns the keyframe timestamps of the first video stream of `path`.
+    Only keyframes are decoded, so this is much cheaper than a full decode.
+    Raises RuntimeError if ffmpeg cannot decode the file.
+    """
+    cmd = [
+        FFMPEG_BINARY, "-hide_banner", "-nostats",
+        "-skip_frame", "nokey", "-i", path,
+        "-map", "0:v:0", "-vf", "showinfo", "-f", "null", "-",
+    ]
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    output = result.stderr.decode("utf-8", errors="replace")
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed to read the keyframes of {path}:\n{output[-2000:]}")
+    keyframes = sorted({round(float(t), 3) for t in re.findall(r"pts_time:([0-9.]+)", output)})
+    return keyframes or [0.0]
+
+
+def probe_background(path):
+    """
+    Returns the index entry for one background: duration, resolution, fps
+    and keyframe positions, plus the size/mtime used to detect changes.
+    Raises RuntimeError (or OSError) for files ffmpeg cannot read.
+    """
+    stat = os.stat(path)
+    infos = ffmpeg_parse_infos(path)
+    if not infos.get("video_size") or not infos.get("duration"):
+        raise RuntimeError(f"ffmpeg found no video stream in {path}")
+    width, height = infos["video_size"]
+    return {
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "duration": infos["duration"],
+        "width": width,
+        "height": height,
+        "fps": infos["video_fps"],
+        "keyframes": probe_keyframes(path),
+        "last_used": 0.0,
+    }
+
+
+def load_index(path=index_path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_index(index, path=index_path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(index, f, indent=1)
+    os.replace(tmp_path, path)
+
+
+def refresh_index(folder=video_folder, path=index_path):
+    """
+    Brings the on-disk index in line with `folder`: new or modified files
+    (by size and mtime) are probed, deleted files are dropped and unchanged
+    entries are kept as they are. A file ffmpeg cannot read gets an entry
+    with only its size, mtime and the "error", so it is skipped without
+    being probed again until it changes. Returns the index (file name ->
+    entry).
+    """
+    with locked_index(path):
+        index = load_index(path)
+        changed = False
+        names = list_backgrounds(folder)
+
+        for name in names:
+            stat = os.stat(os.path.join(folder, name))
+            entry = index.get(name)
+            if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+                continue
+            print(f"Indexing background: {name}")
+            try:
+                new_entry = probe_background(os.path.join(folder, name))
+            except (OSError, RuntimeError) as e:
+                print(f"Skipping unreadable background {name}: {e}")
+                index[name] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "error": str(e)[-500:]}
+                changed = True
+                continue
+            if entry:
+                new_entry["last_used"] = entry.get("last_used", 0.0)
+            index[name] = new_entry
+            changed = True
+
+        for name in set(index) - set(names):
+            del index[name]
+            changed = True
+
+        if changed:
+            save_index(index, path)
+        return index
+
+
+def segment_starts(entry, min_duration, use_proxy):
+    """
+    Keyframe-aligned start times in a background that leave at least
+    `min_duration` seconds of video. Proxies have a keyframe every
+    `proxy_gop` frames, originals use the probed keyframes.
+    """
+    latest_start = entry["duration"] - min_duration
+    if latest_start < 0:
+        return []
+    if use_proxy:
+        step = proxy_gop / proxy_fps
+        return [i * step for i in range(int(latest_start / step) + 1)]
+    return [t for t in entry["keyframes"] if t <= latest_start]
+
+
+def select_background(min_duration, folder=video_folder, use_proxy=True, path=index_path):
+    """
+    Picks a background long enough for `min_duration` and a random
+    keyframe-aligned start offset inside it, preferring the backgrounds
+    used least recently. Returns (source path, start time), or None when
+    the folder has no readable MP4 files.
+
+    Raises ValueError if every background is shorter than `min_duration`.
+    """
+    index = {name: entry for name, entry in refresh_index(folder, path).items() if "error" not in entry}
+    if not index:
+        return None
+
+    candidates = []
+    for name, entry in index.items():
+        starts = segment_starts(entry, min_duration, use_proxy)
+        if starts:
+            candidates.append((name, starts))
+    if not candidates:
+        longest = max(entry["duration"] for entry in index.values())
+        raise ValueError(
+            f"No background video is long enough for {min_duration:.1f}s of audio "
+            f"(longest is {longest:.1f}s)"
+        )
+
+    # Random pick among the least recently used half
+    candidates.sort(key=lambda c: index[c[0]].get("last_used", 0.0))
+    name, starts = random.choice(candidates[:max(1, (len(candidates) + 1) // 2)])
+    start_time = random.choice(starts)
+
+    with locked_index(path):
+        latest = load_index(path)
+        if name in latest:
+            latest[name]["last_used"] = time.time()
+            save_index(latest, path)
+
+    return os.path.join(folder, name), start_time
+
+
+if __name__ == "__main__":
+    folder = sys.argv[1] if len(sys.argv) > 1 else video_folder
+    refresh_index(folder)
+    build_all_proxies(folder)
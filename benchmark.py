@@ -0,0 +1,59 @@
+import argparse
+import time
+
+from moviepy.video.io.ffmpeg_reader import ffmpeg_parse_infos
+
+from video import make_video, render_engines
+
+# ---------------------------------------------------------------------
+# Render Engine Benchmark
+# ---------------------------------------------------------------------
+
+default_title = "AITA for telling my roommate the truth about her cooking?"
+default_body = (
+    "My roommate has been cooking dinner for the two of us every night for a month. "
+    "Last week she asked me what I really thought, and I told her the pasta was always "
+    "overcooked. She has not spoken to me since. Was I wrong to be honest?"
+)
+
+
+def benchmark_engines(engines, runs, voice, speed, title, body):
+    """
+    Renders the same script with every engine in `engines` `runs` times and
+    returns a dict of engine -> list of (wall seconds, video seconds).
+    """
+    results = {engine: [] for engine in engines}
+
+    for run in range(runs):
+        for engine in engines:
+            start = time.perf_counter()
+            output_path = make_video(voice, speed, title, body, engine=engine, force=True)
+            elapsed = time.perf_counter() - start
+            duration = ffmpeg_parse_infos(output_path)["duration"]
+            results[engine].append((elapsed, duration))
+            print(f"[run {run + 1}/{runs}] {engine}: {elapsed:.2f}s for {duration:.2f}s of video")
+
+    return results
+
+
+def print_summary(results):
+    print("\nengine      mean wall   realtime factor")
+    for engine, samples in results.items():
+        if not samples:
+            continue
+        mean_wall = sum(s[0] for s in samples) / len(samples)
+        mean_factor = sum(s[1] / s[0] for s in samples) / len(samples)
+        print(f"{engine:<10}  {mean_wall:8.2f}s   {mean_factor:6.2f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare ReelsAI render engines.")
+    parser.add_argument("--engines", nargs="+", choices=render_engines, default=list(render_engines))
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--voice", default="af_heart")
+    parser.add_argument("--speed", type=float, default=1.0)
+    parser.add_argument("--title", default=default_title)
+    parser.add_argument("--body", default=default_body)
+    args = parser.parse_args()
+
+    print_summary(benchmark_engines(args.engines, args.runs, args.voice, args.speed, args.title, args.body))
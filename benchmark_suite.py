@@ -0,0 +1,426 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import queue
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+
+from moviepy.config import FFMPEG_BINARY
+
+from kokoro_stub import sample_rate, start_stub, synthesize
+from scripts import parse_scripts
+
+try:
+    import resource
+except ImportError:  # Windows: peak RSS is not reported
+    resource = None
+
+# ---------------------------------------------------------------------
+# End-to-End Benchmark Suite
+# ---------------------------------------------------------------------
+#
+# Renders a fixed corpus of short/medium/long scripts against the local
+# Kokoro stub and a synthetic background, inside a sandbox directory so
+# the real backgrounds, caches and outputs are never touched. Every
+# scenario runs in a fresh process, so peak RSS is per scenario.
+#
+#   python3 benchmark_suite.py --engines ffmpeg --report before.json
+#   python3 benchmark_suite.py --engines ffmpeg --report after.json --compare before.json
+
+repo_dir = os.path.dirname(os.path.abspath(__file__))
+sandbox_dir = os.path.join(repo_dir, "assets", "cache", "benchmark")
+
+# Words per body for each corpus size
+script_sizes = {"short": 40, "medium": 120, "long": 300}
+corpus_per_size = 4
+corpus_seed = 1234
+
+word_bank = (
+    "I my roommate friend sister brother boss coworker neighbor told asked said never always "
+    "really maybe today yesterday last week dinner party wedding car house money phone rent "
+    "because when after before while honest angry upset happy surprised wrong right about "
+    "the a an and or but so then it was is would could should have had did not just "
+    "apartment kitchen office message text call birthday gift plan weekend trip family"
+).split()
+
+
+def make_sentence(rng, min_words=6, max_words=14):
+    words = [rng.choice(word_bank) for _ in range(rng.randint(min_words, max_words))]
+    sentence = " ".join(words)
+    if len(words) > 8:
+        cut = rng.randint(3, len(words) - 3)
+        sentence = " ".join(words[:cut]) + ", " + " ".join(words[cut:])
+    return sentence[0].upper() + sentence[1:] + rng.choice([".", ".", ".", "?", "!"])
+
+
+def make_script(rng, body_words):
+    title = "AITA for " + " ".join(rng.choice(word_bank) for _ in range(rng.randint(5, 9))) + "?"
+    sentences = []
+    while sum(len(s.split()) for s in sentences) < body_words:
+        sentences.append(make_sentence(rng))
+    return title, " ".join(sentences)
+
+
+def make_corpus(sizes=script_sizes, per_size=corpus_per_size, seed=corpus_seed):
+    """
+    Deterministic corpus: size -> list of (title, body), `per_size` each.
+    """
+    rng = random.Random(seed)
+    return {
+        size: [make_script(rng, words) for _ in range(per_size)]
+        for size, words in sizes.items()
+    }
+
+
+def format_scripts(scripts):
+    """
+    Formats (title, body) pairs in the `##` layout `parse_scripts` reads.
+    """
+    return "\n##\n".join(f"{title}\n##\n{body}" for title, body in scripts) + "\n"
+
+
+def narration_seconds(title, body, speed=1.0):
+    samples, _timestamps = synthesize(f"{title} {body}", speed)
+    return len(samples) / sample_rate
+
+
+# ---------------------------------------------------------------------
+# Sandbox & Synthetic Background
+# ---------------------------------------------------------------------
+
+def make_synthetic_background(path, duration, size=(1920, 1080), fps=30):
+    """
+    Encodes a deterministic moving test pattern (ffmpeg's testsrc2) as an
+    H.264 MP4, landscape like typical gameplay footage so the crop path is
+    exercised. Skipped when `path` already exists.
+    """
+    if os.path.exists(path):
+        return path
+    tmp_path = path + ".tmp.mp4"
+    cmd = [
+        FFMPEG_BINARY, "-y", "-hide_banner", "-loglevel", "error",
+        "-f", "lavfi", "-i", f"testsrc2=size={size[0]}x{size[1]}:rate={fps}:duration={duration:.0f}",
+        "-c:v", "libx264", "-preset", "veryfast", "-crf", "23", "-g", str(fps * 2),
+        "-pix_fmt", "yuv420p", tmp_path,
+    ]
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        raise RuntimeError(
+            "ffmpeg failed to generate the synthetic background:\n"
+            + result.stderr.decode("utf-8", errors="replace")
+        )
+    os.replace(tmp_path, path)
+    return path
+
+
+def prepare_sandbox(root, background_seconds):
+    """
+    Lays out `root` like the repo's assets folder: the default font and
+    template are linked in, the synthetic background is the only background.
+    """
+    assets = os.path.join(root, "assets")
+    for name in ("background_videos", "outputs", "cache"):
+        os.makedirs(os.path.join(assets, name), exist_ok=True)
+
+    default_link = os.path.join(assets, "default")
+    if not os.path.exists(default_link):
+        try:
+            os.symlink(os.path.join(repo_dir, "assets", "default"), default_link)
+        except OSError:  # No symlink permission (Windows)
+            shutil.copytree(os.path.join(repo_dir, "assets", "default"), default_link)
+
+    background_folder = os.path.join(assets, "background_videos")
+    for name in os.listdir(background_folder):
+        if name.startswith("synthetic_") and not name.endswith(f"_{background_seconds}s.mp4"):
+            os.remove(os.path.join(background_folder, name))
+    make_synthetic_background(
+        os.path.join(background_folder, f"synthetic_{background_seconds}s.mp4"), background_seconds
+    )
+
+
+def reset_sandbox_outputs(root):
+    """
+    Clears outputs and the TTS cache so every scenario starts cold; the
+    background index and proxies are kept, they are built once in setup.
+    """
+    for path in (os.path.join(root, "assets", "outputs"), os.path.join(root, "assets", "cache", "tts")):
+        shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(os.path.join(root, "assets", "outputs"), exist_ok=True)
+
+
+# ---------------------------------------------------------------------
+# Scenarios
+# ---------------------------------------------------------------------
+
+def peak_rss_mb(who):
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    maxrss = resource.getrusage(who).ru_maxrss
+    return maxrss / (1024 * 1024) if sys.platform == "darwin" else maxrss / 1024
+
+
+def run_scenario(spec, result_queue):
+    """
+    Runs one scenario in this (fresh) process and puts its measurements on
+    `result_queue`. The render modules are imported here, after the parent
+    has switched into the sandbox and pointed KOKORO_ENDPOINTS at the stub.
+    """
+    from moviepy.video.io.ffmpeg_reader import ffmpeg_parse_infos
+
+    from render_service import RenderService, finished_states
+    from video import make_video
+
+    scripts = [tuple(script) for script in spec["scripts"]]
+    start = time.perf_counter()
+    try:
+        if spec["scenario"] == "single":
+            title, body = scripts[0]
+            output = make_video(spec["voice"], spec["speed"], title, body,
+                                engine=spec["engine"], segments=spec["segments"], force=True)
+            outputs = [output] if output else []
+            errors = [] if output else ["no output"]
+        else:
+            # The batch path of the web UI: the render service's staged pipeline
+            service = RenderService(workers=spec["encode_workers"], archive_dir=os.path.join("assets", "cache"))
+            try:
+                service.submit("benchmark", scripts, spec["voice"], spec["speed"], engine=spec["engine"], force=True)
+                while True:
+                    jobs = [job for _batch, batch_jobs in service.session_batches("benchmark") for job in batch_jobs]
+                    if all(job["state"] in finished_states for job in jobs):
+                        break
+                    time.sleep(0.2)
+            finally:
+                service.shutdown()
+            outputs = [job["output"] for job in jobs if job["output"]]
+            errors = [job["error"] or job["state"] for job in jobs if job["state"] != "done"]
+    except Exception as e:
+        outputs, errors = [], [repr(e)]
+    wall = time.perf_counter() - start
+
+    video_seconds = sum(ffmpeg_parse_infos(path)["duration"] for path in outputs)
+    result_queue.put({
+        "wall_s": wall,
+        "videos": len(outputs),
+        "errors": errors,
+        "video_s": video_seconds,
+        "realtime_factor": video_seconds / wall if wall else None,
+        "videos_per_min": len(outputs) * 60 / wall if wall else None,
+        "peak_rss_mb": peak_rss_mb(resource.RUSAGE_SELF) if resource else None,
+        "children_peak_rss_mb": peak_rss_mb(resource.RUSAGE_CHILDREN) if resource else None,
+    })
+
+
+def measure(spec):
+    mp_context = multiprocessing.get_context("spawn")
+    result_queue = mp_context.Queue()
+    process = mp_context.Process(target=run_scenario, args=(spec, result_queue))
+    process.start()
+    while True:
+        try:
+            result = result_queue.get(timeout=1)
+            break
+        except queue.Empty:
+            if not process.is_alive():
+                result = {
+                    "wall_s": None, "videos": 0,
+                    "errors": [f"scenario process exited with code {process.exitcode}"],
+                    "video_s": 0.0, "realtime_factor": None, "videos_per_min": None,
+                    "peak_rss_mb": None, "children_peak_rss_mb": None,
+                }
+                break
+    process.join()
+    return result
+
+
+def build_scenarios(args, corpus):
+    scenarios = []
+    for engine in args.engines:
+        for size in args.sizes:
+            scenarios.append({
+                "scenario": "single", "engine": engine, "size": size,
+                "segments": args.segments if engine == "moviepy" else 1,
+                "scripts": corpus[size][:1],
+            })
+        if args.batch:
+            # Sizes interleaved, and round-tripped through the `##` parser the web UI uses
+            mixed = [corpus[size][i] for i in range(corpus_per_size) for size in args.sizes]
+            scripts = parse_scripts(format_scripts(mixed[:args.batch]))
+            scenarios.append({
+                "scenario": "batch", "engine": engine, "size": f"{len(scripts)} mixed",
+                "encode_workers": args.encode_workers,
+                "scripts": scripts,
+            })
+    for spec in scenarios:
+        spec.update(voice="af_heart", speed=1.0)
+    return scenarios
+
+
+def scenario_key(entry):
+    return f"{entry['scenario']}/{entry['engine']}/{entry['size']}"
+
+
+# ---------------------------------------------------------------------
+# Report
+# ---------------------------------------------------------------------
+
+def git_commit():
+    try:
+        result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=repo_dir,
+                                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    except OSError:
+        return None
+    return result.stdout.decode().strip() or None
+
+
+def summarize(runs):
+    """
+    Median of every metric per scenario key.
+    """
+    summary = {}
+    for key in dict.fromkeys(scenario_key(run) for run in runs):
+        samples = [run for run in runs if scenario_key(run) == key]
+        summary[key] = {}
+        for metric in ("wall_s", "video_s", "realtime_factor", "videos_per_min",
+                       "peak_rss_mb", "children_peak_rss_mb"):
+            values = [run[metric] for run in samples if run[metric] is not None]
+            summary[key][metric] = statistics.median(values) if values else None
+        summary[key]["failed_runs"] = sum(1 for run in samples if run["errors"])
+    return summary
+
+
+def print_summary(summary):
+    print("\nscenario                      wall      video    xRT   videos/min  peak RSS (self/children)")
+    for key, s in summary.items():
+        if s["wall_s"] is None:
+            print(f"{key:<28} failed")
+            continue
+        rss = f"{s['peak_rss_mb'] or 0:.0f}/{s['children_peak_rss_mb'] or 0:.0f} MB"
+        print(f"{key:<28} {s['wall_s']:7.2f}s {s['video_s']:8.2f}s {s['realtime_factor'] or 0:6.2f} "
+              f"{s['videos_per_min'] or 0:10.2f}   {rss}")
+
+
+def compare_reports(base, current):
+    """
+    Prints the relative change of median wall time and peak RSS per
+    scenario between two reports.
+    """
+    print(f"\nchange vs {base.get('commit') or 'baseline'}          wall       peak RSS")
+    for key, s in current["summary"].items():
+        old = base["summary"].get(key)
+        if not old:
+            continue
+        changes = []
+        for metric in ("wall_s", "peak_rss_mb"):
+            if old.get(metric) and s.get(metric) is not None:
+                changes.append(f"{(s[metric] - old[metric]) / old[metric] * 100:+8.1f}%")
+            else:
+                changes.append(f"{'n/a':>9}")
+        print(f"{key:<28} {changes[0]}  {changes[1]}")
+
+
+def run_suite(args):
+    corpus = make_corpus()
+    longest = max(narration_seconds(title, body) for size in args.sizes for title, body in corpus[size])
+    background_seconds = int(longest) + 30
+
+    report_path = os.path.abspath(args.report)
+    prepare_sandbox(args.sandbox, background_seconds)
+    os.chdir(args.sandbox)
+
+    server, url = start_stub(realtime_factor=args.tts_realtime_factor)
+    os.environ["KOKORO_ENDPOINTS"] = url
+
+    # Index and proxy the synthetic background once, outside the timings
+    from backgrounds import build_all_proxies, refresh_index
+    refresh_index()
+    build_all_proxies()
+
+    runs = []
+    scenarios = build_scenarios(args, corpus)
+    for run in range(args.runs):
+        for spec in scenarios:
+            reset_sandbox_outputs(args.sandbox)
+            result = measure(spec)
+            entry = {
+                "scenario": spec["scenario"],
+                "engine": spec["engine"],
+                "size": spec["size"],
+                "run": run + 1,
+                "scripts": len(spec["scripts"]),
+                **result,
+            }
+            runs.append(entry)
+            if entry["errors"]:
+                print(f"[run {run + 1}/{args.runs}] {scenario_key(entry)}: FAILED {entry['errors'][0]}")
+            else:
+                print(f"[run {run + 1}/{args.runs}] {scenario_key(entry)}: {entry['wall_s']:.2f}s")
+
+    server.shutdown()
+
+    report = {
+        "commit": git_commit(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "machine": {
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+        },
+        "config": {
+            "engines": args.engines,
+            "sizes": {size: script_sizes[size] for size in args.sizes},
+            "runs": args.runs,
+            "batch": args.batch,
+            "encode_workers": args.encode_workers,
+            "segments": args.segments,
+            "tts_realtime_factor": args.tts_realtime_factor,
+            "corpus_seed": corpus_seed,
+            "background_seconds": background_seconds,
+        },
+        "runs": runs,
+        "summary": summarize(runs),
+    }
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=1)
+
+    print_summary(report["summary"])
+    print(f"\nReport written to {report_path}")
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reproducible end-to-end ReelsAI benchmark.")
+    parser.add_argument("--engines", nargs="+", choices=("moviepy", "ffmpeg"), default=["moviepy", "ffmpeg"])
+    parser.add_argument("--sizes", nargs="+", choices=list(script_sizes), default=list(script_sizes))
+    parser.add_argument("--runs", type=int, default=1)
+    parser.add_argument("--batch", type=int, default=4, help="Scripts in the batch scenario (0 to skip)")
+    parser.add_argument("--encode-workers", type=int, default=2,
+                        help="Parallel renders in the batch scenario (render service workers)")
+    parser.add_argument("--segments", type=int, default=1, help="Segments for single MoviePy renders")
+    parser.add_argument("--tts-realtime-factor", type=float, default=0.0,
+                        help="Simulated TTS seconds per second of audio")
+    parser.add_argument("--sandbox", default=sandbox_dir)
+    parser.add_argument("--report", default="benchmark_report.json")
+    parser.add_argument("--compare", help="Earlier report to compare against")
+    parser.add_argument("--write-corpus", metavar="PATH",
+                        help="Only write the corpus as a `##` script file and exit")
+    args = parser.parse_args()
+
+    if args.write_corpus:
+        corpus = make_corpus()
+        with open(args.write_corpus, "w", encoding="utf-8") as f:
+            f.write(format_scripts([script for size in args.sizes for script in corpus[size]]))
+        sys.exit(0)
+
+    args.sandbox = os.path.abspath(args.sandbox)
+    compare_path = os.path.abspath(args.compare) if args.compare else None
+    report = run_suite(args)
+    if compare_path:
+        with open(compare_path, "r", encoding="utf-8") as f:
+            compare_reports(json.load(f), report)
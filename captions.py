@@ -0,0 +1,380 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from moviepy import TextClip
+from moviepy.video.VideoClip import VideoClip
+
+from image import load_font, word_width
+
+# ---------------------------------------------------------------------
+# Caption Rendering
+# ---------------------------------------------------------------------
+
+caption_size = (1920, 200)
+
+
+def render_caption(
+    word,
+    font_path,
+    font_size=110,
+    size=caption_size,
+    color="white",
+    stroke_color="black",
+    stroke_width=10
+):
+    """
+    Rasterizes a single caption exactly like the old per-token TextClip and
+    returns (rgb, alpha): a uint8 HxWx3 frame and a float HxW mask in [0, 1].
+    """
+    clip = TextClip(
+        text=word,
+        font=font_path,
+        font_size=font_size,
+        size=size,
+        color=color,
+        method='caption',
+        text_align='center',
+        horizontal_align='center',
+        vertical_align='center',
+        stroke_color=stroke_color,
+        stroke_width=stroke_width
+    )
+    return clip.get_frame(0), clip.mask.get_frame(0)
+
+
+# ---------------------------------------------------------------------
+# Caption Grouping
+# ---------------------------------------------------------------------
+#
+# Kokoro returns a timestamp for every word and punctuation mark. Instead
+# of one caption per word, consecutive body words are grouped into short
+# phrases, which means far fewer caption events, rasters and ASS lines.
+# A phrase grows word by word while it stays within:
+#
+#   max_chars     characters, spaces included
+#   max_width     pixel width at the caption font size (the visible
+#                 1080 px of the caption band, minus a margin)
+#
+# It always ends at the end of a sentence (. ! ? : ;) and ends at a comma
+# once it has been on screen for `min_duration` seconds. Captions shorter
+# than that are held until `min_duration` or the next caption, whichever
+# comes first. Only words starting at or after the title end are grouped,
+# so the title boundary stays exactly where `find_title_end_time` put it.
+# `max_chars=1` shows one word at a time.
+
+caption_grouping = {"max_chars": 20, "max_width": 960, "min_duration": 0.6}
+sentence_breaks = set(".!?:;")
+phrase_breaks = set(",")
+kept_punctuation = {"?"}  # Shown on screen; other punctuation only ends phrases
+
+
+def caption_words(timestamps):
+    """
+    Folds punctuation tokens into the word before them. Returns a list of
+    {"word", "start_time", "end_time", "break"} with "break" set to
+    "sentence" or "phrase" when punctuation ends the word, else None.
+    """
+    words = []
+    for token in timestamps:
+        text = token["word"].strip()
+        if not text:
+            continue
+        if any(c.isalnum() for c in text):
+            words.append({
+                "word": text,
+                "start_time": token["start_time"],
+                "end_time": token["end_time"],
+                "break": None,
+            })
+            continue
+        if not words:
+            continue  # Punctuation before the first word
+        word = words[-1]
+        if text in kept_punctuation:
+            word["word"] += text
+            word["end_time"] = max(word["end_time"], token["end_time"])
+        if sentence_breaks & set(text):
+            word["break"] = "sentence"
+        elif phrase_breaks & set(text) and word["break"] is None:
+            word["break"] = "phrase"
+    return words
+
+
+def group_captions(
+    timestamps,
+    title_end_time,
+    font_path,
+    max_chars=None,
+    max_width=None,
+    min_duration=None,
+    font_size=110,
+    stroke_width=10
+):
+    """
+    Groups the body words of a Kokoro word timeline into caption phrases.
+    Settings left as None come from `caption_grouping`. Returns a list of
+    {"word", "start_time", "end_time"}, one per caption, in time order.
+    """
+    max_chars = caption_grouping["max_chars"] if max_chars is None else max_chars
+    max_width = caption_grouping["max_width"] if max_width is None else max_width
+    min_duration = caption_grouping["min_duration"] if min_duration is None else min_duration
+
+    font = load_font(font_path, font_size)
+    space = word_width(font, " ")
+    words = [word for word in caption_words(timestamps) if word["start_time"] >= title_end_time]
+
+    # Greedy: add words to the current phrase until a limit or a break ends it
+    phrases = []
+    current = None
+    for word in words:
+        width = word_width(font, word["word"])
+        if current is not None:
+            text = current["word"] + " " + word["word"]
+            joined_width = current["width"] + space + width
+            fits = len(text) <= max_chars and joined_width + 2 * stroke_width <= max_width
+            ended = current["break"] == "sentence" or (
+                current["break"] == "phrase" and current["end_time"] - current["start_time"] >= min_duration
+            )
+            if fits and not ended:
+                current["word"] = text
+                current["end_time"] = word["end_time"]
+                current["width"] = joined_width
+                current["break"] = word["break"]
+                continue
+            phrases.append(current)
+        current = dict(word, width=width)
+    if current is not None:
+        phrases.append(current)
+
+    captions = []
+    for i, phrase in enumerate(phrases):
+        end_time = phrase["start_time"] + min_duration
+        if i + 1 < len(phrases):
+            end_time = min(end_time, phrases[i + 1]["start_time"])
+        captions.append({
+            "word": phrase["word"],
+            "start_time": phrase["start_time"],
+            "end_time": max(phrase["end_time"], end_time),
+        })
+    return captions
+
+
+# ---------------------------------------------------------------------
+# Caption Cache
+# ---------------------------------------------------------------------
+
+def trim_caption(rgb, alpha):
+    """
+    Cuts a caption (uint8 rgb, uint8 alpha) to the bounding box of its
+    visible pixels. Returns (left, top, rgb, alpha); outside the box the
+    caption is transparent and black.
+    """
+    rows = np.flatnonzero(alpha.any(axis=1))
+    columns = np.flatnonzero(alpha.any(axis=0))
+    if rows.size == 0:
+        return 0, 0, rgb[:0, :0], alpha[:0, :0]
+    top, bottom = rows[0], rows[-1] + 1
+    left, right = columns[0], columns[-1] + 1
+    # Copies, so the full-size frame can be freed
+    return int(left), int(top), rgb[top:bottom, left:right].copy(), alpha[top:bottom, left:right].copy()
+
+
+class CaptionCache:
+    """
+    Bounded LRU cache of rendered captions keyed by word and style, with an
+    optional on-disk tier. Entries are stored compactly: uint8 RGB + uint8
+    alpha, trimmed to the bounding box of the text and its stroke, and
+    expanded to a full-size frame and float mask on the way out.
+
+    A full 1920x200 caption is 1.5 MB as RGBA; trimmed, a phrase of
+    `caption_grouping` (at most 960 px wide) is about 0.5 MB, and a typical
+    one 0.25 MB, so the default 128 entries stay within roughly 32-64 MB
+    per process instead of 196 MB.
+
+    hits/disk_hits/misses count lookups served from memory, from disk and
+    by rasterizing, so the savings can be inspected with `stats()`.
+    """
+
+    def __init__(self, max_entries=128, disk_dir=None):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(
+        self,
+        word,
+        font_path,
+        font_size=110,
+        size=caption_size,
+        color="white",
+        stroke_color="black",
+        stroke_width=10
+    ):
+        """
+        Same signature and result as `render_caption`, served from the cache
+        when this word has already been rendered with this style.
+        """
+        key = (word, font_path, font_size, tuple(size), color, stroke_color, stroke_width)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+
+        if entry is None:
+            entry = self._load(key)
+            if entry is not None:
+                with self._lock:
+                    self.disk_hits += 1
+            else:
+                rgb, alpha = render_caption(
+                    word, font_path, font_size, size, color, stroke_color, stroke_width
+                )
+                entry = trim_caption(rgb.astype(np.uint8), np.round(alpha * 255).astype(np.uint8))
+                self._store(key, entry)
+                with self._lock:
+                    self.misses += 1
+
+            with self._lock:
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+
+        left, top, rgb, alpha = entry
+        width, height = size
+        frame = np.zeros((height, width, 3), dtype=np.uint8)
+        mask = np.zeros((height, width), dtype=np.float64)
+        frame[top:top + rgb.shape[0], left:left + rgb.shape[1]] = rgb
+        mask[top:top + alpha.shape[0], left:left + alpha.shape[1]] = alpha / 255.0
+        return frame, mask
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.disk_hits = self.misses = 0
+
+    def _disk_path(self, key):
+        digest = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+        return os.path.join(self.disk_dir, f"{digest}.npz")
+
+    def _load(self, key):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path) as data:
+                if "origin" not in data:
+                    # Full-size entry written before entries were trimmed
+                    return trim_caption(data["rgb"], data["alpha"])
+                left, top = data["origin"]
+                return int(left), int(top), data["rgb"], data["alpha"]
+        except (OSError, ValueError, KeyError):
+            return None  # Corrupt or partially written entry, re-render it
+
+    def _store(self, key, entry):
+        if not self.disk_dir:
+            return
+        os.makedirs(self.disk_dir, exist_ok=True)
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            left, top, rgb, alpha = entry
+            # Mostly flat black/white pixels, which compress very well
+            np.savez_compressed(f, origin=np.array([left, top]), rgb=rgb, alpha=alpha)
+        os.replace(tmp_path, path)
+
+
+# Shared by every make_video call in this process, so a batch (or a web UI
+# render worker) renders each distinct caption once. The disk tier keeps
+# captions across runs and is shared by every worker process, which each
+# import this module afresh: REELSAI_CAPTION_CACHE_DIR sets its directory
+# (default assets/cache/captions; empty turns it off).
+caption_cache_dir = os.environ.get("REELSAI_CAPTION_CACHE_DIR", "assets/cache/captions") or None
+caption_cache = CaptionCache(disk_dir=caption_cache_dir)
+
+
+# ---------------------------------------------------------------------
+# Subtitle Track
+# ---------------------------------------------------------------------
+
+class SubtitleTrackClip(VideoClip):
+    """
+    One caption layer for the whole body instead of one TextClip per token.
+
+    The token timeline is kept in sorted NumPy arrays; for each frame the
+    active token is found with a binary search and only that caption is
+    returned, so the per-frame cost does not grow with the script length.
+    `render_caption` maps a word to an (rgb, alpha) pair of `size`.
+    """
+
+    def __init__(self, tokens, duration, render_caption, size=caption_size):
+        tokens = sorted(tokens, key=lambda tok: tok["start_time"])
+        self.words = [tok["word"] for tok in tokens]
+        self.start_times = np.array([tok["start_time"] for tok in tokens], dtype=np.float64)
+        self.end_times = np.array([tok["end_time"] for tok in tokens], dtype=np.float64)
+        self.render_caption = render_caption
+
+        width, height = size
+        self._blank_frame = np.zeros((height, width, 3), dtype=np.uint8)
+        self._blank_mask = np.zeros((height, width), dtype=np.float64)
+        # Frames and masks are requested in order, so remembering the last
+        # rendered caption is enough to render each token only once.
+        self._current_index = None
+        self._current_caption = None
+
+        VideoClip.__init__(self, frame_function=self._frame, duration=duration)
+        self.mask = VideoClip(frame_function=self._mask_frame, is_mask=True, duration=duration)
+
+    def active_index(self, t):
+        """
+        Returns the index of the token shown at time `t`, or None. A token is
+        shown on [start_time, end_time), like a clip's start and end.
+        """
+        index = int(np.searchsorted(self.start_times, t, side="right")) - 1
+        if index < 0 or t >= self.end_times[index]:
+            return None
+        return index
+
+    def caption(self, index):
+        """
+        The (rgb, alpha) caption of token `index`.
+        """
+        if index != self._current_index:
+            self._current_caption = self.render_caption(self.words[index])
+            self._current_index = index
+        return self._current_caption
+
+    def _caption(self, t):
+        index = self.active_index(t)
+        return None if index is None else self.caption(index)
+
+    def _frame(self, t):
+        caption = self._caption(t)
+        return self._blank_frame if caption is None else caption[0]
+
+    def _mask_frame(self, t):
+        caption = self._caption(t)
+        return self._blank_mask if caption is None else caption[1]
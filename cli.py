@@ -0,0 +1,145 @@
+import argparse
+import multiprocessing
+import sys
+import time
+from multiprocessing.connection import wait
+
+import jobqueue
+from manifest import collect_outputs, output_grace
+from scripts import print_script_error, read_scripts, script_formats
+from video import output_dir, render_engines
+
+# ---------------------------------------------------------------------
+# Headless Command Line
+# ---------------------------------------------------------------------
+#
+#   python3 cli.py submit stories.txt --voice af_heart --speed 1.0
+#   python3 cli.py submit stories.jsonl stories.csv   # per-script voice/speed
+#   python3 cli.py worker --processes 4
+#   python3 cli.py status
+#   python3 cli.py gc --dry-run
+#
+# Worker processes retire after REELSAI_WORKER_MAX_JOBS jobs or when they
+# cross a memory ceiling (see resources.py); `worker` starts a fresh
+# process in their place. A worker that crashes (killed, out of memory)
+# is replaced too while the queue still has work; its job is picked up
+# again once its heartbeat goes stale.
+
+retired_exit_code = 3
+crash_restart_delay = 2.0  # Seconds before replacing a crashed worker, so a crash loop does not spin
+
+
+def work_remaining(queue):
+    counts = jobqueue.state_counts(queue)
+    return counts["queued"] + counts["tts"] + counts["rendering"] > 0
+
+
+def submit(args):
+    ids = []
+    for script_path in args.scripts:
+        skipped = []
+
+        def on_error(line, message, script_path=script_path):
+            skipped.append(line)
+            print_script_error(line, message, script_path)
+
+        # Scripts are queued while the file is read, so workers can start right away
+        queued = jobqueue.submit_jobs(
+            read_scripts(script_path, args.format, on_error), args.voice, args.speed, args.engine, args.queue
+        )
+        if skipped:
+            print(f"Skipped {len(skipped)} malformed script(s) in {script_path}")
+        if not queued:
+            print(f"No valid video scripts found in {script_path}")
+            continue
+        ids += queued
+        print(f"Queued {len(queued)} video(s) from {script_path}")
+    if ids:
+        print(f"Job ids {ids[0]}-{ids[-1]}")
+
+
+def run_worker_process(queue, once, force):
+    if jobqueue.run_worker(queue, once=once, force=force):
+        sys.exit(retired_exit_code)
+
+
+def start_worker(args):
+    process = multiprocessing.Process(target=run_worker_process, args=(args.queue, args.once, args.force))
+    process.start()
+    return process
+
+
+def worker(args):
+    running = [start_worker(args) for _ in range(max(args.processes, 1))]
+    while running:
+        ready = wait([process.sentinel for process in running])
+        for process in [process for process in running if process.sentinel in ready]:
+            process.join()
+            running.remove(process)
+            if process.exitcode == retired_exit_code:
+                print(f"Worker {process.pid} retired, starting a fresh one")
+                running.append(start_worker(args))
+            elif process.exitcode != 0:
+                print(f"Worker {process.pid} crashed (exit code {process.exitcode})")
+                if work_remaining(args.queue):
+                    time.sleep(crash_restart_delay)
+                    print("Starting a replacement worker")
+                    running.append(start_worker(args))
+
+
+def status(args):
+    jobs = jobqueue.job_status(path=args.queue)
+    if args.verbose:
+        for job in jobs:
+            detail = job["output"] or job["error"] or ""
+            print(f"{job['id']:>5}  {job['state']:<9}  {job['title'][:40]:<40}  {detail}")
+    counts = jobqueue.state_counts(args.queue)
+    print("  ".join(f"{state}: {n}" for state, n in counts.items()))
+    if args.tts:
+        from tts import tts_client
+        for url, healthy in tts_client.check_health().items():
+            print(f"TTS {url}: {'healthy' if healthy else 'unreachable'}")
+
+
+def gc(args):
+    removed = collect_outputs(args.outputs, min_age=args.min_age, dry_run=args.dry_run)
+    for path in removed:
+        print(path)
+    verb = "Would delete" if args.dry_run else "Deleted"
+    print(f"{verb} {len(removed)} video(s) no render manifest refers to")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render ReelsAI videos without the web UI.")
+    parser.add_argument("--queue", default=jobqueue.queue_path, help="SQLite job queue file")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    submit_parser = commands.add_parser("submit", help="Queue every script in one or more script files")
+    submit_parser.add_argument("scripts", nargs="+")
+    submit_parser.add_argument("--format", choices=script_formats, help="Script format (default: from the file extension)")
+    submit_parser.add_argument("--voice", default="af_heart", help="Voice for scripts that do not set one")
+    submit_parser.add_argument("--speed", type=float, default=1.0, help="Speed for scripts that do not set one")
+    submit_parser.add_argument("--engine", choices=render_engines, default="moviepy")
+    submit_parser.set_defaults(func=submit)
+
+    worker_parser = commands.add_parser("worker", help="Render queued jobs")
+    worker_parser.add_argument("--processes", type=int, default=1)
+    worker_parser.add_argument("--once", action="store_true", help="Exit when the queue is empty")
+    worker_parser.add_argument("--force", action="store_true",
+                               help="Render even when an identical video was rendered before")
+    worker_parser.set_defaults(func=worker)
+
+    status_parser = commands.add_parser("status", help="Show job counts per state")
+    status_parser.add_argument("-v", "--verbose", action="store_true", help="List every job")
+    status_parser.add_argument("--tts", action="store_true", help="Also health-check the Kokoro endpoints")
+    status_parser.set_defaults(func=status)
+
+    gc_parser = commands.add_parser("gc", help="Delete output videos no render manifest refers to")
+    gc_parser.add_argument("--outputs", default=output_dir, help="Output folder")
+    gc_parser.add_argument("--min-age", type=float, default=output_grace,
+                           help="Keep files modified in the last N seconds (renders in progress)")
+    gc_parser.add_argument("--dry-run", action="store_true", help="Only list the videos")
+    gc_parser.set_defaults(func=gc)
+
+    args = parser.parse_args()
+    args.func(args)
@@ -0,0 +1,147 @@
+import numpy as np
+from PIL import Image
+
+from moviepy.video.VideoClip import VideoClip
+
+# ---------------------------------------------------------------------
+# Fixed-Layout Compositor
+# ---------------------------------------------------------------------
+#
+# Every reel has the same three layers: the cropped background, the cover
+# centred for the title, and one caption band. CompositeVideoClip blends
+# each layer through full-frame Pillow canvases on every frame; here each
+# overlay is premultiplied once (when the cover is loaded or the caption
+# changes), trimmed to the bounding box of its visible pixels, and blended
+# in place into a copy of the decoded background frame.
+#
+# The blend is Pillow's alpha_composite over an opaque background in
+# integer form, so frames are identical to the CompositeVideoClip path:
+#
+#   out = div255(src * alpha + dst * (255 - alpha))
+#
+# with src * alpha precomputed; every intermediate fits in uint16.
+
+
+def position_offset(layer_size, frame_size, position):
+    """
+    Top-left corner of a layer, the way MoviePy places a clip: a number
+    or "center" per axis, truncated to whole pixels.
+    """
+    offset = []
+    for axis, value in enumerate(position):
+        if value == "center":
+            value = (frame_size[axis] - layer_size[axis]) / 2
+        offset.append(int(value))
+    return offset
+
+
+def premultiply(rgb, alpha, position, frame_size):
+    """
+    Prepares an overlay for `blend_layer`: `rgb` (HxWx3 uint8) with its
+    `alpha` (HxW uint8) placed at `position` on a frame of `frame_size`.
+    Returns (x0, y0, x1, y1, src * alpha, 255 - alpha), cut to the visible
+    pixels that fall inside the frame, or None if nothing is visible.
+    """
+    height, width = alpha.shape
+    x, y = position_offset((width, height), frame_size, position)
+
+    # Part of the layer inside the frame
+    x0, y0 = max(x, 0), max(y, 0)
+    x1, y1 = min(x + width, frame_size[0]), min(y + height, frame_size[1])
+    if x0 >= x1 or y0 >= y1:
+        return None
+    alpha = alpha[y0 - y:y1 - y, x0 - x:x1 - x]
+    rgb = rgb[y0 - y:y1 - y, x0 - x:x1 - x]
+
+    # Bounding box of the pixels that are not fully transparent
+    rows = np.flatnonzero(alpha.any(axis=1))
+    columns = np.flatnonzero(alpha.any(axis=0))
+    if rows.size == 0:
+        return None
+    top, bottom = rows[0], rows[-1] + 1
+    left, right = columns[0], columns[-1] + 1
+    alpha = alpha[top:bottom, left:right, np.newaxis].astype(np.uint16)
+    rgb = rgb[top:bottom, left:right]
+
+    return (
+        x0 + left, y0 + top, x0 + right, y0 + bottom,
+        rgb * alpha,   # uint16, at most 255 * 255
+        255 - alpha,
+    )
+
+
+def blend_layer(frame, layer):
+    """
+    Blends a `premultiply` layer into `frame` (HxWx3 uint8) in place.
+    """
+    x0, y0, x1, y1, premultiplied, inverse_alpha = layer
+    region = frame[y0:y1, x0:x1]
+    blended = region * inverse_alpha  # uint16
+    blended += premultiplied
+    # Rounded division by 255, exactly as Pillow does it
+    blended += 128
+    blended += blended >> 8
+    blended >>= 8
+    region[...] = blended
+
+
+def load_overlay(path):
+    """
+    (rgb, alpha) uint8 arrays of an image file; opaque if it has no alpha.
+    """
+    with Image.open(path) as image:
+        rgba = np.asarray(image.convert("RGBA"))
+    return rgba[:, :, :3], rgba[:, :, 3]
+
+
+class ReelCompositeClip(VideoClip):
+    """
+    The background clip with the cover shown until `title_end_time` and the
+    captions of a `SubtitleTrackClip` on top, rendered with `blend_layer`.
+    Frames match CompositeVideoClip([background, cover, captions]) exactly.
+    """
+
+    def __init__(
+        self,
+        background,
+        cover_path,
+        title_end_time,
+        subtitle_track,
+        cover_position=("center", "center"),
+        caption_position=("center", 1100)
+    ):
+        self.background = background
+        self.title_end_time = title_end_time
+        self.subtitle_track = subtitle_track
+        self.caption_position = caption_position
+        frame_size = tuple(background.size)
+        self.cover_layer = premultiply(*load_overlay(cover_path), cover_position, frame_size)
+
+        # Frames are requested in order, so only the current caption is kept
+        self._caption_index = None
+        self._caption_layer = None
+
+        VideoClip.__init__(self, frame_function=self._frame, duration=background.duration)
+        self.size = frame_size
+
+    def _caption(self, t):
+        index = self.subtitle_track.active_index(t)
+        if index is None:
+            return None
+        if index != self._caption_index:
+            rgb, alpha = self.subtitle_track.caption(index)
+            # The same float -> uint8 conversion MoviePy applies to a mask frame
+            alpha = (alpha * 255).astype(np.uint8)
+            self._caption_layer = premultiply(rgb, alpha, self.caption_position, self.size)
+            self._caption_index = index
+        return self._caption_layer
+
+    def _frame(self, t):
+        # The reader returns its own (read-only, reused) buffer: one copy per frame
+        frame = np.array(self.background.get_frame(t), dtype=np.uint8)
+        if t < self.title_end_time and self.cover_layer is not None:
+            blend_layer(frame, self.cover_layer)
+        caption = self._caption(t)
+        if caption is not None:
+            blend_layer(frame, caption)
+        return frame
@@ -0,0 +1,456 @@
+import os
+import struct
+import subprocess
+import threading
+
+from moviepy.config import FFMPEG_BINARY
+from PIL import ImageFont
+
+from renditions import audio_codec_args, container_args, video_codec_args
+
+# ---------------------------------------------------------------------
+# ASS Subtitle Script
+# ---------------------------------------------------------------------
+
+def ass_timestamp(seconds):
+    """
+    Formats a time in seconds as an ASS timestamp (H:MM:SS.cc).
+    """
+    centiseconds = int(round(max(seconds, 0) * 100))
+    hours, centiseconds = divmod(centiseconds, 360000)
+    minutes, centiseconds = divmod(centiseconds, 6000)
+    secs, centiseconds = divmod(centiseconds, 100)
+    return f"{hours}:{minutes:02d}:{secs:02d}.{centiseconds:02d}"
+
+
+def escape_ass_text(text):
+    """
+    Escapes characters that libass would otherwise treat as override tags
+    or line breaks.
+    """
+    text = text.replace("\\", "\\\\").replace("{", "\\{").replace("}", "\\}")
+    return " ".join(text.split())
+
+
+def font_tables(data):
+    """
+    {tag: offset} of the tables in TrueType/OpenType font `data`.
+    """
+    count = struct.unpack(">H", data[4:6])[0]
+    tables = {}
+    for i in range(count):
+        tag, _checksum, offset, _length = struct.unpack(">4sIII", data[12 + 16 * i:28 + 16 * i])
+        tables[tag] = offset
+    return tables
+
+
+def ass_font_size(font_path, font_size):
+    """
+    The ASS Fontsize that draws glyphs as large as PIL does at `font_size`.
+
+    PIL sizes fonts by em. libass makes Fontsize the height from the OS/2
+    usWinAscent to usWinDescent (the hhea ascender/descender only when the
+    OS/2 values are zero), so the em is scaled by that height over
+    unitsPerEm. For Open Sans Bold at 110 px that is 158.57, not the
+    151 from PIL's (hhea) metrics, which drew captions 5% smaller.
+    """
+    with open(font_path, "rb") as f:
+        data = f.read()
+    tables = font_tables(data)
+    units_per_em = struct.unpack(">H", data[tables[b"head"] + 18:tables[b"head"] + 20])[0]
+    height = 0
+    if b"OS/2" in tables:
+        win_ascent, win_descent = struct.unpack(">HH", data[tables[b"OS/2"] + 74:tables[b"OS/2"] + 78])
+        height = win_ascent + win_descent
+    if not height:
+        ascender, descender = struct.unpack(">hh", data[tables[b"hhea"] + 4:tables[b"hhea"] + 8])
+        height = ascender - descender
+    return round(font_size * height / units_per_em, 2)
+
+
+def write_ass_subtitles(
+    tokens,
+    output_path,
+    font_path,
+    font_size=110,
+    stroke_width=10,
+    caption_y=1100,
+    caption_height=200,
+    width=1080,
+    height=1920
+):
+    """
+    Writes the body word timeline as an ASS script that reproduces the
+    MoviePy captions: white bold text with a black stroke, centred in a
+    `caption_height` band whose top edge sits at `caption_y`.
+
+    PIL and libass size fonts differently; see `ass_font_size`. MoviePy's
+    TextClip draws stroked text `stroke_width` pixels left of centre, so the
+    ASS captions are moved by the same amount.
+    """
+    family, _style = ImageFont.truetype(font_path, font_size).getname()
+
+    center_x = width // 2 - stroke_width
+    center_y = caption_y + caption_height // 2
+
+    lines = [
+        "[Script Info]",
+        "ScriptType: v4.00+",
+        f"PlayResX: {width}",
+        f"PlayResY: {height}",
+        "WrapStyle: 2",
+        "ScaledBorderAndShadow: yes",
+        "",
+        "[V4+ Styles]",
+        "Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, "
+        "BackColour, Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, "
+        "BorderStyle, Outline, Shadow, Alignment, MarginL, MarginR, MarginV, Encoding",
+        f"Style: Caption,{family},{ass_font_size(font_path, font_size)},&H00FFFFFF,&H00FFFFFF,&H00000000,"
+        f"&H00000000,-1,0,0,0,100,100,0,0,1,{stroke_width},0,5,0,0,0,1",
+        "",
+        "[Events]",
+        "Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text",
+    ]
+
+    for token in tokens:
+        start = ass_timestamp(token["start_time"])
+        end = ass_timestamp(token["end_time"])
+        text = escape_ass_text(token["word"])
+        lines.append(
+            f"Dialogue: 0,{start},{end},Caption,,0,0,0,,"
+            f"{{\\an5\\pos({center_x},{center_y})}}{text}"
+        )
+
+    with open(output_path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+
+    return output_path
+
+
+# ---------------------------------------------------------------------
+# Filter Graph & Render
+# ---------------------------------------------------------------------
+
+layout_size = (1080, 1920)  # Size the cover and caption positions are designed for
+
+def escape_filter_path(path):
+    """
+    Escapes a file path for use as an option value inside an ffmpeg
+    filter graph (backslashes, colons and quotes are special there).
+    """
+    path = path.replace("\\", "/")
+    return path.replace(":", "\\:").replace("'", "\\'")
+
+
+def audio_input(audio_path, audio_data=None):
+    """
+    ffmpeg input arguments for the narration: a file, or WAV bytes on stdin.
+    """
+    if audio_data is not None:
+        return ["-f", "wav", "-i", "pipe:0"]
+    return ["-i", audio_path]
+
+
+def build_filter_graph(title_end_time, subtitles_path, fonts_dir, width=1080, height=1920, fps=24):
+    """
+    Builds the filter graph for the reel: scale the background to the
+    output height, centre-crop to the output size, overlay the cover for
+    [0, title_end_time] and burn in the captions.
+
+    The cover and the captions are laid out for `layout_size`; a smaller
+    output scales the cover down and libass scales the captions, so the
+    whole reel can be composited at e.g. preview size.
+    """
+    chains = [f"[0:v]scale=-2:{height},crop={width}:{height},fps={fps},setsar=1[bg]"]
+    cover = "[1:v]"
+    if width != layout_size[0]:
+        chains.append(f"[1:v]scale=trunc(iw*{width / layout_size[0]:.6f}/2)*2:-2[cover]")
+        cover = "[cover]"
+    return ";".join(chains + [
+        f"[bg]{cover}overlay=x=(W-w)/2:y=(H-h)/2:"
+        f"enable='between(t,0,{title_end_time:.3f})':eof_action=pass[titled]",
+        f"[titled]ass=filename='{escape_filter_path(subtitles_path)}':"
+        f"fontsdir='{escape_filter_path(fonts_dir)}'[v]",
+    ])
+
+
+def render_with_ffmpeg(
+    background_path,
+    audio_path,
+    cover_path,
+    body_tokens,
+    title_end_time,
+    video_duration,
+    output_path,
+    font_path,
+    subtitles_path="assets/cache/captions.ass",
+    background_start=0.0,
+    width=1080,
+    height=1920,
+    fps=24,
+    preset="medium",
+    audio_data=None,
+    progress=None,
+    renditions=None
+):
+    """
+    Renders the same reel as the MoviePy path with a single ffmpeg call.
+    Frames never pass through Python: scaling, cropping, the cover overlay,
+    caption burn-in and encoding all happen inside the ffmpeg filter graph.
+    The background is read from `background_start` (input seek, so a
+    keyframe-aligned start costs no decoding). The narration is read from
+    `audio_path`, or piped in from memory when `audio_data` (WAV) is given.
+
+    `renditions`, a list of (profile, path) pairs (see renditions.py),
+    replaces the single `output_path`: the reel is composited once at
+    `width`x`height` and `fps` and split into one encode per rendition.
+
+    `width`x`height` may be smaller than `layout_size` (same aspect ratio)
+    to composite a reduced-size reel directly, e.g. for previews.
+
+    `progress(fraction)` is called as frames are encoded; if it raises,
+    ffmpeg is stopped and the exception propagates.
+    """
+    # Captions stay in layout coordinates; libass scales them to the frame size
+    write_ass_subtitles(body_tokens, subtitles_path, font_path, width=layout_size[0], height=layout_size[1])
+
+    filter_graph = build_filter_graph(
+        title_end_time,
+        subtitles_path,
+        os.path.dirname(font_path) or ".",
+        width=width,
+        height=height,
+        fps=fps
+    )
+
+    if renditions is None:
+        outputs = [
+            "-map", "[v]", "-map", "2:a",
+            "-c:v", "libx264", "-preset", preset, "-pix_fmt", "yuv420p",
+            "-c:a", "aac",
+            "-t", f"{video_duration:.3f}",
+            output_path,
+        ]
+    else:
+        filter_graph += ";" + rendition_graph("[v]", [profile for profile, _path in renditions], width, height, fps)
+        outputs = rendition_outputs(renditions, "2:a", video_duration)
+        output_path = ", ".join(path for _profile, path in renditions)  # For error messages
+        fps = renditions[0][0]["fps"]  # -progress counts the frames of the first output
+
+    cmd = [
+        FFMPEG_BINARY, "-y", "-hide_banner", "-loglevel", "error",
+        "-ss", f"{background_start:.3f}", "-t", f"{video_duration:.3f}", "-i", background_path,
+        "-loop", "1", "-t", f"{title_end_time:.3f}", "-i", cover_path,
+        *audio_input(audio_path, audio_data),
+        "-filter_complex", filter_graph,
+        *outputs,
+    ]
+
+    if progress is None:
+        result = subprocess.run(cmd, input=audio_data, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        returncode, stderr = result.returncode, result.stderr
+    else:
+        total_frames = max(1, int(video_duration * fps))
+        cmd[1:1] = ["-progress", "pipe:1", "-nostats"]
+        returncode, stderr = run_with_progress(
+            cmd, audio_data, lambda frames: progress(min(1.0, frames / total_frames))
+        )
+    if returncode != 0:
+        raise RuntimeError(
+            f"ffmpeg failed to render {output_path}:\n"
+            + stderr.decode("utf-8", errors="replace")
+        )
+
+    return output_path if renditions is None else [path for _profile, path in renditions]
+
+
+def run_with_progress(cmd, input_data, on_frame):
+    """
+    Runs an ffmpeg command that writes `-progress pipe:1` reports and calls
+    `on_frame(frames encoded)` for each report. stdin (`input_data`) and
+    stderr are handled on helper threads so no pipe can fill up.
+    If `on_frame` raises, ffmpeg is killed and the exception propagates.
+    Returns (return code, stderr bytes).
+    """
+    process = subprocess.Popen(
+        cmd,
+        stdin=subprocess.DEVNULL if input_data is None else subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE
+    )
+    stderr_chunks = []
+
+    def feed_stdin():
+        try:
+            process.stdin.write(input_data)
+        except (BrokenPipeError, OSError):
+            pass  # ffmpeg exited early; its stderr says why
+        finally:
+            process.stdin.close()
+
+    helpers = [threading.Thread(target=lambda: stderr_chunks.append(process.stderr.read()), daemon=True)]
+    if input_data is not None:
+        helpers.append(threading.Thread(target=feed_stdin, daemon=True))
+    for helper in helpers:
+        helper.start()
+
+    try:
+        for line in process.stdout:
+            if line.startswith(b"frame="):
+                on_frame(int(line[6:]))
+    except BaseException:
+        process.kill()
+        process.wait()
+        raise
+
+    process.wait()
+    for helper in helpers:
+        helper.join()
+    return process.returncode, b"".join(stderr_chunks)
+
+
+# ---------------------------------------------------------------------
+# Multi-Rendition Output
+# ---------------------------------------------------------------------
+
+def rendition_graph(source, profiles, width, height, fps):
+    """
+    Filter graph that splits the composited stream `source` (`width`x`height`
+    at `fps`) into one stream per profile, labelled [r0], [r1], ... Each
+    copy is scaled and centre-cropped to its profile's size and resampled
+    to its frame rate; copies that already match pass through untouched.
+    """
+    if len(profiles) == 1:
+        inputs = [source]
+        chains = []
+    else:
+        inputs = [f"[s{i}]" for i in range(len(profiles))]
+        chains = [f"{source}split={len(profiles)}{''.join(inputs)}"]
+
+    for i, (label, profile) in enumerate(zip(inputs, profiles)):
+        filters = []
+        w, h = profile["width"], profile["height"]
+        if (w, h) != (width, height):
+            filters.append(f"scale={w}:{h}:force_original_aspect_ratio=increase:flags=lanczos,crop={w}:{h},setsar=1")
+        if profile["fps"] != fps:
+            filters.append(f"fps={profile['fps']}")
+        chains.append(f"{label}{','.join(filters) or 'null'}[r{i}]")
+    return ";".join(chains)
+
+
+def rendition_outputs(renditions, audio_stream, video_duration):
+    """
+    ffmpeg output arguments for every (profile, path) in `renditions`, fed
+    from the [r0], [r1], ... streams of `rendition_graph` and the audio
+    stream `audio_stream` (e.g. "1:a"; None for video-only output).
+    """
+    args = []
+    for i, (profile, path) in enumerate(renditions):
+        args += ["-map", f"[r{i}]"]
+        if audio_stream is not None:
+            args += ["-map", audio_stream, *audio_codec_args(profile)]
+        args += [*video_codec_args(profile), *container_args(profile), "-t", f"{video_duration:.3f}", path]
+    return args
+
+
+def encode_renditions(
+    frames,
+    width,
+    height,
+    fps,
+    renditions,
+    video_duration,
+    audio_path=None,
+    progress=None,
+    total_frames=None
+):
+    """
+    Encodes composited frames (an iterable of `height`x`width`x3 uint8 RGB
+    arrays at `fps`) into every (profile, path) in `renditions` with one
+    ffmpeg process: each frame is piped in once and split, scaled and
+    encoded per rendition inside ffmpeg. The narration at `audio_path`, if
+    given, is muxed into every rendition.
+
+    `progress(fraction)` is called in steps of 1% of `total_frames`; if it
+    raises, ffmpeg is stopped and the exception propagates.
+    Returns the rendition paths.
+    """
+    profiles = [profile for profile, _path in renditions]
+    cmd = [
+        FFMPEG_BINARY, "-y", "-hide_banner", "-loglevel", "error",
+        "-f", "rawvideo", "-pix_fmt", "rgb24", "-s", f"{width}x{height}", "-r", f"{fps}", "-i", "pipe:0",
+    ]
+    if audio_path is not None:
+        cmd += ["-i", audio_path]
+    cmd += [
+        "-filter_complex", rendition_graph("[0:v]", profiles, width, height, fps),
+        *rendition_outputs(renditions, "1:a" if audio_path is not None else None, video_duration),
+    ]
+
+    process = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    stderr_chunks = []
+    stderr_reader = threading.Thread(target=lambda: stderr_chunks.append(process.stderr.read()), daemon=True)
+    stderr_reader.start()
+
+    step = max(1, (total_frames or 0) // 100)
+    try:
+        for index, frame in enumerate(frames, 1):
+            process.stdin.write(frame.tobytes())
+            if progress is not None and total_frames and (index % step == 0 or index == total_frames):
+                progress(min(1.0, index / total_frames))
+        process.stdin.close()
+    except BrokenPipeError:
+        pass  # ffmpeg exited early; its stderr says why
+    except BaseException:
+        process.kill()
+        process.wait()
+        raise
+
+    process.wait()
+    stderr_reader.join()
+    if process.returncode != 0:
+        raise RuntimeError(
+            f"ffmpeg failed to render {', '.join(path for _profile, path in renditions)}:\n"
+            + b"".join(stderr_chunks).decode("utf-8", errors="replace")
+        )
+    return [path for _profile, path in renditions]
+
+
+# ---------------------------------------------------------------------
+# Segment Concatenation
+# ---------------------------------------------------------------------
+
+def concat_segments(segment_paths, audio_path, output_path, video_duration, audio_data=None, profile=None):
+    """
+    Joins video-only segments with the concat demuxer (stream copy, no
+    re-encode) and muxes the narration as AAC in the same pass. The
+    narration comes from `audio_path` or, as WAV bytes, from `audio_data`.
+    With an output `profile` (see renditions.py) the narration is encoded
+    and the file is written as that profile's container requires.
+    """
+    list_path = os.path.join(os.path.dirname(segment_paths[0]), "segments.txt")
+    with open(list_path, "w", encoding="utf-8") as f:
+        for path in segment_paths:
+            escaped = os.path.abspath(path).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+
+    cmd = [
+        FFMPEG_BINARY, "-y", "-hide_banner", "-loglevel", "error",
+        "-f", "concat", "-safe", "0", "-i", list_path,
+        *audio_input(audio_path, audio_data),
+        "-map", "0:v", "-map", "1:a",
+        "-c:v", "copy",
+        *(["-c:a", "aac", "-movflags", "+faststart"] if profile is None
+          else [*audio_codec_args(profile), *container_args(profile)]),
+        "-t", f"{video_duration:.3f}",
+        output_path,
+    ]
+
+    result = subprocess.run(cmd, input=audio_data, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        raise RuntimeError(
+            f"ffmpeg failed to join segments into {output_path}:\n"
+            + result.stderr.decode("utf-8", errors="replace")
+        )
+
+    return output_path
@@ -1,25 +1,96 @@
+import os
+import threading
+
 from PIL import Image, ImageDraw, ImageFont
 
-def wrap_text_by_pixel(draw, text, font, max_width):
+# ---------------------------------------------------------------------
+# Cached Cover Assets
+# ---------------------------------------------------------------------
+#
+# Every cover uses the same template, font and width, so the resized
+# template, the FreeType font objects and the width of every word drawn so
+# far are kept for the life of the process. The word widths are bounded
+# (`max_cached_words` per font) so a long-running worker does not grow with
+# its vocabulary.
+
+cover_template_path = "assets/default/template.png"
+cover_font_path = "assets/default/OpenSans-Bold.ttf"
+
+_asset_lock = threading.Lock()
+_template_cache = {}  # (path, mtime_ns, width) -> resized RGB template
+_font_cache = {}      # (path, size) -> ImageFont
+_width_cache = {}     # (path, size) -> {word: advance width}
+max_cached_words = 20000
+
+
+def load_template(path, width):
+    """
+    Returns the image at `path` scaled to `width` (LANCZOS), resized once per
+    file version and width. Callers must not modify the returned image.
+    """
+    key = (path, os.stat(path).st_mtime_ns, width)
+    with _asset_lock:
+        template = _template_cache.get(key)
+    if template is None:
+        template = Image.open(path).convert("RGB")
+        orig_w, orig_h = template.size
+        template = template.resize((width, int(orig_h * width / orig_w)), Image.LANCZOS)
+        with _asset_lock:
+            for stale in [k for k in _template_cache if k[0] == path and k[2] == width]:
+                del _template_cache[stale]
+            _template_cache[key] = template
+    return template
+
+
+def load_font(path, size):
+    key = (path, size)
+    with _asset_lock:
+        font = _font_cache.get(key)
+        if font is None:
+            font = _font_cache[key] = ImageFont.truetype(path, size)
+            _width_cache[key] = {}
+    return font
+
+
+def word_width(font, word):
+    """
+    Advance width of `word` in `font`, measured once per font and word.
+    """
+    widths = _width_cache.get((font.path, font.size))
+    if widths is None:
+        return font.getlength(word)
+    width = widths.get(word)
+    if width is None:
+        if len(widths) >= max_cached_words:
+            widths.clear()  # Cheaper than LRU bookkeeping on every lookup; refills quickly
+        width = widths[word] = font.getlength(word)
+    return width
+
+
+def wrap_text_by_pixel(text, font, max_width):
     """
     Splits `text` into multiple lines so that no line exceeds `max_width` in pixels.
+    Line widths are kept as running sums of cached word widths, so each word
+    is measured once instead of re-measuring the whole line for every word.
     Returns a list of lines.
     """
-    words = text.split()
+    space_width = word_width(font, " ")
     lines = []
     current_line = []
+    current_width = 0.0
 
-    for word in words:
-        candidate_line = ' '.join(current_line + [word])
-        left, top, right, bottom = draw.textbbox((0, 0), candidate_line, font=font)
-        candidate_width = right - left
+    for word in text.split():
+        width = word_width(font, word)
+        candidate_width = current_width + space_width + width if current_line else width
 
         if candidate_width <= max_width:
             current_line.append(word)
+            current_width = candidate_width
         else:
             if current_line:
                 lines.append(' '.join(current_line))
             current_line = [word]
+            current_width = width
 
     if current_line:
         lines.append(' '.join(current_line))
@@ -27,12 +98,16 @@ def wrap_text_by_pixel(draw, text, font, max_width):
     return lines
 
 
+# ---------------------------------------------------------------------
+# Cover Rendering
+# ---------------------------------------------------------------------
+
 def create_cover_with_top_image(
     title_text: str,
     top_image_path: str = "test.png",
     output_path: str = "output.png",
     font_path: str = "OpenSans-Bold.ttf",
-    # The width used for layout (text wrapping, top image scaling):
+    # The width the layout below is specified at (text wrapping, top image scaling):
     layout_width: int = 1194,
     font_size: int = 40,
     text_color=(0, 0, 0),
@@ -40,119 +115,108 @@ def create_cover_with_top_image(
     top_margin: int = 5,
     bottom_margin: int = 50,
     corner_radius: int = 30,
-    # The final width after we finish all processing (None means no extra downscale).
+    # The final width of the cover (None means layout_width).
     final_resize_width: int = None
 ):
     """
     Creates an image with:
-      1) A top image (resized to layout_width),
+      1) A top image (resized to the output width),
       2) A white background below it with wrapped text,
-      3) Rounded corners,
-      4) (Optional) Final downscale to `final_resize_width`.
+      3) Rounded corners.
+
+    The layout is specified at `layout_width` but drawn directly at
+    `final_resize_width`: fonts, margins and radius are scaled instead of
+    downscaling a large render afterwards.
 
     :param title_text:        Text to display beneath the top image.
     :param top_image_path:    Path to the top image (e.g., 'test.png').
-    :param output_path:       Where to save the final image (e.g., 'output.png').
+    :param output_path:       Where to save the final image (e.g., 'output.png'),
+                              or None to only return it.
     :param font_path:         Path to a .ttf font (e.g., 'OpenSans-Bold.ttf').
-    :param layout_width:      The width used during layout (default=1194).
+    :param layout_width:      The width the other sizes refer to (default=1194).
     :param font_size:         Font size for drawing the text.
     :param text_color:        (R, G, B) color for text.
     :param margin_x:          Left margin for the text area.
     :param top_margin:        Space between bottom of top image & start of text.
     :param bottom_margin:     Space below the final line of text.
     :param corner_radius:     Radius for rounded corners (default=30).
-    :param final_resize_width:If set, the resulting image will be proportionally
-                              scaled to this width. Height is scaled accordingly.
-                              If None, no additional downscale.
+    :param final_resize_width:If set and smaller than layout_width, the cover is
+                              rendered at this width. Height is scaled accordingly.
+    :return:                  The RGBA cover as a PIL image.
     """
+    width = layout_width
+    if final_resize_width is not None and final_resize_width < layout_width:
+        width = final_resize_width
+    scale = width / layout_width
+
+    # 1. Top image, resized to the output width (cached)
+    top_img = load_template(top_image_path, width)
+    top_height = top_img.height
+
+    # 2. Fonts (cached): the layout size for wrapping and metrics, and the
+    #    output scale for drawing (Pillow accepts fractional sizes)
+    layout_font = load_font(font_path, font_size)
+    font = load_font(font_path, font_size * scale)
+
+    # 3. Wrap text by pixel width at layout_width. Fractional metrics of the
+    #    scaled font would move the line breaks.
+    wrapped_lines = wrap_text_by_pixel(title_text, layout_font, layout_width - margin_x)
+
+    # 4. Line height and total height, as they would be at layout_width, then scaled
+    layout_line_height = layout_font.getmetrics()[0] + 5
+    line_height = layout_line_height * scale
+    layout_top_height = int(top_height / scale)
+    layout_total_height = (
+        layout_top_height + top_margin + layout_line_height * len(wrapped_lines) + bottom_margin
+    )
+    total_height = int(layout_total_height * scale)
 
-    # 1. Load and resize top image to layout_width
-    top_img = Image.open(top_image_path).convert("RGB")
-    orig_w, orig_h = top_img.size
-    scale_factor = layout_width / orig_w
-    new_height = int(orig_h * scale_factor)
-    top_img = top_img.resize((layout_width, new_height), Image.LANCZOS)
-
-    # 2. Prepare font and measure-draw
-    font = ImageFont.truetype(font_path, font_size)
-    temp_img = Image.new("RGB", (1, 1))
-    measure_draw = ImageDraw.Draw(temp_img)
-
-    # 3. The max text width for each line
-    max_text_width = layout_width - margin_x
-
-    # 4. Wrap text by pixel width
-    wrapped_lines = wrap_text_by_pixel(measure_draw, title_text, font, max_text_width)
-
-    # 5. Determine line height
-    line_height = font.getmetrics()[0] + 5
-
-    # 6. Compute total text block height
-    text_block_height = line_height * len(wrapped_lines)
-
-    # 7. Calculate final layout image height
-    total_height = new_height + top_margin + text_block_height + bottom_margin
-
-    # 8. Create the layout image (white background, the same size we used for layout)
-    final_img = Image.new("RGB", (layout_width, total_height), color="white")
-
-    # 9. Paste top image at the top
+    # 5. White canvas with the top image pasted in
+    final_img = Image.new("RGB", (width, total_height), color="white")
     final_img.paste(top_img, (0, 0))
 
-    # 10. Draw text left-aligned
+    # 6. Draw text left-aligned
     draw = ImageDraw.Draw(final_img)
-    current_y = new_height + top_margin
+    current_y = top_height + top_margin * scale
     for line in wrapped_lines:
-        left, top, right, bottom = measure_draw.textbbox((0, 0), line, font=font)
-        draw.text((margin_x, current_y), line, font=font, fill=text_color)
+        draw.text((margin_x * scale, current_y), line, font=font, fill=text_color)
         current_y += line_height
 
-    # 11. Convert to RGBA so we can apply a rounded corner mask
-    final_img = final_img.convert("RGBA")
-
-    # 12. Create a mask for rounded corners
-    mask = Image.new("L", (layout_width, total_height), 0)
-    mask_draw = ImageDraw.Draw(mask)
-    mask_draw.rounded_rectangle(
-        [(0, 0), (layout_width, total_height)],
-        corner_radius,
+    # 7. Rounded corners as the alpha channel
+    mask = Image.new("L", (width, total_height), 0)
+    ImageDraw.Draw(mask).rounded_rectangle(
+        [(0, 0), (width, total_height)],
+        corner_radius * scale,
         fill=255
     )
-
-    # 13. Apply the mask for rounded corners
     final_img.putalpha(mask)
 
-    # 14. If final_resize_width is specified, downscale proportionally
-    if final_resize_width is not None and final_resize_width < layout_width:
-        # compute new height to maintain aspect ratio
-        new_scale_factor = final_resize_width / layout_width
-        new_resized_height = int(total_height * new_scale_factor)
-        final_img = final_img.resize(
-            (final_resize_width, new_resized_height), Image.LANCZOS
-        )
-
-    # 15. Save final result
-    final_img.save(output_path)
+    # 8. Save (fast PNG compression, the cover is a scratch file)
+    if output_path is not None:
+        final_img.save(output_path, compress_level=1)
+    return final_img
 
 
-def generate_my_post_image(title_text):
+def generate_my_post_image(title_text, output_path="assets/cache/reddit_post_cover.png"):
     """
     A helper function you can call from your main.
-    Example usage with final_resize_width=600 to shrink after layout.
+    Lays out at 1194px and renders the cover 900px wide.
+    Pass a per-job `output_path` when several covers are rendered at once,
+    or None to get the image back without writing a file.
     """
-    create_cover_with_top_image(
+    return create_cover_with_top_image(
         title_text=title_text,
-        top_image_path="assets/default/template.png",
-        output_path="assets/cache/reddit_post_cover.png",
-        font_path="assets/default/OpenSans-Bold.ttf",
-        layout_width=1194,    # Do all text layout at 1194px wide
+        top_image_path=cover_template_path,
+        output_path=output_path,
+        font_path=cover_font_path,
+        layout_width=1194,    # Sizes below are given for a 1194px wide layout
         font_size=70,
         text_color=(0, 0, 0),
         margin_x=20,
         top_margin=5,
         bottom_margin=50,
         corner_radius=30,
-        final_resize_width=900  # for example, final output will be 600px wide
+        final_resize_width=900  # Rendered directly at 900px wide
     )
 
 
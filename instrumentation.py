@@ -0,0 +1,234 @@
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+# ---------------------------------------------------------------------
+# Render Instrumentation
+# ---------------------------------------------------------------------
+#
+# Off by default. Set REELSAI_TRACE to a file path to append JSON lines
+# (spans, events, histograms) for every job, and REELSAI_PROFILE to
+# "cprofile" or "pyinstrument" to also dump one profile per job and process
+# into REELSAI_PROFILE_DIR. The variables are inherited by render service,
+# queue and segment worker processes. When tracing is off every helper below is a
+# no-op after a single flag check.
+
+trace_path = os.environ.get("REELSAI_TRACE") or None
+profiler_name = os.environ.get("REELSAI_PROFILE") or None
+profile_dir = os.environ.get("REELSAI_PROFILE_DIR", "assets/cache/profiles")
+
+_write_lock = threading.Lock()
+_current_job = contextvars.ContextVar("reelsai_job", default=None)
+
+
+def enable_tracing(path, profiler=None, profiles=None):
+    """
+    Turns tracing on for this process (and, through the environment, for
+    worker processes started afterwards).
+    """
+    global trace_path, profiler_name, profile_dir
+    trace_path = path
+    profiler_name = profiler
+    profile_dir = profiles or profile_dir
+    os.environ["REELSAI_TRACE"] = path
+    os.environ["REELSAI_PROFILE_DIR"] = profile_dir
+    if profiler:
+        os.environ["REELSAI_PROFILE"] = profiler
+    else:
+        os.environ.pop("REELSAI_PROFILE", None)
+
+
+def tracing_enabled():
+    return trace_path is not None
+
+
+def emit(record):
+    """
+    Appends one JSON line to the trace file, tagged with job, process and time.
+    """
+    if trace_path is None:
+        return
+    record = {"ts": time.time(), "job": _current_job.get(), "pid": os.getpid(), **record}
+    line = json.dumps(record, default=str) + "\n"
+    with _write_lock:
+        with open(trace_path, "a", encoding="utf-8") as f:
+            f.write(line)
+
+
+def event(name, **fields):
+    if trace_path is not None:
+        emit({"type": "event", "name": name, **fields})
+
+
+class Span:
+    def __init__(self, name, fields):
+        self.name = name
+        self.fields = fields
+        self.start = None
+        self.duration = None
+
+    def set(self, **fields):
+        self.fields.update(fields)
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = time.perf_counter() - self.start
+        record = {"type": "span", "name": self.name, "duration": self.duration, **self.fields}
+        if exc_type is not None:
+            record["error"] = repr(exc)
+        emit(record)
+
+
+class _NullSpan:
+    duration = None
+
+    def set(self, **fields):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_null_span = _NullSpan()
+
+
+def span(name, **fields):
+    """
+    Times a block: `with span("encode", engine=engine) as s: ...; s.set(frames=n)`.
+    """
+    if trace_path is None:
+        return _null_span
+    return Span(name, fields)
+
+
+# ---------------------------------------------------------------------
+# Histograms
+# ---------------------------------------------------------------------
+
+class Histogram:
+    """
+    Millisecond histogram with power-of-two buckets plus exact count, mean
+    and max, cheap enough to update once per frame.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.buckets = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, ms):
+        bucket = 1
+        while bucket < ms:
+            bucket *= 2
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        self.count += 1
+        self.total += ms
+        self.max = max(self.max, ms)
+
+    def emit(self, **fields):
+        if not self.count:
+            return
+        emit({
+            "type": "histogram",
+            "name": self.name,
+            "count": self.count,
+            "mean_ms": self.total / self.count,
+            "max_ms": self.max,
+            "buckets_ms": {f"<={bucket}": n for bucket, n in sorted(self.buckets.items())},
+            **fields,
+        })
+
+
+def timed_frames(clip, histogram):
+    """
+    Makes `clip` record the render time of every frame in `histogram`.
+    Only used when tracing is on, so normal renders keep the bare frame function.
+    """
+    frame_function = clip.frame_function
+
+    def timed_frame_function(t):
+        start = time.perf_counter()
+        frame = frame_function(t)
+        histogram.add((time.perf_counter() - start) * 1000)
+        return frame
+
+    clip.frame_function = timed_frame_function
+    clip.frame_histogram = histogram
+    return clip
+
+
+# ---------------------------------------------------------------------
+# Job Scope & Profiling
+# ---------------------------------------------------------------------
+
+def current_job():
+    return _current_job.get()
+
+
+def _start_profiler():
+    if profiler_name == "pyinstrument":
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            print("pyinstrument is not installed, falling back to cProfile")
+        else:
+            profiler = Profiler()
+            profiler.start()
+            return profiler
+
+    import cProfile
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+
+def _stop_profiler(profiler, job_id):
+    os.makedirs(profile_dir, exist_ok=True)
+    base = os.path.join(profile_dir, f"{job_id}.{os.getpid()}.{threading.get_ident()}")
+    if hasattr(profiler, "output_html"):  # pyinstrument
+        profiler.stop()
+        path = base + ".html"
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(profiler.output_html())
+    else:
+        profiler.disable()
+        path = base + ".prof"
+        profiler.dump_stats(path)
+    event("profile", path=path)
+
+
+@contextmanager
+def job_trace(job_id=None, **fields):
+    """
+    Scopes spans to one job. The outermost job_trace in a process emits a
+    "job" span and, with REELSAI_PROFILE set, dumps a profile of the job.
+    Nested or repeated calls with the job already active do nothing extra.
+    Yields the job id (pass it on to other processes to keep one id per job).
+    """
+    active = _current_job.get()
+    if trace_path is None or (active is not None and job_id in (None, active)):
+        yield job_id or active
+        return
+
+    job_id = job_id or uuid.uuid4().hex[:12]
+    token = _current_job.set(job_id)
+    profiler = _start_profiler() if profiler_name else None
+    try:
+        with span("job", **fields):
+            yield job_id
+    finally:
+        if profiler is not None:
+            _stop_profiler(profiler, job_id)
+        _current_job.reset(token)
@@ -0,0 +1,311 @@
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+from instrumentation import job_trace
+from manifest import record_render
+from resources import ResourceCeilingExceeded, bounded_job, init_worker, should_retire
+from scripts import script_settings
+from video import (
+    fetch_speech,
+    job_workspace,
+    prepare_job,
+    remove_abandoned_job,
+    render_engines,
+    render_inputs,
+    render_job,
+    render_key,
+    reuse_render,
+)
+
+# ---------------------------------------------------------------------
+# Persistent Job Queue (SQLite)
+# ---------------------------------------------------------------------
+
+queue_path = "assets/cache/jobs.sqlite3"
+
+# queued -> tts -> rendering -> done, or failed after max_attempts
+job_states = ("queued", "tts", "rendering", "done", "failed")
+
+heartbeat_interval = 10.0  # Seconds between heartbeats of a running job
+stale_after = 120.0        # A running job without a heartbeat for this long is reclaimed
+max_attempts = 3
+submit_chunk = 100         # Jobs per submit transaction
+
+
+def connect(path=queue_path):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS jobs (
+            id          INTEGER PRIMARY KEY AUTOINCREMENT,
+            title       TEXT NOT NULL,
+            body        TEXT NOT NULL,
+            voice       TEXT NOT NULL,
+            speed       REAL NOT NULL,
+            engine      TEXT NOT NULL DEFAULT 'moviepy',
+            state       TEXT NOT NULL DEFAULT 'queued',
+            output      TEXT,
+            error       TEXT,
+            attempts    INTEGER NOT NULL DEFAULT 0,
+            worker      TEXT,
+            created_at  REAL NOT NULL,
+            updated_at  REAL NOT NULL,
+            heartbeat   REAL,
+            workspace   TEXT
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state)")
+    # Queues created before jobs recorded their workspace
+    columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+    if "workspace" not in columns:
+        try:
+            conn.execute("ALTER TABLE jobs ADD COLUMN workspace TEXT")
+        except sqlite3.OperationalError:
+            pass  # Added by another worker in the meantime
+    return conn
+
+
+def submit_jobs(scripts, voice, speed, engine="moviepy", path=queue_path):
+    """
+    Queues every script in `scripts`: (title, body) pairs or script dicts
+    from scripts.py, whose voice/speed override `voice`/`speed`.
+    Returns the new job ids.
+
+    `scripts` may be a generator over a large file: jobs are committed every
+    `submit_chunk` scripts, so workers start on the first ones while the rest
+    is parsed and the queue is never locked for the whole file. If `scripts`
+    raises, the jobs committed before stay queued.
+    """
+    if engine not in render_engines:
+        raise ValueError(f"Unknown render engine {engine!r}, expected one of {render_engines}")
+
+    conn = connect(path)
+    try:
+        ids = []
+        conn.execute("BEGIN IMMEDIATE")
+        for script in scripts:
+            title, body, job_voice, job_speed = script_settings(script, voice, speed)
+            now = time.time()
+            ids.append(conn.execute(
+                "INSERT INTO jobs (title, body, voice, speed, engine, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (title, body, job_voice, job_speed, engine, now, now)
+            ).lastrowid)
+            if len(ids) % submit_chunk == 0:
+                conn.execute("COMMIT")
+                conn.execute("BEGIN IMMEDIATE")
+        conn.execute("COMMIT")
+        return ids
+    finally:
+        conn.close()
+
+
+def job_status(ids=None, path=queue_path):
+    """
+    Returns jobs (all, or only `ids`) as dicts, oldest first.
+    """
+    conn = connect(path)
+    try:
+        if ids is None:
+            rows = conn.execute("SELECT * FROM jobs ORDER BY id").fetchall()
+        else:
+            ids = list(ids)
+            if not ids:
+                return []
+            placeholders = ",".join("?" * len(ids))
+            rows = conn.execute(
+                f"SELECT * FROM jobs WHERE id IN ({placeholders}) ORDER BY id", ids
+            ).fetchall()
+        return [dict(row) for row in rows]
+    finally:
+        conn.close()
+
+
+def state_counts(path=queue_path):
+    conn = connect(path)
+    try:
+        rows = conn.execute("SELECT state, COUNT(*) AS n FROM jobs GROUP BY state").fetchall()
+        counts = {state: 0 for state in job_states}
+        counts.update({row["state"]: row["n"] for row in rows})
+        return counts
+    finally:
+        conn.close()
+
+
+def claim_job(conn, worker):
+    """
+    Atomically takes the oldest queued job, or a running job whose worker
+    stopped sending heartbeats (crashed), and marks it as in the TTS stage.
+    Returns the job row as a dict, or None when there is nothing to do.
+
+    A crashed job that already had `max_attempts` attempts is marked as
+    failed instead of being claimed again: a job that kills its worker
+    (out of memory, for example) would otherwise be retried forever. The
+    workspace and reserved output files of crashed jobs are removed.
+    """
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        exhausted = conn.execute(
+            "SELECT id, state, attempts, workspace FROM jobs "
+            "WHERE state IN ('tts', 'rendering') AND heartbeat < ? AND attempts >= ?",
+            (now - stale_after, max_attempts)
+        ).fetchall()
+        for stale in exhausted:
+            conn.execute(
+                "UPDATE jobs SET state = 'failed', error = ?, heartbeat = NULL, workspace = NULL, "
+                "updated_at = ? WHERE id = ?",
+                (f"Worker stopped responding during '{stale['state']}' "
+                 f"(attempt {stale['attempts']} of {max_attempts})", now, stale["id"])
+            )
+
+        row = conn.execute(
+            "SELECT * FROM jobs WHERE state = 'queued' "
+            "OR (state IN ('tts', 'rendering') AND heartbeat < ?) "
+            "ORDER BY id LIMIT 1",
+            (now - stale_after,)
+        ).fetchone()
+        if row is not None:
+            conn.execute(
+                "UPDATE jobs SET state = 'tts', worker = ?, attempts = attempts + 1, "
+                "heartbeat = ?, workspace = NULL, updated_at = ? WHERE id = ?",
+                (worker, now, now, row["id"])
+            )
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+
+    # Leftovers of crashed attempts, now that no worker owns them
+    for stale in exhausted:
+        print(f"[{worker}] Job {stale['id']} failed: worker stopped responding {stale['attempts']} time(s)")
+        if stale["workspace"]:
+            remove_abandoned_job(stale["workspace"])
+    if row is None:
+        return None
+    if row["workspace"]:
+        remove_abandoned_job(row["workspace"])
+
+    job = dict(row)
+    job["attempts"] += 1
+    job["workspace"] = None
+    return job
+
+
+def update_job(conn, job_id, **fields):
+    fields["updated_at"] = time.time()
+    assignments = ", ".join(f"{name} = ?" for name in fields)
+    conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+
+class Heartbeat:
+    """
+    Refreshes a running job's heartbeat from a background thread, so other
+    workers only reclaim the job if this process dies.
+    """
+
+    def __init__(self, path, job_id):
+        self.path = path
+        self.job_id = job_id
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        conn = connect(self.path)
+        try:
+            while not self._stop.wait(heartbeat_interval):
+                conn.execute("UPDATE jobs SET heartbeat = ? WHERE id = ?", (time.time(), self.job_id))
+        finally:
+            conn.close()
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def process_job(conn, job, path=queue_path, force=False):
+    """
+    Runs one claimed job through TTS and rendering, recording each stage.
+
+    A job resumed after a crash repeats TTS through the content-addressed
+    TTS cache, so speech that was already fetched is not requested again.
+    A job whose identical render is in the render manifest is done right
+    away with the earlier output, unless `force` is set (see manifest.py).
+    """
+    job_id = job["id"]
+    inputs = render_inputs(job["voice"], job["speed"], job["title"], job["body"], job["engine"])
+    key = render_key(inputs)
+    with Heartbeat(path, job_id), job_trace(queue_id=job_id, title=job["title"][:80]):
+        if not force:
+            output = reuse_render(key)
+            if output is not None:
+                return output
+
+        audio_data, timestamps = fetch_speech(job["voice"], job["speed"], job["title"], job["body"])
+        update_job(conn, job_id, state="rendering", heartbeat=time.time())
+
+        with job_workspace() as workspace:
+            # Recorded so the workspace can be cleaned up if this process dies
+            update_job(conn, job_id, workspace=workspace)
+            prepared = prepare_job(workspace, job["title"], audio_data, timestamps)
+            if prepared is None:
+                raise RuntimeError("No MP4 files found in the background folder")
+            output = render_job(prepared, job["engine"])
+            record_render(key, inputs, prepared, output)
+            return output
+
+
+def run_worker(path=queue_path, poll_interval=2.0, once=False, force=False):
+    """
+    Drains the queue: claims jobs one at a time until the queue is empty
+    (with `once`) or forever, polling every `poll_interval` seconds.
+    Several worker processes can run against the same queue. With `force`
+    jobs are rendered even when an identical render already exists.
+
+    Returns True when the worker retired because it reached a ceiling from
+    resources.py (job count or memory) and should be replaced by a fresh
+    process (see `worker` in cli.py), False when the queue is drained.
+    A job stopped by a ceiling is re-queued like any other failure.
+    """
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    init_worker()
+    conn = connect(path)
+    jobs_done = 0
+    try:
+        while True:
+            job = claim_job(conn, worker)
+            if job is None:
+                if once:
+                    return False
+                time.sleep(poll_interval)
+                continue
+
+            print(f"[{worker}] Job {job['id']} (attempt {job['attempts']}): {job['title'][:50]}")
+            try:
+                with bounded_job():
+                    output = process_job(conn, job, path, force)
+            except Exception as e:
+                state = "failed" if job["attempts"] >= max_attempts else "queued"
+                update_job(conn, job["id"], state=state, error=str(e), heartbeat=None, workspace=None)
+                print(f"[{worker}] Job {job['id']} {state}: {e}")
+                if isinstance(e, ResourceCeilingExceeded):
+                    return True
+            else:
+                update_job(conn, job["id"], state="done", output=output, error=None, heartbeat=None, workspace=None)
+                print(f"[{worker}] Job {job['id']} done: {output}")
+
+            jobs_done += 1
+            if should_retire(jobs_done):
+                print(f"[{worker}] Retiring after {jobs_done} job(s)")
+                return True
+    finally:
+        conn.close()
@@ -0,0 +1,144 @@
+import argparse
+import base64
+import json
+import re
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from tts import transcode_audio, write_wav
+
+# ---------------------------------------------------------------------
+# Local Kokoro Stand-In
+# ---------------------------------------------------------------------
+#
+# Serves /dev/captioned_speech and /health with the same JSON shape as
+# Kokoro-FastAPI, but synthesizes deterministic audio: one short tone per
+# word whose length depends only on the word and the speed. The same
+# request always returns the same bytes, so benchmarks are comparable
+# between commits and machines.
+#
+#   python3 kokoro_stub.py --port 8880
+
+sample_rate = 24000
+token_pattern = re.compile(r"\w+(?:'\w+)?|[^\w\s]")
+sentence_pause = 0.35  # Seconds of silence after . ! ?
+clause_pause = 0.15    # Seconds of silence after , ; :
+
+
+def word_duration(word, speed):
+    return (0.12 + 0.055 * len(word)) / speed
+
+
+def synthesize(text, speed=1.0):
+    """
+    Returns (int16 mono samples, word timestamps) for `text`. Punctuation
+    becomes its own zero-length token followed by a pause, like Kokoro's.
+    """
+    chunks = []
+    timestamps = []
+    position = 0
+
+    for token in token_pattern.findall(text):
+        if token[0].isalnum() or token[0] == "_":
+            n = int(word_duration(token, speed) * sample_rate)
+            t = np.arange(n) / sample_rate
+            frequency = 180 + zlib.crc32(token.lower().encode("utf-8")) % 220
+            envelope = np.minimum(1.0, np.minimum(t, t[::-1]) * 40)
+            chunks.append((np.sin(2 * np.pi * frequency * t) * envelope * 8000).astype(np.int16))
+            timestamps.append({
+                "word": token,
+                "start_time": position / sample_rate,
+                "end_time": (position + n) / sample_rate,
+            })
+            position += n
+            continue
+
+        timestamps.append({
+            "word": token,
+            "start_time": position / sample_rate,
+            "end_time": position / sample_rate,
+        })
+        pause = sentence_pause if token in ".!?" else clause_pause if token in ",;:" else 0.0
+        n = int(pause / speed * sample_rate)
+        chunks.append(np.zeros(n, dtype=np.int16))
+        position += n
+
+    samples = np.concatenate(chunks) if chunks else np.zeros(0, dtype=np.int16)
+    return samples, timestamps
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    # Seconds of simulated synthesis time per second of generated audio
+    realtime_factor = 0.0
+
+    def log_message(self, *args):
+        pass
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/health":
+            self.send_json(200, {"status": "healthy"})
+        else:
+            self.send_json(404, {"detail": "Not Found"})
+
+    def do_POST(self):
+        if self.path != "/dev/captioned_speech":
+            self.send_json(404, {"detail": "Not Found"})
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            text = request["input"]
+            speed = float(request.get("speed", 1.0))
+            response_format = request.get("response_format", "mp3")
+        except (KeyError, TypeError, ValueError) as e:
+            self.send_json(422, {"detail": str(e)})
+            return
+
+        samples, timestamps = synthesize(text, speed)
+        if self.realtime_factor:
+            time.sleep(len(samples) / sample_rate * self.realtime_factor)
+
+        audio = transcode_audio(write_wav((1, 2, sample_rate), samples.tobytes()), response_format)
+        self.send_json(200, {
+            "audio": base64.b64encode(audio).decode("utf-8"),
+            "timestamps": timestamps,
+        })
+
+
+def make_server(host="127.0.0.1", port=8880, realtime_factor=0.0):
+    handler = type("StubHandler", (StubHandler,), {"realtime_factor": realtime_factor})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def start_stub(host="127.0.0.1", port=0, realtime_factor=0.0):
+    """
+    Starts the stub on a background thread (port 0 picks a free port).
+    Returns (server, base URL); call server.shutdown() to stop it.
+    """
+    server = make_server(host, port, realtime_factor)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Deterministic local stand-in for Kokoro TTS.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8880)
+    parser.add_argument("--realtime-factor", type=float, default=0.0,
+                        help="Simulated synthesis seconds per second of audio")
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, args.realtime_factor)
+    print(f"Kokoro stub listening on http://{args.host}:{server.server_address[1]}")
+    server.serve_forever()
@@ -0,0 +1,206 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+from renditions import containers
+
+# ---------------------------------------------------------------------
+# Render Manifest
+# ---------------------------------------------------------------------
+#
+# Batch reruns often ask for videos that already exist. Every finished
+# render is recorded in a manifest entry, keyed by a hash of its inputs:
+# the script (title, body, voice, speed), the render settings and the
+# files the cover and captions are drawn from. Backgrounds are picked at
+# random, so the background is not part of the key; instead the entry
+# records the segment that was used (source file, its SHA-256 and the
+# start time). A render with the same key returns the recorded outputs
+# right away, before TTS, as long as the outputs and that background
+# file are unchanged.
+#
+# Entries are JSON files in `manifest_dir`, one per key, so concurrent
+# workers never rewrite a shared file. A forced render replaces the
+# entry, and the output it pointed to is then unreferenced;
+# `collect_outputs` deletes such videos.
+
+manifest_dir = "assets/cache/manifests"
+manifest_version = 1  # Part of every key; bump it when the rendered output changes
+output_grace = 3600   # Seconds a new unreferenced output is kept (it may still be rendering)
+
+_digest_lock = threading.Lock()
+_digest_cache = {}  # (path, size, mtime_ns) -> SHA-256
+
+
+def file_digest(path):
+    """
+    SHA-256 of a file, or None if it does not exist. Digests are remembered
+    per path, size and mtime, so a background is hashed once per process.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    cache_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    with _digest_lock:
+        digest = _digest_cache.get(cache_key)
+    if digest is None:
+        sha = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                sha.update(chunk)
+        digest = sha.hexdigest()
+        with _digest_lock:
+            _digest_cache[cache_key] = digest
+    return digest
+
+
+def input_key(script, settings, asset_paths):
+    """
+    Manifest key of a render: a hash of the `script` and `settings` dicts
+    (JSON-serializable) and of the contents of every file in `asset_paths`.
+    """
+    payload = json.dumps(
+        {
+            "version": manifest_version,
+            "script": script,
+            "settings": settings,
+            "assets": {path: file_digest(path) for path in asset_paths},
+        },
+        sort_keys=True,
+        ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def entry_path(key, directory=manifest_dir):
+    return os.path.join(directory, f"{key}.json")
+
+
+def output_paths(outputs):
+    """
+    The files of a render result: one path, or a {profile name: path} dict.
+    """
+    return list(outputs.values()) if isinstance(outputs, dict) else [outputs]
+
+
+def file_state(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def load_entry(key, directory=manifest_dir):
+    try:
+        with open(entry_path(key, directory), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def background_unchanged(background):
+    """
+    True if the recorded background file still has the recorded contents.
+    It is only hashed again when its size or mtime changed.
+    """
+    if file_state(background["path"]) == background["state"]:
+        return True
+    return file_digest(background["path"]) == background["sha256"]
+
+
+def find_render(key, directory=manifest_dir):
+    """
+    The outputs recorded for `key`, or None when there is no entry, an
+    output file was deleted or replaced, or the background changed.
+    """
+    entry = load_entry(key, directory)
+    if entry is None:
+        return None
+    for path, state in entry["files"].items():
+        if file_state(path) != state:
+            return None
+    if not background_unchanged(entry["background"]):
+        return None
+    return entry["outputs"]
+
+
+def record_render(key, inputs, job, outputs, directory=manifest_dir):
+    """
+    Records the `outputs` rendered from the prepared `job` (see
+    video.prepare_job) under `key`, replacing an older entry. `inputs` is
+    stored alongside for inspection.
+    """
+    source = job.get("background_source", job["background_path"])
+    entry = {
+        "key": key,
+        "created": time.time(),
+        "inputs": inputs,
+        "background": {
+            "path": source,
+            "sha256": file_digest(source),
+            "state": file_state(source),
+            "start": job["background_start"],
+            "rendered_from": job["background_path"],
+        },
+        "outputs": outputs,
+        "files": {path: file_state(path) for path in output_paths(outputs)},
+    }
+    os.makedirs(directory, exist_ok=True)
+    path = entry_path(key, directory)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(entry, f, indent=1)
+    os.replace(tmp_path, path)
+
+
+def collect_outputs(output_dir, min_age=output_grace, dry_run=False, directory=manifest_dir):
+    """
+    Deletes every video in `output_dir` (a file with one of the
+    renditions.py container extensions) that no manifest entry refers to,
+    except files modified in the last `min_age` seconds (renders that are
+    still running, or just finished but not yet recorded). Entries whose
+    outputs are gone are deleted as well. Returns the deleted output paths;
+    with `dry_run` nothing is deleted and the paths are only returned.
+    """
+    referenced = set()
+    if os.path.isdir(directory):
+        for name in os.listdir(directory):
+            if not name.endswith(".json"):
+                continue
+            entry = load_entry(name[:-len(".json")], directory)
+            if entry is None:
+                continue
+            paths = [os.path.abspath(path) for path in entry["files"]]
+            if all(os.path.exists(path) for path in paths):
+                referenced.update(paths)
+            elif not dry_run:
+                try:
+                    os.remove(os.path.join(directory, name))
+                except OSError:
+                    pass
+
+    removed = []
+    if not os.path.isdir(output_dir):
+        return removed
+    cutoff = time.time() - min_age
+    for name in sorted(os.listdir(output_dir)):
+        path = os.path.join(output_dir, name)
+        if os.path.splitext(name)[1][1:] not in containers:
+            continue
+        try:
+            if not os.path.isfile(path) or os.path.getmtime(path) >= cutoff:
+                continue
+        except OSError:
+            continue
+        if os.path.abspath(path) in referenced:
+            continue
+        if not dry_run:
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+        removed.append(path)
+    return removed
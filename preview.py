@@ -0,0 +1,268 @@
+import json
+import os
+import shutil
+import time
+import uuid
+
+from PIL import Image, ImageDraw
+
+from ffmpeg_render import render_with_ffmpeg
+from image import load_font
+from instrumentation import job_trace, span
+from manifest import record_render
+from video import (
+    composite_clip,
+    fetch_speech,
+    ffmpeg_job_args,
+    font_path,
+    job_workspace,
+    prepare_job,
+    render_inputs,
+    render_job,
+    render_key,
+)
+
+# ---------------------------------------------------------------------
+# Drafts
+# ---------------------------------------------------------------------
+#
+# A draft is a prepared job kept on disk: narration, cover, title
+# boundary, body captions and background segment. Previews render from a
+# draft, and the final render can start from the same draft, so it skips
+# TTS, the cover and background selection and shows exactly the timing
+# that was previewed. Drafts older than `draft_max_age` are deleted when
+# a new one is created.
+
+drafts_dir = "assets/cache/drafts"
+draft_max_age = 24 * 3600
+
+
+def draft_path(draft_id, directory=drafts_dir):
+    if not draft_id or not all(c.isalnum() for c in draft_id):
+        raise ValueError(f"Invalid draft id {draft_id!r}")
+    return os.path.join(directory, draft_id)
+
+
+def create_draft(voice, speed, title, body, use_tts_cache=True, use_proxy=True, directory=drafts_dir):
+    """
+    Runs TTS (through the TTS cache) and `prepare_job` once and stores the
+    job as a draft. Returns the draft id, or None if there is no background video.
+    """
+    prune_drafts(directory=directory)
+    draft_id = uuid.uuid4().hex[:16]
+    path = draft_path(draft_id, directory)
+    os.makedirs(path)
+
+    try:
+        with job_trace(title=title[:80], draft=draft_id):
+            audio_data, timestamps = fetch_speech(voice, speed, title, body, use_tts_cache)
+            job = prepare_job(path, title, audio_data, timestamps, use_proxy)
+        if job is None:
+            shutil.rmtree(path, ignore_errors=True)
+            return None
+
+        with open(os.path.join(path, "narration.wav"), "wb") as f:
+            f.write(audio_data)
+        stored = {key: value for key, value in job.items() if key not in ("workspace", "audio_data", "trace_id")}
+        stored["script"] = {"voice": voice, "speed": speed, "title": title, "body": body}
+        stored["use_proxy"] = use_proxy
+        with open(os.path.join(path, "job.json.tmp"), "w", encoding="utf-8") as f:
+            json.dump(stored, f)
+        os.replace(os.path.join(path, "job.json.tmp"), os.path.join(path, "job.json"))
+    except BaseException:
+        shutil.rmtree(path, ignore_errors=True)
+        raise
+    return draft_id
+
+
+def draft_exists(draft_id, directory=drafts_dir):
+    """
+    True if the draft is complete and its background segment still exists.
+    """
+    try:
+        with open(os.path.join(draft_path(draft_id, directory), "job.json"), encoding="utf-8") as f:
+            return os.path.exists(json.load(f)["background_path"])
+    except (OSError, ValueError, KeyError):
+        return False
+
+
+def load_draft(draft_id, workspace, directory=drafts_dir):
+    """
+    Returns the draft as a job dict for `render_job`, with `workspace` as
+    its scratch directory (the draft itself is only read, so several
+    renders can use it at once).
+    """
+    path = draft_path(draft_id, directory)
+    with open(os.path.join(path, "job.json"), encoding="utf-8") as f:
+        job = json.load(f)
+    with open(os.path.join(path, "narration.wav"), "rb") as f:
+        job["audio_data"] = f.read()
+    job.pop("script", None)
+    job.pop("use_proxy", None)
+    job["workspace"] = workspace
+    job["trace_id"] = None
+    return job
+
+
+def draft_script(draft_id, directory=drafts_dir):
+    """
+    The script dict ({"voice", "speed", "title", "body"}) a draft was made
+    from, and its title end time.
+    """
+    with open(os.path.join(draft_path(draft_id, directory), "job.json"), encoding="utf-8") as f:
+        job = json.load(f)
+    return job["script"], job["title_end_time"]
+
+
+def remove_draft(draft_id, directory=drafts_dir):
+    shutil.rmtree(draft_path(draft_id, directory), ignore_errors=True)
+
+
+def prune_drafts(max_age=draft_max_age, directory=drafts_dir):
+    if not os.path.isdir(directory):
+        return
+    cutoff = time.time() - max_age
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                shutil.rmtree(path, ignore_errors=True)
+        except OSError:
+            pass
+
+
+def render_draft(draft_id, engine="moviepy", segments=1, profiles=None, directory=drafts_dir):
+    """
+    Final render of a draft; takes the same arguments and returns the same
+    as `render_job`. The draft is kept, so it can be rendered again.
+
+    The draft always renders with its own background segment, and the
+    result is recorded in the render manifest like a `make_video` render.
+    """
+    with open(os.path.join(draft_path(draft_id, directory), "job.json"), encoding="utf-8") as f:
+        stored = json.load(f)
+    script = stored["script"]
+    inputs = render_inputs(
+        script["voice"], script["speed"], script["title"], script["body"],
+        engine, stored.get("use_proxy", True), segments, profiles
+    )
+
+    with job_workspace() as workspace:
+        job = load_draft(draft_id, workspace, directory)
+        with job_trace(title=job["title"][:80], engine=engine, draft=draft_id):
+            outputs = render_job(job, engine, segments, profiles)
+        record_render(render_key(inputs), inputs, job, outputs)
+        return outputs
+
+
+# ---------------------------------------------------------------------
+# Preview Rendering
+# ---------------------------------------------------------------------
+#
+# Previews always use the ffmpeg engine composited directly at preview
+# size (the cover is scaled and libass scales the captions), at a low
+# frame rate and with x264's fastest preset. The layout and timing are
+# the same as the final render's.
+
+preview_width = 360
+preview_height = 640
+preview_fps = 12
+preview_preset = "ultrafast"
+
+
+def render_preview(draft_id, sheet=False, directory=drafts_dir):
+    """
+    Renders a preview of a draft into the draft directory: a small, low
+    frame rate MP4, or with `sheet` a contact sheet PNG of a few frames
+    (see `contact_sheet`). Returns the preview path.
+    """
+    path = draft_path(draft_id, directory)
+    output_path = os.path.join(path, "preview.png" if sheet else "preview.mp4")
+
+    with job_workspace() as workspace:
+        job = load_draft(draft_id, workspace, directory)
+        with job_trace(title=job["title"][:80], draft=draft_id, preview="sheet" if sheet else "video"):
+            if sheet:
+                with span("preview_sheet"):
+                    contact_sheet(job, output_path)
+            else:
+                with span("preview_encode", frames=int(job["video_duration"] * preview_fps)):
+                    render_with_ffmpeg(
+                        output_path=output_path,
+                        width=preview_width,
+                        height=preview_height,
+                        fps=preview_fps,
+                        preset=preview_preset,
+                        **ffmpeg_job_args(job)
+                    )
+    return output_path
+
+
+def make_preview(voice, speed, title, body, sheet=False, use_tts_cache=True, use_proxy=True):
+    """
+    Creates a draft and renders its preview. Returns (draft id, preview path),
+    or (None, None) if there is no background video. Pass the draft id to
+    `render_draft` for the final render.
+    """
+    draft_id = create_draft(voice, speed, title, body, use_tts_cache, use_proxy)
+    if draft_id is None:
+        return None, None
+    return draft_id, render_preview(draft_id, sheet)
+
+
+# ---------------------------------------------------------------------
+# Contact Sheet
+# ---------------------------------------------------------------------
+
+def sheet_times(job, frames=8, fps=24):
+    """
+    Timestamps for a contact sheet: the first frame, the last title frame,
+    the first body frame, and the rest spread evenly over the body.
+    """
+    duration = job["video_duration"]
+    title_end = min(job["title_end_time"], duration)
+    last_frame = max(0.0, duration - 1 / fps)
+    times = [0.0, max(0.0, title_end - 1 / fps), min(title_end, last_frame)]
+    remaining = frames - len(times)
+    if remaining > 0 and last_frame > title_end:
+        step = (last_frame - title_end) / remaining
+        times += [title_end + step * (i + 1) for i in range(remaining)]
+    return sorted(set(round(t, 3) for t in times))
+
+
+def frame_label(job, t):
+    """
+    "title", the caption shown at `t`, or "" between captions.
+    """
+    if t < job["title_end_time"]:
+        return "title"
+    for token in job["body_tokens"]:
+        if token["start_time"] <= t < token["end_time"]:
+            return token["word"]
+    return ""
+
+
+def contact_sheet(job, output_path, frames=8, columns=4, thumb_width=240):
+    """
+    Saves a grid of composited frames at `sheet_times`, each labelled with
+    its time and what is on screen (title or caption), so the title
+    boundary and caption timing can be checked without encoding a video.
+    """
+    with composite_clip(job, with_audio=False) as clip:
+        times = sheet_times(job, frames)
+        thumb_height = round(thumb_width * clip.h / clip.w)
+        label_height = 28
+        rows = -(-len(times) // columns)
+
+        sheet = Image.new("RGB", (columns * thumb_width, rows * (thumb_height + label_height)), "black")
+        draw = ImageDraw.Draw(sheet)
+        font = load_font(font_path, 16)
+        for i, t in enumerate(times):
+            x = (i % columns) * thumb_width
+            y = (i // columns) * (thumb_height + label_height)
+            thumb = Image.fromarray(clip.get_frame(t)).resize((thumb_width, thumb_height), Image.BILINEAR)
+            sheet.paste(thumb, (x, y))
+            draw.text((x + 6, y + thumb_height + 4), f"{t:.2f}s  {frame_label(job, t)}"[:32], font=font, fill="white")
+
+    sheet.save(output_path, compress_level=1)
+    return output_path
@@ -0,0 +1,79 @@
+import contextvars
+from contextlib import contextmanager
+
+from proglog import ProgressBarLogger
+
+from resources import check_ceiling
+
+# ---------------------------------------------------------------------
+# Render Progress Reporting
+# ---------------------------------------------------------------------
+#
+# The render stages call `report_progress(stage, fraction)`. Nothing
+# listens by default; a caller that wants live progress (the web UI's
+# render service) installs a callback with `progress_listener`. The
+# callback may raise RenderCancelled to stop the render at the next
+# report, which unwinds through the normal cleanup paths. Every report is
+# also where a worker over its resource ceiling stops (see resources.py).
+
+_listener = contextvars.ContextVar("reelsai_progress", default=None)
+
+
+class RenderCancelled(Exception):
+    pass
+
+
+@contextmanager
+def progress_listener(callback):
+    """
+    Calls `callback(stage, fraction)` for every progress report made in
+    this context. `fraction` is the share of the stage done (0-1) or None.
+    """
+    token = _listener.set(callback)
+    try:
+        yield
+    finally:
+        _listener.reset(token)
+
+
+def report_progress(stage, fraction=None):
+    check_ceiling()
+    callback = _listener.get()
+    if callback is not None:
+        callback(stage, fraction)
+
+
+def progress_enabled():
+    return _listener.get() is not None
+
+
+class FrameProgressLogger(ProgressBarLogger):
+    """
+    MoviePy logger that reports the encode as a fraction of frames written,
+    in steps of at least `step`.
+    """
+
+    def __init__(self, stage="encode", step=0.01):
+        super().__init__()
+        self.stage = stage
+        self.step = step
+        self.reported = -1.0
+
+    def bars_callback(self, bar, attr, value, old_value=None):
+        if bar != "frame_index" or attr != "index":
+            return
+        total = self.bars[bar]["total"]
+        if not total:
+            return
+        fraction = min(1.0, value / total)
+        if fraction - self.reported >= self.step or fraction == 1.0:
+            self.reported = fraction
+            report_progress(self.stage, fraction)
+
+
+def moviepy_logger():
+    """
+    The `logger` argument for MoviePy writes: frame progress when someone
+    is listening, MoviePy's console bar otherwise.
+    """
+    return FrameProgressLogger() if progress_enabled() else "bar"
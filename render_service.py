@@ -0,0 +1,545 @@
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from archive import StreamingZip
+from instrumentation import job_trace
+from manifest import record_render
+from preview import draft_exists, render_draft
+from progress import RenderCancelled, progress_listener
+from resources import ResourceCeilingExceeded, bounded_job, worker_pool_options
+from scripts import script_settings
+from video import (
+    create_job_workspace,
+    fetch_speech,
+    prepare_job,
+    remove_abandoned_job,
+    remove_file,
+    remove_job_workspace,
+    render_inputs,
+    render_job,
+    render_key,
+    reuse_render,
+)
+
+# ---------------------------------------------------------------------
+# Background Render Service (web UI)
+# ---------------------------------------------------------------------
+#
+# Renders submitted from the web UI run here instead of inside the
+# Streamlit script, so reruns never block on or abandon them. One service
+# is shared by every session (see `get_render_service` in webui.py): jobs
+# from all users wait in one FIFO queue and go through three stages:
+#
+#   1) TTS fetch      - `tts_workers` threads request speech for the next
+#   2) cover/timeline   jobs and run `prepare_job` as it arrives,
+#   3) encode         - at most `workers` `render_job` calls run in worker
+#                       processes.
+#
+# TTS and preparation of upcoming jobs overlap the encodes of the current
+# ones. Only a bounded window of jobs is prepared ahead (about one per
+# encoder and TTS thread), so a large batch never holds more than a few
+# narrations in memory. Scripts rendered before (see manifest.py) finish
+# in stage 1, and previewed scripts go straight to stage 3 with their
+# draft (see preview.py).
+#
+# Workers send (job id, stage, fraction) progress events back through a
+# manager queue. A cancelled job id is put in a shared dict; stages 1-2
+# and the worker see it at their next progress report and stop with
+# RenderCancelled. Worker processes are bounded by the ceilings in
+# resources.py; after a job fails on one, its worker's pool is replaced so
+# the process is not reused.
+#
+# Finished batches are kept, with their videos and ZIP, until their owner
+# clears them or until `REELSAI_UI_KEEP_HOURS` (default 24) after their
+# last job finished, so a long-running shared instance does not grow
+# without bound.
+
+try:
+    finished_max_age = float(os.environ.get("REELSAI_UI_KEEP_HOURS", 24)) * 3600
+except ValueError:
+    finished_max_age = 24 * 3600
+
+# Progress shown for the start of each stage; the encode fills the gap to "concat"
+stage_progress = {
+    "queued": 0.0,
+    "starting": 0.0,
+    "tts": 0.02,
+    "cover": 0.10,
+    "subtitles": 0.12,
+    "background": 0.14,
+    "ready": 0.15,
+    "encode": 0.15,
+    "concat": 0.97,
+}
+finished_states = ("done", "failed", "cancelled")
+
+
+def stage_service_job(spec, on_progress):
+    """
+    Stages 1-2 of a job, in a service thread: TTS, then the cover, title
+    boundary, captions and background (see video.prepare_job). Returns
+    {"output"} when an identical render is recorded in the manifest, else
+    {"job", "inputs", "key"} for the encode stage; the job's workspace is
+    then the caller's to remove.
+    """
+    inputs = render_inputs(spec["voice"], spec["speed"], spec["title"], spec["body"], spec["engine"])
+    key = render_key(inputs)
+    with progress_listener(on_progress), job_trace(title=spec["title"][:80], engine=spec["engine"]):
+        if not spec.get("force"):
+            output = reuse_render(key)
+            if output is not None:
+                return {"output": output}
+
+        audio_data, timestamps = fetch_speech(spec["voice"], spec["speed"], spec["title"], spec["body"])
+        workspace = create_job_workspace()
+        try:
+            job = prepare_job(workspace, spec["title"], audio_data, timestamps)
+            if job is None:
+                raise RuntimeError("No MP4 files found in the background folder")
+        except BaseException:
+            remove_job_workspace(workspace)
+            raise
+    return {"job": job, "inputs": inputs, "key": key}
+
+
+def run_service_job(job_id, spec, job, events, cancelled):
+    """
+    Worker process side of a job: encodes the prepared `job`, or renders
+    the draft of a previewed script when `job` is None, while forwarding
+    progress reports. Returns the output path.
+    """
+    def on_progress(stage, fraction):
+        if job_id in cancelled:
+            raise RenderCancelled()
+        events.put((job_id, stage, fraction))
+
+    with progress_listener(on_progress), bounded_job():
+        if job is None:
+            # Previewed script: reuse its narration, cover and background segment
+            on_progress("starting", None)
+            output = render_draft(spec["draft"], engine=spec["engine"])
+        else:
+            output = render_job(job, spec["engine"])
+    if output is None:
+        raise RuntimeError("No MP4 files found in the background folder")
+    return output
+
+
+class RenderService:
+    def __init__(
+        self,
+        workers=2,
+        archive_dir="static",
+        max_processes=32,
+        max_age=finished_max_age,
+        tts_workers=2,
+        archive_part_size=None
+    ):
+        self.max_processes = max_processes  # Upper bound for `workers`
+        self.workers = min(workers, max_processes)
+        self.tts_workers = tts_workers  # Jobs in TTS and preparation at a time
+        self.archive_dir = archive_dir
+        self.archive_part_size = archive_part_size  # Batch ZIPs are split into parts of at most this many bytes
+        self.max_age = max_age  # Seconds a finished batch is kept (0 = until cleared)
+        self.jobs = {}     # job id -> job dict
+        self.batches = {}  # batch id -> batch dict
+
+        self._lock = threading.RLock()
+        self._pending = deque()  # (job id, spec) waiting for stages 1-2
+        self._staging = {}       # job id -> future of `stage_service_job`
+        self._ready = deque()    # (job id, spec, staged) waiting for an encode worker
+        self._running = {}       # job id -> encode future
+        self._closing = False
+        self._stage_pool = ThreadPoolExecutor(max_workers=tts_workers, thread_name_prefix="render-stage")
+        self._mp_context = multiprocessing.get_context("spawn")
+        self._manager = self._mp_context.Manager()
+        self._events = self._manager.Queue()
+        self._cancelled = self._manager.dict()
+        self._pool = self._new_pool()
+        threading.Thread(target=self._collect_events, daemon=True).start()
+
+    def _new_pool(self):
+        # Worker processes are started on demand, so a large pool costs nothing;
+        # `_dispatch` keeps at most `workers` of them busy
+        return ProcessPoolExecutor(
+            max_workers=self.max_processes, mp_context=self._mp_context, **worker_pool_options()
+        )
+
+    # --- Submitting & cancelling ---
+
+    def submit(self, owner, scripts, voice, speed, engine="moviepy", archive=False, force=False):
+        """
+        Queues one job per script in `scripts` ((title, body) pairs or script
+        dicts, whose voice/speed override `voice`/`speed`, and whose "draft"
+        id, if any, is rendered instead; see preview.py) as a batch owned by
+        `owner` (a session id). With `archive`, finished videos are added to
+        a ZIP in `archive_dir` as they complete (split into parts of at most
+        `archive_part_size` bytes; the batch's "zip_paths" lists them once
+        "zip_ready" is set). With `force`, scripts are
+        rendered even when an identical render exists (see manifest.py).
+
+        `scripts` may be a generator over a script file: each job is queued,
+        and may start, as soon as it is parsed. Returns the batch id, or None
+        when `scripts` yields nothing.
+        """
+        self.expire()
+        batch_id = uuid.uuid4().hex[:12]
+        now = time.time()
+        zip_path = os.path.join(self.archive_dir, f"{batch_id}.zip") if archive else None
+        batch = {
+            "id": batch_id, "owner": owner, "job_ids": [], "created": now,
+            "zip_path": zip_path, "zip_paths": [], "zip_ready": False, "submitting": True,
+            "archive": StreamingZip(zip_path, self.archive_part_size) if archive else None,
+        }
+        with self._lock:
+            self.batches[batch_id] = batch
+
+        try:
+            for i, script in enumerate(scripts):
+                title, body, job_voice, job_speed = script_settings(script, voice, speed)
+                job_id = f"{batch_id}-{i}"
+                spec = {"title": title, "body": body, "voice": job_voice, "speed": job_speed, "engine": engine,
+                        "draft": script.get("draft") if isinstance(script, dict) else None, "force": force}
+                with self._lock:
+                    self.jobs[job_id] = {
+                        "id": job_id, "batch": batch_id, "owner": owner, "title": title,
+                        "state": "queued", "stage": "queued", "progress": None,
+                        "output": None, "error": None, "submitted": time.time(), "finished": None,
+                    }
+                    self._pending.append((job_id, spec))
+                    batch["job_ids"].append(job_id)
+                    self._dispatch()
+        finally:
+            with self._lock:
+                # The batch ZIP can only be finished once every job is known
+                batch["submitting"] = False
+                if batch["job_ids"]:
+                    self._batch_progressed(batch_id)
+                else:
+                    if batch["archive"] is not None:
+                        batch["archive"].abort()
+                    del self.batches[batch_id]
+        return batch_id if batch["job_ids"] else None
+
+    def cancel(self, job_id):
+        """
+        Cancels a queued or prepared job right away, or asks a running one
+        to stop at its next progress report.
+        """
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job is None or job["state"] in finished_states:
+                return
+            ready = [item for item in self._ready if item[0] == job_id]
+            if job["state"] == "queued":
+                self._pending = deque(item for item in self._pending if item[0] != job_id)
+                job.update(state="cancelled", stage="cancelled", finished=time.time())
+                self._batch_progressed(job["batch"])
+            elif ready:
+                self._ready.remove(ready[0])
+                if ready[0][2] is not None:
+                    remove_job_workspace(ready[0][2]["job"]["workspace"])
+                job.update(state="cancelled", stage="cancelled", progress=None, finished=time.time())
+                self._batch_progressed(job["batch"])
+            else:
+                self._cancelled[job_id] = True
+                job["stage"] = "cancelling"
+
+    def cancel_batch(self, batch_id):
+        for job_id in list(self.batches.get(batch_id, {}).get("job_ids", [])):
+            self.cancel(job_id)
+
+    def set_workers(self, workers):
+        with self._lock:
+            self.workers = max(1, min(int(workers), self.max_processes))
+            self._dispatch()
+
+    def forget(self, batch_id):
+        """
+        Drops a finished batch and deletes its videos and ZIP.
+        """
+        self._forget(batch_id)
+
+    def expire(self, max_age=None):
+        """
+        Forgets every batch whose jobs all finished more than `max_age`
+        seconds ago (default: the service's `max_age`; 0 keeps them).
+        """
+        max_age = self.max_age if max_age is None else max_age
+        if not max_age:
+            return
+        cutoff = time.time() - max_age
+        with self._lock:
+            expired = []
+            for batch_id, batch in self.batches.items():
+                jobs = [self.jobs[job_id] for job_id in batch["job_ids"]]
+                if batch["submitting"] or any(job["state"] not in finished_states for job in jobs):
+                    continue
+                if max(job["finished"] or 0.0 for job in jobs) < cutoff:
+                    expired.append(batch_id)
+            for batch_id in expired:
+                self._forget(batch_id)
+
+    def _forget(self, batch_id):
+        with self._lock:
+            batch = self.batches.get(batch_id)
+            if batch is None:
+                return
+            jobs = [self.jobs[job_id] for job_id in batch["job_ids"]]
+            if any(job["state"] not in finished_states for job in jobs):
+                raise ValueError("Batch still has unfinished jobs")
+            for job in jobs:
+                del self.jobs[job["id"]]
+            # A reused render (see manifest.py) can be the output of other jobs too
+            still_shown = {job["output"] for job in self.jobs.values()}
+            for job in jobs:
+                if job["output"] and job["output"] not in still_shown:
+                    remove_file(job["output"])
+            for zip_path in batch["zip_paths"]:
+                remove_file(zip_path)
+            del self.batches[batch_id]
+
+    def shutdown(self):
+        with self._lock:
+            self._closing = True
+            for job_id in list(self._staging) + list(self._running):
+                self._cancelled[job_id] = True
+        self._stage_pool.shutdown(wait=True, cancel_futures=True)
+        self._pool.shutdown(wait=True, cancel_futures=True)
+        with self._lock:
+            for _job_id, _spec, staged in self._ready:
+                if staged is not None:
+                    remove_job_workspace(staged["job"]["workspace"])
+            self._ready.clear()
+        self._events.put(None)
+        self._manager.shutdown()
+
+    # --- Reading state ---
+
+    def session_batches(self, owner):
+        """
+        Snapshot of `owner`'s batches, oldest first, as (batch, jobs) pairs
+        of copies. Queued jobs carry their "position" in the shared queue.
+        """
+        self.expire()
+        with self._lock:
+            positions = {job_id: i + 1 for i, (job_id, _spec) in enumerate(self._pending)}
+            snapshot = []
+            for batch in sorted(self.batches.values(), key=lambda b: b["created"]):
+                if batch["owner"] != owner:
+                    continue
+                jobs = []
+                for job_id in batch["job_ids"]:
+                    job = dict(self.jobs[job_id])
+                    job["position"] = positions.get(job_id)
+                    jobs.append(job)
+                batch = {k: v for k, v in batch.items() if k != "archive"}
+                snapshot.append((batch, jobs))
+            return snapshot
+
+    def queue_length(self):
+        """
+        (jobs waiting, jobs in any stage).
+        """
+        with self._lock:
+            return len(self._pending), len(self._staging) + len(self._ready) + len(self._running)
+
+    # --- Internals ---
+
+    def _dispatch(self):
+        with self._lock:
+            if self._closing:
+                return
+            self._start_encodes()
+            # Stages 1-2 run ahead of the encoders, a bounded window of jobs at a time
+            while (self._pending and len(self._staging) < self.tts_workers
+                   and len(self._staging) + len(self._ready) < self.tts_workers + self.workers):
+                job_id, spec = self._pending.popleft()
+                self.jobs[job_id].update(state="running", stage="starting", progress=None)
+                if spec.get("draft") and draft_exists(spec["draft"]):
+                    self._ready.append((job_id, spec, None))
+                    continue
+                future = self._stage_pool.submit(stage_service_job, spec, self._stage_listener(job_id))
+                self._staging[job_id] = future
+                future.add_done_callback(lambda f, job_id=job_id, spec=spec: self._staged(job_id, spec, f))
+            self._start_encodes()
+
+    def _start_encodes(self):
+        while self._ready and len(self._running) < self.workers:
+            job_id, spec, staged = self._ready.popleft()
+            job = staged["job"] if staged is not None else None
+            try:
+                future = self._pool.submit(run_service_job, job_id, spec, job, self._events, self._cancelled)
+            except BrokenProcessPool:
+                # A worker died (e.g. out of memory); start a fresh pool
+                self._pool = self._new_pool()
+                future = self._pool.submit(run_service_job, job_id, spec, job, self._events, self._cancelled)
+            if self.jobs[job_id]["stage"] != "cancelling":
+                self.jobs[job_id].update(stage="encode" if job is not None else "starting", progress=None)
+            self._running[job_id] = future
+            future.add_done_callback(
+                lambda f, job_id=job_id, staged=staged, pool=self._pool: self._encoded(job_id, staged, f, pool)
+            )
+
+    def _retire_pool(self, pool):
+        """
+        Starts a fresh pool in place of `pool`, one of whose worker processes
+        crossed a resource ceiling. Jobs running in `pool` finish, then its
+        processes exit.
+        """
+        with self._lock:
+            if pool is not self._pool or self._closing:
+                return
+            self._pool = self._new_pool()
+        pool.shutdown(wait=False)
+
+    def _stage_listener(self, job_id):
+        """
+        Progress callback for stages 1-2, which run in this process.
+        """
+        def on_progress(stage, fraction):
+            if job_id in self._cancelled:
+                raise RenderCancelled()
+            with self._lock:
+                job = self.jobs.get(job_id)
+                if job is not None and job["stage"] != "cancelling":
+                    job.update(stage=stage, progress=fraction)
+        return on_progress
+
+    def _staged(self, job_id, spec, future):
+        output, error, state = None, None, None
+        try:
+            staged = future.result()
+        except RenderCancelled:
+            state = "cancelled"
+        except Exception as e:
+            state = "failed"
+            error = str(e) or repr(e)
+        else:
+            if "output" in staged:
+                output, state = staged["output"], "done"
+
+        with self._lock:
+            self._staging.pop(job_id, None)
+            if state is None:
+                if self._closing or job_id in self._cancelled or job_id not in self.jobs:
+                    remove_job_workspace(staged["job"]["workspace"])
+                    state = "cancelled"
+                else:
+                    self._ready.append((job_id, spec, staged))
+                    self.jobs[job_id].update(stage="ready", progress=None)
+        if state is not None:
+            self._finish(job_id, state, output, error)
+        self._dispatch()
+
+    def _encoded(self, job_id, staged, future, pool):
+        output, error = None, None
+        try:
+            output = future.result()
+            if staged is not None:
+                record_render(staged["key"], staged["inputs"], staged["job"], output)
+            state = "done"
+        except RenderCancelled:
+            state = "cancelled"
+        except ResourceCeilingExceeded as e:
+            state = "failed"
+            error = str(e)
+            self._retire_pool(pool)
+        except Exception as e:
+            state = "failed"
+            error = str(e) or repr(e)
+        if staged is not None:
+            if state == "done":
+                remove_job_workspace(staged["job"]["workspace"])
+            else:
+                # Also deletes the reserved output if the worker process died mid-encode
+                remove_abandoned_job(staged["job"]["workspace"])
+
+        with self._lock:
+            self._running.pop(job_id, None)
+        self._finish(job_id, state, output, error)
+        self._dispatch()
+
+    def _finish(self, job_id, state, output=None, error=None):
+        # Archive before marking the job finished, so the batch ZIP is only
+        # closed once every finished job's video is in it
+        with self._lock:
+            job = self.jobs.get(job_id)
+            batch = self.batches.get(job["batch"]) if job else None
+            archive = batch["archive"] if batch else None
+        if output and archive is not None:
+            archive.add(output)
+
+        with self._lock:
+            self._cancelled.pop(job_id, None)
+            if job is not None:
+                job.update(state=state, stage=state, output=output, error=error, progress=None,
+                           finished=time.time())
+                self._batch_progressed(job["batch"])
+
+    def _batch_progressed(self, batch_id):
+        """
+        Finishes the batch ZIP once every job in the batch is finished.
+        """
+        batch = self.batches.get(batch_id)
+        if batch is None or batch["archive"] is None or batch["submitting"]:
+            return
+        if all(self.jobs[job_id]["state"] in finished_states for job_id in batch["job_ids"]):
+            archive, batch["archive"] = batch["archive"], None
+            if archive.names:
+                batch["zip_paths"] = archive.close()
+                batch["zip_ready"] = True
+            else:
+                archive.abort()
+
+    def _collect_events(self):
+        while True:
+            try:
+                event = self._events.get()
+            except (EOFError, OSError):  # Manager shut down
+                return
+            if event is None:
+                return
+            job_id, stage, fraction = event
+            with self._lock:
+                job = self.jobs.get(job_id)
+                if job is not None and job["state"] == "running" and job["stage"] != "cancelling":
+                    job["stage"] = stage
+                    job["progress"] = fraction
+
+
+def job_progress(job):
+    """
+    Overall 0-1 progress of a job dict for a progress bar.
+    """
+    if job["state"] in finished_states:
+        return 1.0
+    start = stage_progress.get(job["stage"], 0.0)
+    if job["stage"] == "encode" and job["progress"] is not None:
+        return start + (stage_progress["concat"] - start) * job["progress"]
+    return start
+
+
+def describe_job(job):
+    """
+    One-line status of a job dict, e.g. "encoding 42%" or "queued (#3)".
+    """
+    if job["state"] == "queued":
+        return f"queued (#{job['position']})" if job.get("position") else "queued"
+    if job["state"] == "failed":
+        return f"failed: {job['error']}"
+    if job["stage"] == "encode" and job["progress"] is not None:
+        return f"encoding {job['progress']:.0%}"
+    labels = {
+        "starting": "starting", "tts": "generating speech", "cover": "drawing cover",
+        "subtitles": "timing subtitles", "background": "picking background",
+        "ready": "waiting for an encoder", "encode": "encoding", "concat": "joining segments",
+        "cancelling": "cancelling",
+    }
+    return labels.get(job["stage"], job["stage"])
@@ -0,0 +1,137 @@
+import re
+
+# ---------------------------------------------------------------------
+# Output Profiles
+# ---------------------------------------------------------------------
+#
+# A profile describes one rendition of a reel: size, frame rate, encoder
+# quality and container. `make_video(..., profiles=[...])` composites every
+# frame once and encodes it to all requested renditions in the same pass
+# (see ffmpeg_render.rendition_graph). Profiles are given by name from
+# `output_profiles` or as dicts; missing keys come from `default_profile`.
+
+default_profile = {
+    "name": "reels",
+    "width": 1080,
+    "height": 1920,
+    "fps": 24,
+    "crf": None,            # None: the encoder's default quality (x264: 23, VP9: 32)
+    "preset": "medium",     # x264 preset; mapped to a VP9 speed for webm
+    "max_bitrate": None,    # e.g. "2M" caps the video bitrate for platforms that require it
+    "audio_bitrate": None,  # e.g. "96k"; None: the encoder's default
+    "container": "mp4",
+}
+
+output_profiles = {
+    "reels": dict(default_profile),
+    "720p": dict(default_profile, name="720p", width=720, height=1280, crf=24),
+    "480p": dict(default_profile, name="480p", width=480, height=854, crf=27, preset="fast", audio_bitrate="96k"),
+    "square": dict(default_profile, name="square", width=1080, height=1080),
+    "webm": dict(default_profile, name="webm", container="webm", preset="fast"),
+}
+
+# Container -> (video encoder, audio encoder)
+containers = {
+    "mp4": ("libx264", "aac"),
+    "mov": ("libx264", "aac"),
+    "mkv": ("libx264", "aac"),
+    "webm": ("libvpx-vp9", "libopus"),
+}
+
+x264_presets = (
+    "ultrafast", "superfast", "veryfast", "faster", "fast", "medium", "slow", "slower", "veryslow"
+)
+vp9_cpu_used = {preset: 8 - i for i, preset in enumerate(x264_presets)}  # ultrafast -> 8 ... veryslow -> 0
+
+
+def resolve_profiles(profiles):
+    """
+    Turns a list of profile names and/or dicts into complete, validated
+    profile dicts. Raises ValueError for unknown names, invalid values or
+    duplicate names (the name is part of the output file name).
+    """
+    resolved = []
+    for profile in profiles:
+        if isinstance(profile, str):
+            if profile not in output_profiles:
+                raise ValueError(f"Unknown output profile {profile!r}, expected one of {tuple(output_profiles)}")
+            profile = output_profiles[profile]
+        elif "name" not in profile:
+            profile = dict(profile, name=None)
+        profile = dict(default_profile, **profile)
+        if profile["name"] is None:
+            profile["name"] = f"{profile['width']}x{profile['height']}"
+        validate_profile(profile)
+        resolved.append(profile)
+
+    if not resolved:
+        raise ValueError("At least one output profile is required")
+    names = [profile["name"] for profile in resolved]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise ValueError(f"Duplicate output profile names: {', '.join(duplicates)}")
+    return resolved
+
+
+def validate_profile(profile):
+    name = profile["name"]
+    if not isinstance(name, str) or not re.fullmatch(r"[A-Za-z0-9_-]+", name):
+        raise ValueError(f"Invalid output profile name {name!r} (letters, digits, _ and - only)")
+    unknown = sorted(set(profile) - set(default_profile))
+    if unknown:
+        raise ValueError(f"Profile {name!r}: unknown settings {', '.join(unknown)}")
+    for key in ("width", "height"):
+        value = profile[key]
+        if not isinstance(value, int) or value <= 0 or value % 2:
+            raise ValueError(f"Profile {name!r}: {key} must be a positive even number, got {value!r}")
+    if not isinstance(profile["fps"], (int, float)) or profile["fps"] <= 0:
+        raise ValueError(f"Profile {name!r}: fps must be positive, got {profile['fps']!r}")
+    if profile["crf"] is not None and (not isinstance(profile["crf"], int) or profile["crf"] < 0):
+        raise ValueError(f"Profile {name!r}: crf must be a non-negative integer, got {profile['crf']!r}")
+    if profile["preset"] not in x264_presets:
+        raise ValueError(f"Profile {name!r}: unknown preset {profile['preset']!r}, expected one of {x264_presets}")
+    if profile["container"] not in containers:
+        raise ValueError(
+            f"Profile {name!r}: unknown container {profile['container']!r}, expected one of {tuple(containers)}"
+        )
+
+
+# ---------------------------------------------------------------------
+# Encoder Arguments
+# ---------------------------------------------------------------------
+
+def video_codec_args(profile):
+    """
+    ffmpeg video encoder arguments for a resolved profile.
+    """
+    video_codec, _audio_codec = containers[profile["container"]]
+    args = ["-c:v", video_codec, "-pix_fmt", "yuv420p"]
+    if video_codec == "libvpx-vp9":
+        # Constant quality (-b:v 0) unless a bitrate cap turns it into constrained quality
+        crf = 32 if profile["crf"] is None else profile["crf"]
+        args += [
+            "-crf", str(crf), "-b:v", profile["max_bitrate"] or "0",
+            "-deadline", "good", "-cpu-used", str(vp9_cpu_used[profile["preset"]]), "-row-mt", "1",
+        ]
+    else:
+        args += ["-preset", profile["preset"]]
+        if profile["crf"] is not None:
+            args += ["-crf", str(profile["crf"])]
+        if profile["max_bitrate"]:
+            args += ["-maxrate", profile["max_bitrate"], "-bufsize", profile["max_bitrate"]]
+    return args
+
+
+def audio_codec_args(profile):
+    _video_codec, audio_codec = containers[profile["container"]]
+    args = ["-c:a", audio_codec]
+    if profile["audio_bitrate"]:
+        args += ["-b:a", profile["audio_bitrate"]]
+    return args
+
+
+def container_args(profile):
+    # Moves the MP4/MOV index to the front so playback can start while downloading
+    if profile["container"] in ("mp4", "mov"):
+        return ["-movflags", "+faststart"]
+    return []
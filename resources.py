@@ -0,0 +1,218 @@
+import gc
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# ---------------------------------------------------------------------
+# Worker Resource Ceilings
+# ---------------------------------------------------------------------
+#
+# Render workers can run for hours. Every clip is closed after each render
+# (see `composite_clip` in video.py), but library caches and heap
+# fragmentation can still creep, so every worker process has ceilings:
+#
+#   REELSAI_WORKER_MAX_JOBS      renders before a worker process is replaced (default 25, 0 = never)
+#   REELSAI_WORKER_MEMORY_MB     RSS of a worker plus its child processes (ffmpeg); a render
+#                                crossing it is stopped with ResourceCeilingExceeded (default off)
+#   REELSAI_WORKER_MAX_CHILDREN  child processes of a worker, same effect (default off)
+#
+# Memory and child processes are read from /proc, so those two ceilings
+# only apply on Linux; the job ceiling applies everywhere.
+#
+# A watchdog thread only flags a crossed ceiling. The render stops at its
+# next stage boundary or progress report (`check_ceiling`, called by
+# `report_progress`), never in the middle of a MoviePy or ffmpeg call or
+# its cleanup. The process that ran it is then retired by its owner: a
+# queue worker exits (see `run_worker` in jobqueue.py) and the render
+# service replaces its process pool.
+
+
+def env_int(name, default):
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+worker_max_jobs = env_int("REELSAI_WORKER_MAX_JOBS", 25)
+worker_memory_mb = env_int("REELSAI_WORKER_MEMORY_MB", 0)
+worker_max_children = env_int("REELSAI_WORKER_MAX_CHILDREN", 0)
+watchdog_interval = 1.0  # Seconds between checks during a render
+
+
+class ResourceCeilingExceeded(MemoryError):
+    pass
+
+
+# --- Readings (Linux /proc; None elsewhere) ---
+
+def process_rss_mb(pid="self"):
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            resident_pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return resident_pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+
+
+def child_pids(pid="self"):
+    """
+    Direct child processes of `pid`, or None if they cannot be listed.
+    """
+    task_dir = f"/proc/{pid}/task"
+    try:
+        children = []
+        for task in os.listdir(task_dir):
+            with open(os.path.join(task_dir, task, "children")) as f:
+                children += [int(child) for child in f.read().split()]
+        return children
+    except OSError:
+        pass
+
+    # Kernels without /proc/<pid>/task/<tid>/children: scan every process's parent
+    parent = os.getpid() if pid == "self" else int(pid)
+    children = []
+    try:
+        entries = [entry for entry in os.listdir("/proc") if entry.isdigit()]
+    except OSError:
+        return None
+    for entry in entries:
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # The command name may contain spaces; the fields after it are fixed
+                fields = f.read().rsplit(")", 1)[1].split()
+            if int(fields[1]) == parent:
+                children.append(int(entry))
+        except (OSError, ValueError, IndexError):
+            continue
+    return children
+
+
+def open_fd_count():
+    try:
+        return len(os.listdir("/proc/self/fd"))
+    except OSError:
+        return None
+
+
+def worker_usage():
+    """
+    {"rss_mb": this process plus its direct children, "children": count,
+    "fds": open file descriptors}; values are None where not available.
+    """
+    rss = process_rss_mb()
+    children = child_pids()
+    if rss is not None and children:
+        rss += sum(process_rss_mb(child) or 0.0 for child in children)
+    return {
+        "rss_mb": rss,
+        "children": None if children is None else len(children),
+        "fds": open_fd_count(),
+    }
+
+
+def trim_memory():
+    """
+    Collects garbage and asks glibc to hand freed heap pages back to the
+    OS, so RSS drops after a render instead of staying at its peak.
+    """
+    gc.collect()
+    if sys.platform.startswith("linux"):
+        try:
+            import ctypes
+            ctypes.CDLL("libc.so.6").malloc_trim(0)
+        except (OSError, AttributeError):
+            pass  # Not glibc
+
+
+# --- Ceiling enforcement ---
+
+_state = {"job": False, "exceeded": None, "watchdog": None}
+
+
+def ceiling_exceeded(usage, memory_mb=None, max_children=None):
+    """
+    A description of the ceiling `usage` crosses, or None.
+    """
+    memory_mb = worker_memory_mb if memory_mb is None else memory_mb
+    max_children = worker_max_children if max_children is None else max_children
+    if memory_mb and usage["rss_mb"] is not None and usage["rss_mb"] > memory_mb:
+        return f"worker memory {usage['rss_mb']:.0f} MB exceeds the {memory_mb} MB ceiling"
+    if max_children and usage["children"] is not None and usage["children"] > max_children:
+        return f"worker has {usage['children']} child processes, the ceiling is {max_children}"
+    return None
+
+
+def check_ceiling():
+    """
+    Raises ResourceCeilingExceeded if the watchdog found the running
+    render over a ceiling. Called at stage boundaries.
+    """
+    if _state["job"] and _state["exceeded"]:
+        raise ResourceCeilingExceeded(_state["exceeded"])
+
+
+def _watch():
+    while True:
+        time.sleep(watchdog_interval)
+        if not _state["job"] or _state["exceeded"]:
+            continue
+        reason = ceiling_exceeded(worker_usage())
+        if reason and _state["job"]:
+            _state["exceeded"] = reason
+
+
+def init_worker():
+    """
+    Sets up ceiling enforcement in this process; use it as a process pool
+    `initializer`. Does nothing when neither the memory nor the child
+    process ceiling is set or /proc is not available.
+    """
+    if _state["watchdog"] is not None or not (worker_memory_mb or worker_max_children):
+        return
+    if process_rss_mb() is None:
+        return
+    _state["watchdog"] = threading.Thread(target=_watch, daemon=True)
+    _state["watchdog"].start()
+
+
+@contextmanager
+def bounded_job():
+    """
+    Marks a render in this worker: while it runs, crossing a ceiling stops
+    it with ResourceCeilingExceeded at the next `check_ceiling`. Afterwards
+    freed memory is returned to the OS.
+    """
+    _state["exceeded"] = None
+    _state["job"] = True
+    try:
+        yield
+    finally:
+        _state["job"] = False
+        _state["exceeded"] = None
+        trim_memory()
+
+
+def worker_pool_options():
+    """
+    ProcessPoolExecutor keyword arguments that apply the ceilings to its
+    workers: ceiling enforcement in each worker, and a fresh worker process
+    after `worker_max_jobs` renders (Python 3.11+).
+    """
+    options = {"initializer": init_worker}
+    if worker_max_jobs > 0 and sys.version_info >= (3, 11):
+        options["max_tasks_per_child"] = worker_max_jobs
+    return options
+
+
+def should_retire(jobs_done):
+    """
+    True when a long-running worker loop should exit so its supervisor
+    starts a fresh process: after `worker_max_jobs` renders, or when the
+    memory left behind after a render is above the memory ceiling.
+    """
+    if worker_max_jobs > 0 and jobs_done >= worker_max_jobs:
+        return True
+    return ceiling_exceeded(worker_usage(), max_children=0) is not None
@@ -0,0 +1,238 @@
+import csv
+import json
+import os
+
+# ---------------------------------------------------------------------
+# Script File Parsing
+# ---------------------------------------------------------------------
+#
+# Script files are read line by line and every script is yielded as soon
+# as it is complete, so a batch can start rendering while the rest of a
+# large file is still being parsed, and memory use does not grow with the
+# file. Three formats are understood:
+#
+#   txt    title / ## / body / ## / title / ## / ...
+#   jsonl  one {"title", "body", "voice"?, "speed"?} object per line
+#   csv    a header row naming the title, body and optional voice/speed columns
+#
+# Scripts are yielded as dicts: {"title", "body", "voice", "speed", "line"}.
+# "voice" and "speed" are None unless the entry overrides them, and "line"
+# is the line the entry starts on. Malformed entries are skipped and
+# reported through `on_error(line, message)` instead of being dropped
+# silently.
+
+script_formats = ("txt", "jsonl", "csv")
+speed_range = (0.25, 4.0)  # Speeds Kokoro accepts
+
+
+def script_format(file_name):
+    """
+    Script format of a file, from its extension (txt when unknown).
+    """
+    ext = os.path.splitext(file_name)[1].lower().lstrip(".")
+    if ext == "json":
+        ext = "jsonl"
+    return ext if ext in script_formats else "txt"
+
+
+def print_script_error(line, message, name="script"):
+    print(f"{name}, line {line}: {message} (skipped)")
+
+
+def make_script(line, title, body, voice=None, speed=None):
+    """
+    Validates one entry and returns it as a script dict.
+    Raises ValueError with a readable message when the entry is malformed.
+    """
+    if not isinstance(title, str) or not title.strip():
+        raise ValueError("missing title")
+    if not isinstance(body, str) or not body.strip():
+        raise ValueError("missing body")
+
+    if voice is not None and (not isinstance(voice, str) or not voice.strip()):
+        raise ValueError(f"invalid voice {voice!r}")
+
+    if speed is not None:
+        if isinstance(speed, bool):
+            raise ValueError(f"invalid speed {speed!r}")
+        try:
+            speed = float(speed)
+        except (TypeError, ValueError):
+            raise ValueError(f"invalid speed {speed!r}") from None
+        if not speed_range[0] <= speed <= speed_range[1]:
+            raise ValueError(f"speed {speed:g} outside {speed_range[0]:g}-{speed_range[1]:g}")
+
+    return {
+        "title": title.strip(),
+        "body": body.strip(),
+        "voice": voice.strip() if voice is not None else None,
+        "speed": speed,
+        "line": line,
+    }
+
+
+def script_settings(script, voice, speed):
+    """
+    Returns (title, body, voice, speed) of a script dict or (title, body)
+    pair, with `voice` and `speed` as defaults for what it does not override.
+    """
+    if isinstance(script, dict):
+        return (
+            script["title"],
+            script["body"],
+            script.get("voice") or voice,
+            script["speed"] if script.get("speed") is not None else speed,
+        )
+    title, body = script
+    return title, body, voice, speed
+
+
+def iter_txt_scripts(lines, on_error):
+    """
+    Title and body blocks separated by `##` lines (title, ##, body, ##, title, ...).
+    """
+    title_lines = []
+    body_lines = []
+    is_body = False  # Start by reading the title
+    start = None     # Line the current entry starts on
+
+    def finish():
+        try:
+            return make_script(start, "\n".join(title_lines), "\n".join(body_lines))
+        except ValueError as e:
+            on_error(start, str(e))
+            return None
+
+    line_no = 0
+    for line_no, line in enumerate(lines, 1):
+        line = line.rstrip()  # Remove trailing spaces and newlines but keep structure
+        if line.startswith("##"):  # Separator detected
+            if is_body:  # End of a body: the entry is complete
+                script = finish()
+                if script is not None:
+                    yield script
+                title_lines.clear()
+                body_lines.clear()
+                start = None
+            elif start is None:
+                start = line_no  # Entry without any title line
+            is_body = not is_body  # Toggle between title and body mode
+            continue  # Skip the ## line itself
+
+        if is_body:
+            body_lines.append(line)
+        else:
+            if start is None and line.strip():
+                start = line_no
+            title_lines.append(line)
+
+    # The last entry does not need a closing ##
+    if is_body:
+        script = finish()
+        if script is not None:
+            yield script
+    elif start is not None:
+        on_error(start, "title without a body (missing ## separator)")
+
+
+def iter_jsonl_scripts(lines, on_error):
+    """
+    One JSON object per line; blank lines are ignored.
+    """
+    for line_no, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            entry = json.loads(line)
+        except json.JSONDecodeError as e:
+            on_error(line_no, f"invalid JSON ({e.msg})")
+            continue
+        if not isinstance(entry, dict):
+            on_error(line_no, "expected a JSON object")
+            continue
+        try:
+            yield make_script(line_no, entry.get("title"), entry.get("body"), entry.get("voice"), entry.get("speed"))
+        except ValueError as e:
+            on_error(line_no, str(e))
+
+
+def iter_csv_scripts(lines, on_error):
+    """
+    CSV with a header row. Quoted fields may span lines (multi-paragraph
+    bodies); empty voice/speed cells mean no override.
+    """
+    reader = csv.reader(lines)
+    try:
+        header = [column.strip().lower() for column in next(reader)]
+    except StopIteration:
+        return
+    except csv.Error as e:
+        on_error(1, f"invalid CSV header ({e})")
+        return
+    missing = [column for column in ("title", "body") if column not in header]
+    if missing:
+        on_error(1, f"header has no {' or '.join(missing)} column")
+        return
+
+    line_no = reader.line_num
+    while True:
+        start = line_no + 1  # A record may span several lines; report where it starts
+        try:
+            row = next(reader)
+        except StopIteration:
+            return
+        except csv.Error as e:
+            on_error(start, f"invalid CSV ({e})")
+            return  # The reader cannot resynchronise after a broken record
+        line_no = reader.line_num
+
+        if not any(cell.strip() for cell in row):
+            continue  # Blank line
+        if len(row) > len(header):
+            on_error(start, f"{len(row)} fields, the header has {len(header)}")
+            continue
+        entry = dict(zip(header, row))
+        try:
+            yield make_script(
+                start, entry.get("title"), entry.get("body"),
+                entry.get("voice") or None, entry.get("speed") or None
+            )
+        except ValueError as e:
+            on_error(start, str(e))
+
+
+script_readers = {"txt": iter_txt_scripts, "jsonl": iter_jsonl_scripts, "csv": iter_csv_scripts}
+
+
+def iter_scripts(lines, format="txt", on_error=None, name="script"):
+    """
+    Yields script dicts from an iterable of text lines (an open file, or a
+    list of lines) in the given format, one at a time as they are parsed.
+    Malformed entries go to `on_error(line, message)`, or are printed with
+    `name` and their line number when no callback is given.
+    """
+    if format not in script_readers:
+        raise ValueError(f"Unknown script format {format!r}, expected one of {script_formats}")
+    if on_error is None:
+        on_error = lambda line, message: print_script_error(line, message, name)
+    return script_readers[format](lines, on_error)
+
+
+def read_scripts(path, format=None, on_error=None):
+    """
+    Streams the scripts of the file at `path`; the format defaults to the
+    one its extension names.
+    """
+    # utf-8-sig drops the byte order mark spreadsheet programs put in CSV exports;
+    # newline="" lets the CSV reader handle line breaks inside quoted fields
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        yield from iter_scripts(f, format or script_format(path), on_error, name=path)
+
+
+def parse_scripts(script_content):
+    """
+    Parses a multi-video script in the `##` format.
+    Returns a list of (title, body) pairs.
+    """
+    return [(script["title"], script["body"]) for script in iter_scripts(script_content.splitlines())]
@@ -0,0 +1,182 @@
+import argparse
+import json
+import multiprocessing
+import os
+import queue
+import statistics
+import sys
+import time
+
+from benchmark_suite import make_corpus, narration_seconds, prepare_sandbox, sandbox_dir, script_sizes
+from kokoro_stub import start_stub
+
+# ---------------------------------------------------------------------
+# Soak Test
+# ---------------------------------------------------------------------
+#
+# Renders many videos in a row in one fresh process, the way a
+# long-running worker does, and checks that resident memory, open file
+# descriptors and child processes stay flat: every clip and reader must
+# be closed after each render. Runs inside the benchmark sandbox against the Kokoro stub,
+# like benchmark_suite.py. Exits with status 1 when something grows.
+#
+#   python3 soak_test.py --videos 40 --engine moviepy
+#   python3 soak_test.py --engine ffmpeg --report soak.json
+
+# Renders before the baseline is taken: caches, the caption LRU and the
+# allocator's arenas fill up during the first few videos
+default_warmup = 5
+
+
+def window_median(values, count):
+    return statistics.median(values[:count]) if values else None
+
+
+def check_samples(samples, warmup, rss_tolerance_mb, fd_tolerance):
+    """
+    Compares the samples after warmup: the median RSS of the last third
+    against the first third, and the open fds and child processes after
+    the last render against the first post-warmup render. Returns a list
+    of failure messages (empty when everything stayed flat).
+    """
+    steady = samples[warmup:]
+    if len(steady) < 3:
+        return [f"need at least {warmup + 3} videos for a soak test ({warmup} warmup)"]
+    third = max(1, len(steady) // 3)
+    failures = []
+
+    rss = [sample["rss_mb"] for sample in steady if sample["rss_mb"] is not None]
+    if len(rss) == len(steady):
+        growth = window_median(rss[-third:], third) - window_median(rss, third)
+        if growth > rss_tolerance_mb:
+            failures.append(f"RSS grew {growth:.1f} MB after warmup (tolerance {rss_tolerance_mb} MB)")
+
+    first, last = steady[0], steady[-1]
+    if first["fds"] is not None and last["fds"] - first["fds"] > fd_tolerance:
+        failures.append(f"open fds grew from {first['fds']} to {last['fds']} (tolerance {fd_tolerance})")
+    if first["children"] is not None and last["children"] > first["children"]:
+        failures.append(f"child processes grew from {first['children']} to {last['children']}")
+    return failures
+
+
+def soak_process(spec, result_queue):
+    """
+    Renders `spec["videos"]` videos one after another in this (fresh)
+    process and puts a usage sample per video on `result_queue`, then None.
+    The render modules are imported here, after the parent has switched
+    into the sandbox and pointed KOKORO_ENDPOINTS at the stub.
+    """
+    from resources import bounded_job, worker_usage
+    from video import make_video
+
+    scripts = spec["scripts"]
+    for i in range(spec["videos"]):
+        title, body = scripts[i % len(scripts)]
+        render_start = time.perf_counter()
+        with bounded_job():
+            output = make_video(spec["voice"], 1.0, title, body, engine=spec["engine"],
+                                segments=spec["segments"], force=True)
+        if output is None:
+            break
+        os.remove(output)  # Keep the sandbox small; only the process is measured
+        result_queue.put(dict(worker_usage(), video=i + 1, wall_s=time.perf_counter() - render_start))
+    result_queue.put(None)
+
+
+def run_soak(args):
+    corpus = make_corpus(sizes={args.size: script_sizes[args.size]}, per_size=4)[args.size]
+    longest = max(narration_seconds(title, body) for title, body in corpus)
+    prepare_sandbox(args.sandbox, int(longest) + 30)
+    os.chdir(args.sandbox)
+
+    server, url = start_stub()
+    os.environ["KOKORO_ENDPOINTS"] = url
+
+    # Index and proxy the synthetic background once, outside the soak
+    from backgrounds import build_all_proxies, refresh_index
+    refresh_index()
+    build_all_proxies()
+
+    spec = {
+        "scripts": corpus,
+        "videos": args.videos,
+        "voice": args.voice,
+        "engine": args.engine,
+        "segments": args.segments,
+    }
+    mp_context = multiprocessing.get_context("spawn")
+    result_queue = mp_context.Queue()
+    process = mp_context.Process(target=soak_process, args=(spec, result_queue))
+    start = time.perf_counter()
+    process.start()
+
+    samples = []
+    failures = []
+    while True:
+        try:
+            sample = result_queue.get(timeout=1)
+        except queue.Empty:
+            if not process.is_alive():
+                failures.append(f"soak process exited with code {process.exitcode}")
+                break
+            continue
+        if sample is None:
+            break
+        samples.append(sample)
+        rss = "n/a" if sample["rss_mb"] is None else f"{sample['rss_mb']:.1f} MB"
+        print(f"[{sample['video']}/{args.videos}] {sample['wall_s']:.2f}s  rss {rss}  "
+              f"fds {sample['fds']}  children {sample['children']}")
+    process.join()
+    server.shutdown()
+
+    if not failures and len(samples) < args.videos:
+        failures.append("no background video in the sandbox")
+    if not failures:
+        failures = check_samples(samples, args.warmup, args.rss_tolerance_mb, args.fd_tolerance)
+
+    return {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "config": {
+            "engine": args.engine,
+            "segments": args.segments,
+            "size": args.size,
+            "videos": args.videos,
+            "warmup": args.warmup,
+            "rss_tolerance_mb": args.rss_tolerance_mb,
+            "fd_tolerance": args.fd_tolerance,
+        },
+        "wall_s": time.perf_counter() - start,
+        "samples": samples,
+        "failures": failures,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render many videos in one process and check for leaks.")
+    parser.add_argument("--videos", type=int, default=30)
+    parser.add_argument("--warmup", type=int, default=default_warmup)
+    parser.add_argument("--engine", choices=("moviepy", "ffmpeg"), default="moviepy")
+    parser.add_argument("--segments", type=int, default=1, help="Segments per MoviePy render")
+    parser.add_argument("--size", choices=list(script_sizes), default="short")
+    parser.add_argument("--voice", default="af_heart")
+    parser.add_argument("--rss-tolerance-mb", type=float, default=40.0,
+                        help="Allowed RSS growth between the first and last third after warmup")
+    parser.add_argument("--fd-tolerance", type=int, default=2,
+                        help="Allowed growth in open file descriptors (pooled HTTP connections)")
+    parser.add_argument("--sandbox", default=sandbox_dir)
+    parser.add_argument("--report", help="Write the samples to this JSON file")
+    args = parser.parse_args()
+
+    args.sandbox = os.path.abspath(args.sandbox)
+    report_path = os.path.abspath(args.report) if args.report else None
+    report = run_soak(args)
+    if report_path:
+        with open(report_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=1)
+        print(f"Report written to {report_path}")
+
+    if report["failures"]:
+        for failure in report["failures"]:
+            print(f"FAIL: {failure}")
+        sys.exit(1)
+    print(f"OK: memory, file descriptors and child processes stayed flat over {args.videos} videos")
@@ -0,0 +1,62 @@
+import os
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from moviepy import CompositeVideoClip, ImageClip, VideoClip
+
+from captions import SubtitleTrackClip, render_caption
+from compositor import ReelCompositeClip
+
+font_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                         "assets", "default", "OpenSans-Bold.ttf")
+frame_size = (1080, 1920)
+title_end_time = 1.0
+tokens = [
+    {"word": "Hello", "start_time": 1.0, "end_time": 1.6},
+    {"word": "wonderful world", "start_time": 1.6, "end_time": 2.4},
+]
+duration = 3.0
+
+
+def noise_frame(t):
+    """A different, reproducible background frame for every timestamp."""
+    rng = np.random.default_rng(int(t * 1000))
+    return rng.integers(0, 256, (frame_size[1], frame_size[0], 3), dtype=np.uint8)
+
+
+@pytest.fixture(scope="module")
+def cover_path(tmp_path_factory):
+    # Semi-transparent pixels exercise the rounding of the blend
+    rng = np.random.default_rng(1)
+    rgba = rng.integers(0, 256, (301, 901, 4), dtype=np.uint8)
+    rgba[:20, :, 3] = 0  # Transparent border, trimmed by the compositor
+    path = tmp_path_factory.mktemp("cover") / "cover.png"
+    Image.fromarray(rgba, "RGBA").save(path)
+    return str(path)
+
+
+def subtitle_track():
+    return SubtitleTrackClip(tokens, duration, lambda word: render_caption(word, font_path))
+
+
+# Around the end of the title, on and between captions, and after the last one
+@pytest.mark.parametrize("t, overlaid", [
+    (0.5, True), (0.99, True), (1.0, True), (1.3, True), (1.6, True), (2.0, True), (2.7, False),
+])
+def test_matches_composite_video_clip(cover_path, t, overlaid):
+    background = VideoClip(frame_function=noise_frame, duration=duration)
+    reel = ReelCompositeClip(background, cover_path, title_end_time, subtitle_track())
+    reference = CompositeVideoClip([
+        VideoClip(frame_function=noise_frame, duration=duration),
+        ImageClip(cover_path).with_duration(title_end_time).with_position(("center", "center")),
+        subtitle_track().with_position(("center", 1100)),
+    ], size=frame_size)
+
+    expected = reference.get_frame(t)
+    actual = reel.get_frame(t)
+
+    assert actual.shape == expected.shape
+    assert np.count_nonzero(actual != expected) == 0
+    assert np.any(actual != noise_frame(t)) == overlaid
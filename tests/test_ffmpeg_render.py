@@ -0,0 +1,50 @@
+import os
+import subprocess
+
+import numpy as np
+import pytest
+
+from moviepy.config import FFMPEG_BINARY
+
+from captions import render_caption
+from ffmpeg_render import ass_font_size, write_ass_subtitles
+
+fonts_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "assets", "default")
+font_path = os.path.join(fonts_dir, "OpenSans-Bold.ttf")
+
+
+def fill_box(rgb):
+    """(left, top, right, bottom) of the white caption fill; the stroke is black."""
+    fill = rgb.max(axis=2) > 128
+    rows = np.flatnonzero(fill.any(axis=1))
+    columns = np.flatnonzero(fill.any(axis=0))
+    return np.array([columns[0], rows[0], columns[-1], rows[-1]])
+
+
+def test_ass_font_size_uses_win_metrics():
+    # Open Sans: usWinAscent 2302 + usWinDescent 651 over 2048 units per em
+    assert ass_font_size(font_path, 110) == round(110 * 2953 / 2048, 2)
+
+
+@pytest.mark.parametrize("word", ["Hello", "wonderful world", "jumpy dog"])
+def test_ass_captions_match_moviepy(tmp_path, word):
+    subtitles_path = str(tmp_path / "captions.ass")
+    write_ass_subtitles([{"word": word, "start_time": 0.0, "end_time": 1.0}], subtitles_path, font_path)
+    result = subprocess.run(
+        [FFMPEG_BINARY, "-v", "error", "-f", "lavfi", "-i", "color=black:s=1080x1920:d=1",
+         "-vf", f"ass=filename={subtitles_path}:fontsdir={fonts_dir}",
+         "-frames:v", "1", "-f", "rawvideo", "-pix_fmt", "rgb24", "-"],
+        capture_output=True
+    )
+    if result.returncode != 0:
+        pytest.skip(f"ffmpeg cannot render ASS subtitles: {result.stderr.decode(errors='replace')[-200:]}")
+    libass = fill_box(np.frombuffer(result.stdout, np.uint8).reshape(1920, 1080, 3))
+
+    # The 1920 px caption band is centred on the 1080 px frame at y=1100
+    rgb, _alpha = render_caption(word, font_path)
+    moviepy = fill_box(rgb) + np.array([-420, 1100, -420, 1100])
+
+    assert np.abs(libass - moviepy).max() <= 4
+    width, height = moviepy[2:] - moviepy[:2]
+    assert abs((libass[2] - libass[0]) - width) <= 0.01 * width + 1
+    assert abs((libass[3] - libass[1]) - height) <= 0.01 * height + 1
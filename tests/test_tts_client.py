@@ -0,0 +1,86 @@
+import socket
+import time
+
+import pytest
+import requests
+
+import tts
+from kokoro_stub import start_stub
+
+
+def unused_url():
+    """A local URL nothing listens on."""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    return f"http://127.0.0.1:{port}"
+
+
+@pytest.fixture
+def stub():
+    server, url = start_stub()
+    yield url
+    server.shutdown()
+
+
+def speech_payload():
+    return {"model": "kokoro", "input": "Hello there.", "voice": "af_heart", "speed": 1.0,
+            "response_format": "wav", "stream": False, "return_timestamps": True}
+
+
+def test_startup_health_check_skips_dead_endpoint(stub):
+    dead = unused_url()
+    client = tts.TTSClient([dead, stub], timeout=(1, 10), cooldown=60.0)
+
+    response = client.post_json("/dev/captioned_speech", speech_payload())
+
+    assert response.ok
+    metrics = client.metrics()
+    assert not metrics[dead]["healthy"]
+    assert metrics[dead]["health_failures"] == 1
+    assert metrics[dead]["requests"] == 0  # Only probed, never sent real work
+    assert metrics[stub]["healthy"]
+    assert metrics[stub]["requests"] == 1
+
+
+def test_fails_over_when_endpoint_dies(stub):
+    dead = unused_url()
+    client = tts.TTSClient([dead, stub], timeout=(1, 10), cooldown=60.0)
+    client._checked = True  # Both look healthy until the first request
+
+    response = client.post_json("/dev/captioned_speech", speech_payload())
+
+    assert response.ok
+    metrics = client.metrics()
+    assert metrics[dead]["requests"] == 1 and metrics[dead]["failures"] == 1
+    assert not metrics[dead]["healthy"]
+    assert metrics[stub]["requests"] == 1 and metrics[stub]["failures"] == 0
+
+
+def test_cooled_down_endpoint_is_probed_again(stub):
+    dead = unused_url()
+    client = tts.TTSClient([dead, stub], timeout=(1, 10), cooldown=0.05)
+    client.post_json("/dev/captioned_speech", speech_payload())
+    assert client.metrics()[dead]["health_checks"] == 1
+
+    time.sleep(0.1)
+    client.post_json("/dev/captioned_speech", speech_payload())
+
+    metrics = client.metrics()
+    assert metrics[dead]["health_checks"] == 2
+    assert metrics[dead]["requests"] == 0
+    assert metrics[stub]["requests"] == 2
+
+
+def test_backs_off_exponentially_when_every_endpoint_is_down(monkeypatch):
+    delays = []
+    monkeypatch.setattr(tts.time, "sleep", delays.append)
+    client = tts.TTSClient([unused_url(), unused_url()], timeout=(1, 10), retries=5, backoff=0.5)
+    client._checked = True
+
+    with pytest.raises(requests.ConnectionError):
+        client.post_json("/dev/captioned_speech", speech_payload())
+
+    # Six attempts over two endpoints: a pause after each of the first two rounds
+    assert delays == [0.5, 1.0]
+    assert all(stats["requests"] == 3 for stats in client.metrics().values())
@@ -0,0 +1,493 @@
+import base64
+import hashlib
+import io
+import json
+import os
+import re
+import subprocess
+import threading
+import time
+import wave
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from moviepy.config import FFMPEG_BINARY
+
+from instrumentation import event
+
+# ---------------------------------------------------------------------
+# Kokoro TTS Client
+# ---------------------------------------------------------------------
+
+# Base URLs of the Kokoro instances to balance across. KOKORO_ENDPOINTS
+# (comma separated) overrides the default.
+tts_endpoints = [
+    url.strip() for url in
+    os.environ.get("KOKORO_ENDPOINTS", "http://localhost:8880").split(",")
+    if url.strip()
+]
+tts_cache_dir = "assets/cache/tts"
+
+
+class TTSClient:
+    """
+    HTTP client for one or more Kokoro instances.
+
+    Requests go through a pooled `requests.Session` with timeouts. Each
+    request is sent to the healthy endpoint with the fewest outstanding
+    requests (ties go to the lower mean latency). Connection errors,
+    timeouts, 429 and 5xx responses mark the endpoint unhealthy for
+    `cooldown` seconds, and the request is retried on the next endpoint.
+    After every endpoint has been tried, it backs off exponentially.
+
+    Endpoints are probed on `health_path` before the first request, and an
+    endpoint whose cooldown has run out is probed again before it gets
+    real requests, so a dead instance only costs a cheap GET.
+    """
+
+    def __init__(
+        self,
+        endpoints,
+        timeout=(5, 300),
+        retries=3,
+        backoff=0.5,
+        cooldown=30.0,
+        pool_size=16,
+        health_path="/health"
+    ):
+        if not endpoints:
+            raise ValueError("TTSClient needs at least one endpoint")
+        self.endpoints = [url.rstrip("/") for url in endpoints]
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.cooldown = cooldown
+        self.health_path = health_path
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=len(self.endpoints), pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._lock = threading.Lock()
+        self._stats = {
+            url: {
+                "requests": 0,
+                "failures": 0,
+                "outstanding": 0,
+                "total_latency": 0.0,
+                "last_latency": None,
+                "unhealthy_until": 0.0,
+                "health_checks": 0,
+                "health_failures": 0,
+            }
+            for url in self.endpoints
+        }
+        self._checked = False  # Set once the first health check ran
+        self._check_lock = threading.Lock()
+
+    def _mean_latency(self, url):
+        stats = self._stats[url]
+        completed = stats["requests"] - stats["failures"]
+        return stats["total_latency"] / completed if completed else 0.0
+
+    def _acquire(self, exclude):
+        with self._lock:
+            now = time.monotonic()
+            remaining = [url for url in self.endpoints if url not in exclude] or self.endpoints
+            # If every endpoint is marked down, try them anyway rather than fail outright
+            healthy = [url for url in remaining if self._stats[url]["unhealthy_until"] <= now] or remaining
+            url = min(healthy, key=lambda u: (self._stats[u]["outstanding"], self._mean_latency(u)))
+            self._stats[url]["outstanding"] += 1
+            return url
+
+    def _release(self, url, latency, ok):
+        with self._lock:
+            stats = self._stats[url]
+            stats["outstanding"] -= 1
+            stats["requests"] += 1
+            if ok:
+                stats["total_latency"] += latency
+                stats["last_latency"] = latency
+                stats["unhealthy_until"] = 0.0
+            else:
+                stats["failures"] += 1
+                stats["unhealthy_until"] = time.monotonic() + self.cooldown
+
+    def _recheck(self):
+        """
+        Health-checks every endpoint before the first request, then each
+        endpoint whose cooldown has run out.
+        """
+        if not self._checked:
+            with self._check_lock:
+                if not self._checked:
+                    self.check_health()
+                    self._checked = True
+            return
+
+        with self._lock:
+            now = time.monotonic()
+            due = [url for url, stats in self._stats.items() if 0.0 < stats["unhealthy_until"] <= now]
+            for url in due:
+                # Keeps other requests away from it while it is probed
+                self._stats[url]["unhealthy_until"] = now + self.cooldown
+        for url in due:
+            self._probe(url)
+
+    def _probe(self, url):
+        try:
+            response = self.session.get(url + self.health_path, timeout=self.timeout[0])
+            healthy = response.ok
+        except requests.RequestException:
+            healthy = False
+        with self._lock:
+            stats = self._stats[url]
+            stats["health_checks"] += 1
+            if healthy:
+                stats["unhealthy_until"] = 0.0
+            else:
+                stats["health_failures"] += 1
+                stats["unhealthy_until"] = time.monotonic() + self.cooldown
+        return healthy
+
+    def post_json(self, path, payload):
+        """
+        POSTs `payload` to `path` on the best endpoint, failing over and
+        retrying as described on the class. Returns the `requests.Response`.
+        4xx responses other than 429 are raised straight away.
+        """
+        self._recheck()
+        tried = set()
+        rounds = 0  # Times every endpoint has been tried
+        last_error = None
+
+        for attempt in range(self.retries + 1):
+            url = self._acquire(tried)
+            start = time.monotonic()
+            try:
+                response = self.session.post(url + path, json=payload, timeout=self.timeout)
+            except requests.RequestException as e:
+                self._release(url, time.monotonic() - start, ok=False)
+                last_error = e
+            else:
+                retryable = response.status_code == 429 or response.status_code >= 500
+                self._release(url, time.monotonic() - start, ok=not retryable)
+                if not retryable:
+                    response.raise_for_status()
+                    return response
+                last_error = requests.HTTPError(
+                    f"{url}{path} returned HTTP {response.status_code}", response=response
+                )
+
+            tried.add(url)
+            if len(tried) >= len(self.endpoints):
+                tried.clear()
+                if attempt < self.retries:
+                    time.sleep(self.backoff * 2 ** rounds)
+                rounds += 1
+
+        raise last_error
+
+    def check_health(self):
+        """
+        Probes every endpoint's health path and updates its health state.
+        Returns {url: True/False}.
+        """
+        return {url: self._probe(url) for url in self.endpoints}
+
+    def metrics(self):
+        """
+        Per-endpoint request counts, failures, outstanding requests, latency
+        (seconds) and health checks.
+        """
+        with self._lock:
+            now = time.monotonic()
+            return {
+                url: {
+                    "requests": stats["requests"],
+                    "failures": stats["failures"],
+                    "outstanding": stats["outstanding"],
+                    "mean_latency": self._mean_latency(url),
+                    "last_latency": stats["last_latency"],
+                    "healthy": stats["unhealthy_until"] <= now,
+                    "health_checks": stats["health_checks"],
+                    "health_failures": stats["health_failures"],
+                }
+                for url, stats in self._stats.items()
+            }
+
+
+tts_client = TTSClient(tts_endpoints)
+
+
+def request_captioned_speech(text, voice, speed, model="kokoro", response_format="mp3"):
+    """
+    POSTs `text` to Kokoro's /dev/captioned_speech endpoint through `tts_client`.
+    Returns (audio bytes, word timestamps).
+    """
+    response = tts_client.post_json(
+        "/dev/captioned_speech",
+        {
+            "model": model,
+            "input": text,
+            "voice": voice,
+            "speed": speed,
+            "response_format": response_format,
+            "stream": False,
+        }
+    )
+    audio_json = json.loads(response.content)
+    audio_data = base64.b64decode(audio_json["audio"].encode("utf-8"))
+    return audio_data, audio_json["timestamps"]
+
+
+# ---------------------------------------------------------------------
+# Sentence-Chunked Synthesis
+# ---------------------------------------------------------------------
+
+max_chunk_chars = 400  # Sentences are packed into requests of at most this many characters
+chunk_workers = 4      # Concurrent chunk requests
+
+
+def split_sentences(text, max_chars=None):
+    """
+    Splits `text` at sentence boundaries and packs consecutive sentences into
+    chunks of at most `max_chars` (default `max_chunk_chars`) characters.
+    A sentence longer than that stays whole.
+    """
+    max_chars = max_chars or max_chunk_chars
+    sentences = [s for s in re.split(r"(?<=[.!?])\s+", text.strip()) if s]
+
+    chunks = []
+    current = ""
+    for sentence in sentences:
+        if current and len(current) + 1 + len(sentence) > max_chars:
+            chunks.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}" if current else sentence
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def read_wav(data):
+    """
+    Returns ((channels, sample width, sample rate), raw PCM frames) of a WAV payload.
+    """
+    with wave.open(io.BytesIO(data), "rb") as wav:
+        params = (wav.getnchannels(), wav.getsampwidth(), wav.getframerate())
+        frames = wav.readframes(wav.getnframes())
+    return params, frames
+
+
+def write_wav(params, frames):
+    channels, sample_width, sample_rate = params
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(channels)
+        wav.setsampwidth(sample_width)
+        wav.setframerate(sample_rate)
+        wav.writeframes(frames)
+    return buffer.getvalue()
+
+
+def transcode_audio(wav_data, response_format):
+    """
+    Encodes a WAV payload to `response_format` (e.g. "mp3") with ffmpeg.
+    """
+    if response_format == "wav":
+        return wav_data
+    result = subprocess.run(
+        [FFMPEG_BINARY, "-hide_banner", "-loglevel", "error",
+         "-f", "wav", "-i", "pipe:0", "-f", response_format, "pipe:1"],
+        input=wav_data, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+    if result.returncode != 0:
+        raise RuntimeError(
+            f"ffmpeg failed to encode narration as {response_format}:\n"
+            + result.stderr.decode("utf-8", errors="replace")
+        )
+    return result.stdout
+
+
+def synthesize_chunked(text, voice, speed, model="kokoro", response_format="mp3"):
+    """
+    Synthesizes `text` sentence chunk by sentence chunk, concurrently.
+
+    Chunks are requested as WAV so their PCM can be joined exactly. A failed
+    chunk is retried on its own by `tts_client`. Each chunk's
+    word timestamps are shifted by the duration of the audio before it, which
+    gives one timeline for the whole text. The joined audio is encoded once to
+    `response_format`. Returns (audio bytes, timestamps) like
+    `request_captioned_speech`.
+    """
+    chunks = split_sentences(text)
+    if len(chunks) <= 1:
+        return request_captioned_speech(text, voice, speed, model, response_format)
+
+    with ThreadPoolExecutor(max_workers=min(chunk_workers, len(chunks))) as pool:
+        responses = list(pool.map(
+            lambda chunk: request_captioned_speech(chunk, voice, speed, model, "wav"),
+            chunks
+        ))
+
+    params = None
+    pcm_parts = []
+    timestamps = []
+    offset = 0.0
+
+    for wav_data, chunk_timestamps in responses:
+        chunk_params, frames = read_wav(wav_data)
+        if params is None:
+            params = chunk_params
+        elif chunk_params != params:
+            raise ValueError(f"TTS chunks have different audio formats: {params} vs {chunk_params}")
+
+        for token in chunk_timestamps:
+            timestamps.append({
+                **token,
+                "start_time": token["start_time"] + offset,
+                "end_time": token["end_time"] + offset,
+            })
+
+        pcm_parts.append(frames)
+        channels, sample_width, sample_rate = params
+        offset += len(frames) / (channels * sample_width * sample_rate)
+
+    wav_data = write_wav(params, b"".join(pcm_parts))
+    return transcode_audio(wav_data, response_format), timestamps
+
+
+# ---------------------------------------------------------------------
+# Content-Addressed TTS Cache
+# ---------------------------------------------------------------------
+
+class TTSCache:
+    """
+    Persistent cache of captioned_speech responses. Each entry is keyed by a
+    hash of (text, voice, speed, model, response format) and stored as an
+    audio file plus a JSON file of word timestamps. When the cache grows past
+    `max_bytes` the least recently used entries are evicted.
+    """
+
+    def __init__(self, cache_dir=tts_cache_dir, max_bytes=512 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(text, voice, speed, model, response_format):
+        payload = json.dumps(
+            [text, voice, float(speed), model, response_format],
+            ensure_ascii=False
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _paths(self, key, response_format):
+        base = os.path.join(self.cache_dir, key)
+        return f"{base}.{response_format}", f"{base}.json"
+
+    def get(self, key, response_format):
+        """
+        Returns (audio bytes, timestamps) for `key`, or None on a miss.
+        """
+        audio_path, timestamps_path = self._paths(key, response_format)
+        try:
+            with open(timestamps_path, "r", encoding="utf-8") as f:
+                timestamps = json.load(f)
+            with open(audio_path, "rb") as f:
+                audio_data = f.read()
+        except (OSError, ValueError):
+            return None
+
+        # Mark as recently used for eviction
+        for path in (audio_path, timestamps_path):
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+
+        return audio_data, timestamps
+
+    def put(self, key, response_format, audio_data, timestamps):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        audio_path, timestamps_path = self._paths(key, response_format)
+        suffix = f".{os.getpid()}.{threading.get_ident()}.tmp"
+
+        # Audio first, timestamps last: an entry only counts once its JSON exists
+        with open(audio_path + suffix, "wb") as f:
+            f.write(audio_data)
+        os.replace(audio_path + suffix, audio_path)
+        with open(timestamps_path + suffix, "w", encoding="utf-8") as f:
+            json.dump(timestamps, f)
+        os.replace(timestamps_path + suffix, timestamps_path)
+
+        self.evict()
+
+    def evict(self):
+        """
+        Deletes least recently used entries until the cache fits in `max_bytes`.
+        """
+        with self._lock:
+            entries = {}
+            for name in os.listdir(self.cache_dir):
+                if name.endswith(".tmp"):
+                    continue
+                path = os.path.join(self.cache_dir, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                key = name.split(".", 1)[0]
+                size, mtime, paths = entries.get(key, (0, 0.0, []))
+                entries[key] = (size + stat.st_size, max(mtime, stat.st_mtime), paths + [path])
+
+            total = sum(size for size, _, _ in entries.values())
+            for size, _, paths in sorted(entries.values(), key=lambda e: e[1]):
+                if total <= self.max_bytes:
+                    break
+                for path in paths:
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+                total -= size
+
+
+tts_cache = TTSCache()
+
+
+def captioned_speech(
+    text,
+    voice,
+    speed,
+    model="kokoro",
+    response_format="mp3",
+    use_cache=True,
+    chunked=True
+):
+    """
+    Returns (audio bytes, word timestamps) for `text`, from the TTS cache when
+    the same input was synthesized before. `use_cache=False` always asks the
+    server (the fresh response still refreshes the cache).
+
+    With `chunked` long texts are synthesized sentence chunk by sentence chunk
+    in parallel (see `synthesize_chunked`).
+    """
+    key = TTSCache.key(text, voice, speed, model, response_format)
+
+    if use_cache:
+        cached = tts_cache.get(key, response_format)
+        if cached is not None:
+            return cached
+
+    if chunked:
+        audio_data, timestamps = synthesize_chunked(text, voice, speed, model, response_format)
+    else:
+        audio_data, timestamps = request_captioned_speech(text, voice, speed, model, response_format)
+    tts_cache.put(key, response_format, audio_data, timestamps)
+    event("tts_endpoints", endpoints=tts_client.metrics())
+    return audio_data, timestamps
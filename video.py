@@ -1,23 +1,46 @@
+import multiprocessing
 import os
-import random
-import requests
-import base64
-import json
 import re
+import shutil
+import tempfile
 import unicodedata
-
-from moviepy import AudioFileClip, VideoFileClip, TextClip, CompositeVideoClip, vfx
-from moviepy.video.VideoClip import ImageClip
-
-from image import generate_my_post_image  # Custom image generation
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+
+from moviepy import VideoFileClip, vfx
+
+from image import cover_font_path, cover_template_path, generate_my_post_image  # Custom image generation
+from ffmpeg_render import concat_segments, encode_renditions, render_with_ffmpeg
+from captions import SubtitleTrackClip, caption_cache, caption_grouping, group_captions
+from compositor import ReelCompositeClip
+from tts import captioned_speech
+from audio import PCMAudioClip, wav_duration
+from backgrounds import video_folder, get_proxy, select_background
+from manifest import find_render, input_key, record_render
+from instrumentation import (
+    Histogram,
+    current_job,
+    event,
+    job_trace,
+    span,
+    timed_frames,
+    tracing_enabled,
+)
+from progress import moviepy_logger, progress_enabled, report_progress
+from renditions import resolve_profiles
 
 # ---------------------------------------------------------------------
 # Path & File Utilities
 # ---------------------------------------------------------------------
 
-video_folder = "assets/background_videos"
 font_path = "assets/default/OpenSans-Bold.ttf"
 output_dir = "assets/outputs"
+jobs_dir = "assets/cache/jobs"  # One scratch directory per running make_video call
+reserved_list_name = "reserved_outputs.txt"  # Output files a job reserved, inside its workspace
+
+# "moviepy" composites every frame in Python, "ffmpeg" renders the whole reel
+# in a single ffmpeg filter graph.
+render_engines = ("moviepy", "ffmpeg")
 
 
 def get_next_available_filename(directory, base_name="video", extension=".mp4"):
@@ -25,11 +48,14 @@ def get_next_available_filename(directory, base_name="video", extension=".mp4"):
     Find the next available filename by checking existing files.
     If 'video.mp4' doesn't exist, return that. Otherwise, pick video_1.mp4,
     video_2.mp4, etc., based on the highest existing number.
+
+    The name is reserved by atomically creating an empty placeholder file,
+    so concurrent renders can never be handed the same path.
     """
-    import os
+    os.makedirs(directory, exist_ok=True)
 
     base_path = os.path.join(directory, base_name + extension)
-    if not os.path.exists(base_path):
+    if reserve_file(base_path):
         return base_path  # If "video.mp4" doesn't exist, return it directly
 
     existing_files = [
@@ -46,7 +72,102 @@ def get_next_available_filename(directory, base_name="video", extension=".mp4"):
             pass
 
     next_number = max(numbers, default=0) + 1
-    return os.path.join(directory, f"{base_name}_{next_number}{extension}")
+    while True:
+        candidate = os.path.join(directory, f"{base_name}_{next_number}{extension}")
+        if reserve_file(candidate):
+            return candidate
+        next_number += 1  # Another job took this name in the meantime
+
+
+def reserve_rendition_paths(profiles, directory=output_dir):
+    """
+    Reserves one output file per resolved profile: the first gets the next
+    free `video_N` name, the others `video_N.<profile name>.<container>`.
+    Returns a list of (profile, path) pairs.
+    """
+    primary = get_next_available_filename(directory, extension=f".{profiles[0]['container']}")
+    stem = os.path.splitext(primary)[0]
+    renditions = [(profiles[0], primary)]
+    for profile in profiles[1:]:
+        path = f"{stem}.{profile['name']}.{profile['container']}"
+        counter = 1
+        while not reserve_file(path):  # Only if another job uses the same stem with another container
+            path = f"{stem}.{profile['name']}_{counter}.{profile['container']}"
+            counter += 1
+        renditions.append((profile, path))
+    return renditions
+
+
+def reserve_file(path):
+    """
+    Creates `path` as an empty file if it does not exist yet.
+    Returns True if this call created it.
+    """
+    try:
+        fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        return False
+    os.close(fd)
+    return True
+
+
+def remove_file(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def create_job_workspace(root=jobs_dir):
+    """
+    Creates a private scratch directory for one render job.
+    """
+    os.makedirs(root, exist_ok=True)
+    return tempfile.mkdtemp(prefix="job_", dir=root)
+
+
+def remove_job_workspace(workspace):
+    shutil.rmtree(workspace, ignore_errors=True)
+
+
+def note_reserved(job, paths):
+    """
+    Lists output files reserved for `job` in its workspace, so the output
+    of a job whose process died can be found and removed later (see
+    `remove_abandoned_job`).
+    """
+    with open(os.path.join(job["workspace"], reserved_list_name), "a", encoding="utf-8") as f:
+        for path in paths:
+            f.write(path + "\n")
+
+
+def remove_abandoned_job(workspace):
+    """
+    Cleans up after a job whose process died: deletes the output files it
+    reserved (empty placeholders or partial videos) and its workspace.
+    """
+    try:
+        with open(os.path.join(workspace, reserved_list_name), encoding="utf-8") as f:
+            paths = f.read().split("\n")
+    except OSError:
+        paths = []
+    for path in paths:
+        if path:
+            remove_file(path)
+    remove_job_workspace(workspace)
+
+
+@contextmanager
+def job_workspace(root=jobs_dir):
+    """
+    Yields a private scratch directory for one render job and deletes it
+    afterwards, whether the job succeeded or failed.
+    """
+    workspace = create_job_workspace(root)
+    try:
+        yield workspace
+    finally:
+        remove_job_workspace(workspace)
 
 
 # ---------------------------------------------------------------------
@@ -114,185 +235,587 @@ def find_title_end_time(raw_tokens, title_text):
 
 
 # ---------------------------------------------------------------------
-# Token Merging (for Body Subtitles Only)
+# Render Stages
 # ---------------------------------------------------------------------
 
-def merge_for_subtitles(original_timestamps):
+def fetch_speech(voice, speed, title, body, use_tts_cache=True):
     """
-    Merge short words like "a", "the" with their following word, reduce punctuation.
-    This function is called AFTER we determine the title boundary so it won't
-    break multi-line title matching.
+    Stage 1: TTS. Returns (audio bytes, word timestamps) for title + body.
     """
-    merged = []
-    i = 0
+    combined_text = f"{title} {body}"
+    report_progress("tts")
+    with span("tts", chars=len(combined_text), voice=voice, speed=speed) as tts_span:
+        # WAV, so the narration can stay in memory as PCM (see audio.py)
+        audio_data, timestamps = captioned_speech(
+            combined_text, voice, speed, response_format="wav", use_cache=use_tts_cache
+        )
+        tts_span.set(audio_bytes=len(audio_data), tokens=len(timestamps))
+    return audio_data, timestamps
 
-    merge_words = {"a", "an", "the", "or", "and"}
-    allowed_punctuation = {"?"}
-    remove_punctuation = {"!", ",", ".", ":", ";"}
 
-    while i < len(original_timestamps):
-        token = original_timestamps[i]
-        word = token["word"]
+def prepare_job(workspace, title, audio_data, timestamps, use_proxy=True, caption_settings=None):
+    """
+    Stage 2: cover + timeline. Writes the cover into `workspace`, keeps the
+    WAV narration `audio_data` in memory, computes the title boundary and body subtitles, and picks a background
+    segment from the background index (see `select_background`).
+    With `use_proxy` the background is its pre-normalized 1080x1920 proxy
+    (built on first use), so rendering can skip the resize and crop.
+    `caption_settings` overrides the caption grouping limits (see
+    captions.group_captions).
+
+    Returns a job dict for `render_job`, or None if there is no background video.
+    The dict only holds plain data and paths, so it can be sent to another process.
+    """
+    title_text = title
+    cover_path = os.path.join(workspace, "reddit_post_cover.png")
 
-        if word in remove_punctuation:
-            i += 1
-            continue
+    # --- Step 2: Generate cover image for the multi-line title ---
+    report_progress("cover")
+    with span("cover"):
+        generate_my_post_image(title_text, output_path=cover_path)
+
+    # --- Step 3: Use UNmerged tokens to find the title boundary ---
+    report_progress("subtitles")
+    with span("title_boundary"):
+        raw_tokens = timestamps[:]  # shallow copy
+        title_end_time = find_title_end_time(raw_tokens, title_text)
+
+    # --- Step 4: Group the body words (start_time >= title_end_time) into captions ---
+    with span("caption_grouping") as grouping_span:
+        body_tokens = group_captions(timestamps, title_end_time, font_path, **(caption_settings or {}))
+        grouping_span.set(tokens=len(timestamps), captions=len(body_tokens))
+
+    # --- Step 5: Pick a background segment long enough for the audio ---
+    report_progress("background")
+    with span("background_select", use_proxy=use_proxy):
+        audio_duration = wav_duration(audio_data)
+        video_duration = audio_duration + 0.3
+        selection = select_background(video_duration, video_folder, use_proxy)
+
+        if selection:
+            source_path, background_start = selection
+        else:
+            print("No MP4 files found in the folder!")
+            return None
+
+        video_path = get_proxy(source_path) if use_proxy else source_path
+
+    return {
+        "workspace": workspace,
+        "title": title_text,
+        "audio_data": audio_data,
+        "cover_path": cover_path,
+        "title_end_time": title_end_time,
+        "body_tokens": body_tokens,
+        "video_duration": video_duration,
+        "background_path": video_path,
+        "background_source": source_path,
+        "background_start": background_start,
+        "trace_id": current_job(),
+    }
 
-        if word in allowed_punctuation:
-            if merged:
-                merged[-1]["word"] += word
-                merged[-1]["end_time"] = token["end_time"]
-            else:
-                merged.append(token)
-            i += 1
-            continue
-
-        # Attempt to merge with next token if in merge_words
-        if word.lower() in merge_words and i + 1 < len(original_timestamps):
-            next_token = original_timestamps[i + 1]
-            if next_token["word"] not in remove_punctuation:
-                merged_word = word + " " + next_token["word"]
-                merged_token = {
-                    "word": merged_word,
-                    "start_time": token["start_time"],
-                    "end_time": next_token["end_time"]
-                }
-                # Merge punctuation if next is punctuation
-                if (i + 2 < len(original_timestamps)
-                    and original_timestamps[i + 2]["word"] in allowed_punctuation):
-                    merged_token["word"] += original_timestamps[i + 2]["word"]
-                    merged_token["end_time"] = original_timestamps[i + 2]["end_time"]
-                    i += 1
-                merged.append(merged_token)
-                i += 2
-                continue
-
-        # Otherwise, just append as-is
-        merged.append(token)
-        i += 1
-
-    return merged
 
 # ---------------------------------------------------------------------
-# Main Function: make_video
+# Clip Cleanup
 # ---------------------------------------------------------------------
-
-def make_video(voice, speed, title, body):
+#
+# MoviePy clips that read files hold an ffmpeg reader process and its
+# pipes until they are closed; garbage collection alone does not reliably
+# release them, so a long-running worker slowly leaks processes, file
+# descriptors and frame buffers. Every clip `build_composite` creates is
+# collected and closed explicitly once the render is done, whether it
+# succeeded or not.
+
+def close_clips(clips):
     """
-    Generates a video with a multi-line title shown first (as an image)
-    and then body subtitles. The final clip is saved with an auto-incremented filename
-    to avoid overwriting existing files.
+    Closes `clips`, newest first. A clip that fails to close does not keep
+    the others open.
     """
-    title_text = title
-    body_text = body
-    combined_text = f"{title_text} {body_text}"
-
-    # --- Step 1: TTS Request ---
-    response = requests.post(
-        "http://localhost:8880/dev/captioned_speech",
-        json={
-            "model": "kokoro",
-            "input": combined_text,
-            "voice": voice,
-            "speed": speed,
-            "response_format": "mp3",
-            "stream": False,
-        },
-        stream=False
-    )
-    audio_json = json.loads(response.content)
-    audio_data = base64.b64decode(audio_json["audio"].encode("utf-8"))
-    timestamps = audio_json["timestamps"]
-
-    # Save MP3 to disk
-    with open("assets/cache/output.mp3", "wb") as f:
-        f.write(audio_data)
-
-    # --- Step 2: Generate cover image for the multi-line title ---
-    generate_my_post_image(title_text)
+    while clips:
+        clip = clips.pop()
+        try:
+            clip.close()
+        except Exception as e:
+            print(f"Could not close {type(clip).__name__}: {e}")
 
-    # --- Step 3: Use UNmerged tokens to find the title boundary ---
-    raw_tokens = timestamps[:]  # shallow copy
-    title_end_time = find_title_end_time(raw_tokens, title_text)
 
-    # --- Step 4: Merge tokens for body subtitles only AFTER finding boundary ---
-    merged_tokens = merge_for_subtitles(timestamps)
+@contextmanager
+def caption_cache_report():
+    """
+    Emits the caption cache lookups made in this block as one
+    "caption_cache" event (hits, disk hits and misses, plus the cache's
+    entry count and hit rate over the life of the process). Nothing is
+    emitted when no caption was looked up (the ffmpeg engine).
+    """
+    before = caption_cache.stats()
+    try:
+        yield
+    finally:
+        after = caption_cache.stats()
+        lookups = {name: after[name] - before[name] for name in ("hits", "disk_hits", "misses")}
+        if any(lookups.values()):
+            event("caption_cache", entries=after["entries"], process_hit_rate=after["hit_rate"], **lookups)
+
+
+@contextmanager
+def composite_clip(job, with_audio=True):
+    """
+    `build_composite` as a context manager that closes every clip it opened
+    on exit.
+    """
+    opened = []
+    try:
+        yield build_composite(job, with_audio, opened)
+    finally:
+        close_clips(opened)
 
-    # Filter out tokens that belong to the body (start_time >= title_end_time)
-    body_tokens = [tok for tok in merged_tokens if tok["start_time"] >= title_end_time]
 
-    # --- Step 5: Prepare background video & audio ---
-    audio_clip = AudioFileClip("assets/cache/output.mp3")
-    audio_duration = audio_clip.duration
-    video_duration = audio_duration + 0.3
-    video_files = [f for f in os.listdir(video_folder) if f.endswith(".mp4")]
+def build_composite(job, with_audio=True, opened=None):
+    """
+    Steps 5-8 of the MoviePy path: the background segment, the subtitle track
+    and the title overlay composited into one 1080x1920 clip by the
+    fixed-layout compositor.
 
-    if video_files:
-        random_video = random.choice(video_files)
-        video_path = os.path.join(video_folder, random_video)
-        bg_clip = VideoFileClip(video_path).subclipped(0, video_duration)
-    else:
-        print("No MP4 files found in the folder!")
-        return
-
-    # Resize background for Instagram Reels (1080x1920)
-    bg_clip = bg_clip.resized(height=1920)
-    crop_fx = vfx.Crop(
-        x_center=bg_clip.w / 2,
-        y_center=bg_clip.h / 2,
-        width=1080,
-        height=1920
+    Every clip created is appended to `opened`; the caller must pass them
+    to `close_clips` when done (or use `composite_clip`).
+    """
+    if opened is None:
+        opened = []
+    background_start = job["background_start"]
+    # The narration replaces the background's sound, so its audio is never decoded
+    source_clip = VideoFileClip(job["background_path"], audio=False)
+    opened.append(source_clip)
+    bg_clip = source_clip.subclipped(
+        background_start, background_start + job["video_duration"]
     )
-    bg_clip = crop_fx.apply(bg_clip)
-
-    # --- Step 6: Create body text clips only for body tokens ---
-    def create_text_clip(word, start_time, end_time):
-        duration = end_time - start_time
-        return (
-            TextClip(
-                text=word,
-                font=font_path,
-                font_size=110,
-                size=(1920, 200),
-                color='white',
-                method='caption',
-                text_align='center',
-                horizontal_align='center',
-                vertical_align='center',
-                stroke_color='black',
-                stroke_width=10
-            )
-            .with_duration(duration)
-            .with_start(start_time)
-            .with_position(('center', 1100))
+
+    # Resize background for Instagram Reels (1080x1920); proxies already are
+    if tuple(bg_clip.size) != (1080, 1920):
+        bg_clip = bg_clip.resized(height=1920)
+        crop_fx = vfx.Crop(
+            x_center=bg_clip.w / 2,
+            y_center=bg_clip.h / 2,
+            width=1080,
+            height=1920
         )
+        bg_clip = crop_fx.apply(bg_clip)
 
-    text_clips = [
-        create_text_clip(t["word"], t["start_time"], t["end_time"])
-        for t in body_tokens
-    ]
+    # --- Step 6: One subtitle track for all body tokens ---
+    subtitle_track = SubtitleTrackClip(
+        job["body_tokens"],
+        job["video_duration"],
+        lambda word: caption_cache.get(word, font_path)
+    )
 
-    # --- Step 7: Title image overlay for [0, title_end_time] ---
-    title_image_clip = (
-        ImageClip("assets/cache/reddit_post_cover.png")
-        .with_duration(title_end_time)
-        .with_position("center")
+    # --- Steps 7-8: Title image for [0, title_end_time) and captions at y=1100,
+    # blended into the background frame (see compositor.py) ---
+    final_clip = ReelCompositeClip(
+        bg_clip,
+        job["cover_path"],
+        job["title_end_time"],
+        subtitle_track,
+        cover_position=("center", "center"),
+        caption_position=("center", 1100)
     )
+    opened += [subtitle_track, final_clip]
+    if with_audio:
+        audio_clip = PCMAudioClip.from_wav(job["audio_data"])
+        opened.append(audio_clip)
+        final_clip = final_clip.with_audio(audio_clip)
+    if tracing_enabled():
+        final_clip = timed_frames(final_clip, Histogram("frame_render_ms"))
+    return final_clip
 
-    # --- Step 8: Composite the final clip ---
-    final_clip = CompositeVideoClip([bg_clip, title_image_clip] + text_clips).with_audio(audio_clip)
 
-    # --- Step 9: Output to a unique filename ---
-    output_filename = get_next_available_filename(output_dir)
+def ffmpeg_job_args(job):
+    """
+    The `render_with_ffmpeg` arguments that come from a job dict.
+    """
+    return {
+        "background_path": job["background_path"],
+        "background_start": job["background_start"],
+        "audio_path": None,
+        "audio_data": job["audio_data"],
+        "cover_path": job["cover_path"],
+        "body_tokens": job["body_tokens"],
+        "title_end_time": job["title_end_time"],
+        "video_duration": job["video_duration"],
+        "font_path": font_path,
+        "subtitles_path": os.path.join(job["workspace"], "captions.ass"),
+    }
+
+
+def render_job(job, engine="moviepy", segments=1, profiles=None):
+    """
+    Stage 3: composite + encode a job from `prepare_job` into a freshly
+    reserved output file. Returns the output path.
 
-    final_clip.write_videofile(
-        output_filename,
-        fps=24,
-        codec="libx264",  # Use NVIDIA GPU
-        audio_codec="aac",
-        preset="medium",
-        ffmpeg_params=["-pix_fmt", "yuv420p"]
-    )
+    With `segments` > 1 the MoviePy path is split into that many time
+    segments encoded in parallel processes (see `render_job_segmented`).
+    The ffmpeg engine always renders in one pass; x264 already uses every core there.
+
+    With `profiles` (names or dicts, see renditions.py) the frames are
+    composited once and encoded to every profile in the same pass, and a
+    dict {profile name: output path} is returned (see `render_renditions`).
+    """
+    with job_trace(job.get("trace_id")), caption_cache_report():
+        if profiles is not None:
+            return render_renditions(job, engine, segments, resolve_profiles(profiles))
+        if engine == "moviepy" and segments > 1:
+            return render_job_segmented(job, segments)
+
+        # Reserve the output name now; the placeholder is removed if rendering fails
+        output_filename = get_next_available_filename(output_dir)
+        note_reserved(job, [output_filename])
+        frames = int(job["video_duration"] * 24)
+        report_progress("encode", 0.0)
+
+        try:
+            if engine == "ffmpeg":
+                # Steps 6-9 happen inside a single ffmpeg filter graph
+                with span("encode", engine=engine, frames=frames) as encode_span:
+                    render_with_ffmpeg(
+                        output_path=output_filename,
+                        progress=(lambda f: report_progress("encode", f)) if progress_enabled() else None,
+                        **ffmpeg_job_args(job)
+                    )
+            else:
+                opened = []
+                try:
+                    with span("composite"):
+                        final_clip = build_composite(job, opened=opened)
+
+                    # --- Step 9: Output to the reserved filename ---
+                    with span("encode", engine=engine, frames=frames) as encode_span:
+                        final_clip.write_videofile(
+                            output_filename,
+                            fps=24,
+                            codec="libx264",  # Use NVIDIA GPU
+                            audio_codec="aac",
+                            audio_fps=final_clip.audio.fps,  # Keep the TTS sample rate, no resampling
+                            preset="medium",
+                            temp_audiofile_path=job["workspace"],
+                            ffmpeg_params=["-pix_fmt", "yuv420p"],
+                            logger=moviepy_logger()
+                        )
+                    if hasattr(final_clip, "frame_histogram"):
+                        final_clip.frame_histogram.emit(engine=engine)
+                finally:
+                    close_clips(opened)
+        except BaseException:
+            remove_file(output_filename)
+            raise
+
+        if encode_span.duration:
+            event("encoder", engine=engine, frames=frames, fps=frames / encode_span.duration)
 
     print(f"Video saved as: {output_filename}")
     return output_filename
+
+
+def render_renditions(job, engine, segments, profiles):
+    """
+    Renders a job to every resolved profile from one composite: frames are
+    composited once at 1080x1920 and the highest profile frame rate, then
+    split, scaled and encoded per profile by a single ffmpeg process (or by
+    one per segment with `segments` > 1). The narration is muxed into every
+    rendition. Returns {profile name: output path}.
+    """
+    renditions = reserve_rendition_paths(profiles)
+    note_reserved(job, [path for _profile, path in renditions])
+    fps = max(profile["fps"] for profile in profiles)
+    frames = int(job["video_duration"] * fps)
+    progress = (lambda f: report_progress("encode", f)) if progress_enabled() else None
+    encode_span = None
+    report_progress("encode", 0.0)
+
+    try:
+        if engine == "ffmpeg":
+            with span("encode", engine=engine, frames=frames, renditions=len(renditions)) as encode_span:
+                render_with_ffmpeg(
+                    output_path=None,
+                    fps=fps,
+                    progress=progress,
+                    renditions=renditions,
+                    **ffmpeg_job_args(job)
+                )
+        elif segments > 1:
+            render_job_segmented(job, segments, renditions, fps)
+        else:
+            opened = []
+            try:
+                with span("composite"):
+                    final_clip = build_composite(job, with_audio=False, opened=opened)
+
+                # ffmpeg reads the frames on stdin, so the narration goes in as a file
+                audio_path = os.path.join(job["workspace"], "narration.wav")
+                with open(audio_path, "wb") as f:
+                    f.write(job["audio_data"])
+
+                with span("encode", engine=engine, frames=frames, renditions=len(renditions)) as encode_span:
+                    width, height = final_clip.size
+                    encode_renditions(
+                        final_clip.iter_frames(fps=fps, dtype="uint8"),
+                        width,
+                        height,
+                        fps,
+                        renditions,
+                        job["video_duration"],
+                        audio_path=audio_path,
+                        progress=progress,
+                        total_frames=frames
+                    )
+                if hasattr(final_clip, "frame_histogram"):
+                    final_clip.frame_histogram.emit(engine=engine)
+            finally:
+                close_clips(opened)
+    except BaseException:
+        for _profile, path in renditions:
+            remove_file(path)
+        raise
+
+    if encode_span is not None and encode_span.duration:
+        event("encoder", engine=engine, frames=frames, renditions=len(renditions), fps=frames / encode_span.duration)
+
+    for _profile, path in renditions:
+        print(f"Video saved as: {path}")
+    return {profile["name"]: path for profile, path in renditions}
+
+
+# ---------------------------------------------------------------------
+# Segment-Parallel Encoding
+# ---------------------------------------------------------------------
+
+def caption_split_frames(job, segments, fps=24):
+    """
+    Returns the first frame of each of (at most) `segments` segments. Cuts are
+    placed on caption boundaries (the title end or a body token start) closest
+    to an even split, so no caption straddles two encodes.
+    """
+    total_frames = int(job["video_duration"] * fps)
+    boundaries = [job["title_end_time"]] + [tok["start_time"] for tok in job["body_tokens"]]
+    candidates = sorted({
+        int(round(t * fps)) for t in boundaries
+        if 0 < int(round(t * fps)) < total_frames
+    })
+
+    starts = [0]
+    for k in range(1, segments):
+        ideal = total_frames * k / segments
+        cut = min(candidates, key=lambda f: abs(f - ideal)) if candidates else int(ideal)
+        if starts[-1] < cut < total_frames:
+            starts.append(cut)
+    return starts
+
+
+def render_segment(job, start_frame, end_frame, output_path, fps=24, renditions=None):
+    """
+    Encodes frames [start_frame, end_frame) of the composite, video only.
+    `end_frame=None` runs to the end of the clip. Runs in a worker process.
+    With `renditions` ((profile, path) pairs) the segment is encoded to
+    every rendition instead of `output_path`.
+    """
+    with job_trace(job.get("trace_id")), caption_cache_report():
+        with composite_clip(job, with_audio=False) as final_clip:
+            start = start_frame / fps
+            # Half a frame of slack so float rounding never drops the last frame
+            end = None if end_frame is None else start + (end_frame - start_frame + 0.5) / fps
+
+            with span("segment_encode", start_frame=start_frame, end_frame=end_frame):
+                segment_clip = final_clip.subclipped(start, end)
+                if renditions is None:
+                    segment_clip.write_videofile(
+                        output_path,
+                        fps=fps,
+                        codec="libx264",
+                        audio=False,
+                        preset="medium",
+                        ffmpeg_params=["-pix_fmt", "yuv420p"],
+                        logger=None
+                    )
+                else:
+                    width, height = segment_clip.size
+                    encode_renditions(
+                        segment_clip.iter_frames(fps=fps, dtype="uint8"),
+                        width, height, fps, renditions, segment_clip.duration
+                    )
+            if hasattr(final_clip, "frame_histogram"):
+                final_clip.frame_histogram.emit(engine="moviepy", start_frame=start_frame)
+    return output_path if renditions is None else [path for _profile, path in renditions]
+
+
+def render_job_segmented(job, segments, renditions=None, fps=24):
+    """
+    Renders the MoviePy path in up to `segments` parallel processes, one per
+    time segment, then joins the segments losslessly and muxes the audio once.
+
+    With `renditions` ((profile, path) pairs reserved by `render_renditions`)
+    each segment is encoded to every rendition and every rendition is
+    joined on its own; the rendition paths are returned.
+    """
+    if renditions is None:
+        outputs = [(None, get_next_available_filename(output_dir))]
+        note_reserved(job, [outputs[0][1]])
+    else:
+        outputs = renditions
+
+    try:
+        starts = caption_split_frames(job, segments, fps)
+        ends = starts[1:] + [None]
+        # segment_paths[i][k]: segment i of output k
+        segment_paths = [
+            [
+                os.path.join(job["workspace"], f"segment_{i:03d}.mp4" if profile is None
+                             else f"segment_{i:03d}.{profile['name']}.{profile['container']}")
+                for profile, _path in outputs
+            ]
+            for i in range(len(starts))
+        ]
+
+        mp_context = multiprocessing.get_context("spawn")
+        with span("encode", engine="moviepy", segments=len(starts), renditions=len(outputs)):
+            with ProcessPoolExecutor(max_workers=len(starts), mp_context=mp_context) as pool:
+                futures = [
+                    pool.submit(
+                        render_segment, job, start, end, paths[0], fps,
+                        None if renditions is None else [(profile, path) for (profile, _), path in zip(outputs, paths)]
+                    )
+                    for start, end, paths in zip(starts, ends, segment_paths)
+                ]
+                report_progress("encode", 0.0)
+                for done, future in enumerate(as_completed(futures), 1):
+                    future.result()
+                    report_progress("encode", done / len(futures))
+
+        report_progress("concat")
+        with span("concat", segments=len(starts), renditions=len(outputs)):
+            for k, (profile, output_path) in enumerate(outputs):
+                concat_segments([paths[k] for paths in segment_paths], None, output_path, job["video_duration"],
+                                audio_data=job["audio_data"], profile=profile)
+    except BaseException:
+        if renditions is None:  # Rendition placeholders are removed by the caller
+            remove_file(outputs[0][1])
+        raise
+
+    if renditions is not None:
+        return [path for _profile, path in outputs]
+    print(f"Video saved as: {outputs[0][1]}")
+    return outputs[0][1]
+
+
+# ---------------------------------------------------------------------
+# Render Manifest Keys
+# ---------------------------------------------------------------------
+
+# Files every render draws from; their contents are part of the key
+render_assets = (font_path, cover_font_path, cover_template_path)
+
+
+def render_inputs(
+    voice,
+    speed,
+    title,
+    body,
+    engine="moviepy",
+    use_proxy=True,
+    segments=1,
+    profiles=None,
+    caption_settings=None
+):
+    """
+    The inputs that decide what a render looks like, as {"script",
+    "settings"} for the render manifest (see manifest.py). Profiles and
+    caption limits are resolved, so naming a default explicitly gives the
+    same key; the segment count only matters for the MoviePy engine.
+    """
+    return {
+        "script": {"voice": voice, "speed": float(speed), "title": title, "body": body},
+        "settings": {
+            "engine": engine,
+            "use_proxy": use_proxy,
+            "segments": max(segments, 1) if engine == "moviepy" else 1,
+            "profiles": None if profiles is None else resolve_profiles(profiles),
+            "captions": dict(caption_grouping, **(caption_settings or {})),
+        },
+    }
+
+
+def render_key(inputs):
+    return input_key(inputs["script"], inputs["settings"], render_assets)
+
+
+def reuse_render(key):
+    """
+    The outputs of an identical earlier render, or None (see find_render).
+    """
+    outputs = find_render(key)
+    if outputs is not None:
+        event("render_reused", key=key)
+        print(f"Inputs unchanged, reusing: {outputs}")
+    return outputs
+
+
+# ---------------------------------------------------------------------
+# Main Function: make_video
+# ---------------------------------------------------------------------
+
+def make_video(
+    voice,
+    speed,
+    title,
+    body,
+    engine="moviepy",
+    use_tts_cache=True,
+    use_proxy=True,
+    segments=1,
+    profiles=None,
+    caption_settings=None,
+    force=False
+):
+    """
+    Generates a video with a multi-line title shown first (as an image)
+    and then body subtitles. The final clip is saved with an auto-incremented filename
+    to avoid overwriting existing files.
+
+    Intermediates live in a private job workspace and the output name is
+    reserved atomically, so several make_video calls can run concurrently.
+
+    `engine` selects the render backend, one of `render_engines`.
+    `use_tts_cache=False` bypasses the TTS cache and always calls Kokoro.
+    `use_proxy=False` reads the original background instead of its proxy.
+    `segments` > 1 encodes that many time segments in parallel (MoviePy engine).
+    `profiles` renders several output renditions (e.g. ["reels", "720p"],
+    see renditions.py) in one pass and returns {profile name: path}.
+    `caption_settings` overrides the caption grouping limits, e.g.
+    {"max_chars": 12} (see captions.group_captions).
+
+    When a render with the same inputs is recorded in the render manifest
+    and its outputs still exist, those are returned without rendering
+    (see manifest.py); `force=True` renders anyway.
+    """
+    if engine not in render_engines:
+        raise ValueError(f"Unknown render engine {engine!r}, expected one of {render_engines}")
+    if profiles is not None:
+        profiles = resolve_profiles(profiles)  # Fail before TTS on a bad profile
+    inputs = render_inputs(voice, speed, title, body, engine, use_proxy, segments, profiles, caption_settings)
+    key = render_key(inputs)
+
+    with job_trace(title=title[:80], engine=engine):
+        if not force:
+            outputs = reuse_render(key)
+            if outputs is not None:
+                return outputs
+
+        # --- Step 1: TTS Request (served from the TTS cache when possible) ---
+        audio_data, timestamps = fetch_speech(voice, speed, title, body, use_tts_cache)
+
+        with job_workspace() as workspace:
+            # --- Steps 2-5: cover, title boundary, body subtitles, background ---
+            job = prepare_job(workspace, title, audio_data, timestamps, use_proxy, caption_settings)
+            if job is None:
+                return
+
+            # --- Steps 6-9: composite and encode ---
+            outputs = render_job(job, engine, segments, profiles)
+            record_render(key, inputs, job, outputs)
+            return outputs
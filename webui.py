@@ -1,174 +1,301 @@
 import streamlit as st
+import io
 import os
-import time
-import zipfile
-from video import make_video  # Ensure this function exists in your project
-
-
-# Streamlit UI
-st.title("AI Video Creator 🎬")
-
-# Sidebar settings (User selects voice and speed directly)
-st.sidebar.header("Settings")
-voice = st.sidebar.selectbox("Choose Voice", ["af_alloy","af_aoede","af_bella","af_heart","af_jadzia","af_jessica",
-                                              "af_kore","af_nicole","af_nova","af_river","af_sarah","af_sky","af_v0",
-                                              "af_v0bella","af_v0irulan","af_v0nicole","af_v0sarah","af_v0sky",
-                                              "am_adam","am_echo","am_eric","am_fenrir","am_liam","am_michael",
-                                              "am_onyx","am_puck","am_santa","am_v0adam","am_v0gurney","am_v0michael",
-                                              "bf_alice","bf_emma","bf_lily","bf_v0emma","bf_v0isabella","bm_daniel",
-                                              "bm_fable","bm_george","bm_lewis","bm_v0george","bm_v0lewis","ef_dora",
-                                              "em_alex","em_santa","ff_siwis","hf_alpha","hf_beta","hm_omega","hm_psi",
-                                              "if_sara","im_nicola","jf_alpha","jf_gongitsune","jf_nezumi",
-                                              "jf_tebukuro","jm_kumo","pf_dora","pm_alex","pm_santa","zf_xiaobei",
-                                              "zf_xiaoni","zf_xiaoxiao","zf_xiaoyi","zm_yunjian","zm_yunxi","zm_yunxia",
-                                              "zm_yunyang"])
-speed = st.sidebar.slider("Speech Speed", 0.5, 2.0, 1.0)
-
-# Mode selection
-mode = st.radio("Select Mode", ["Single", "Multiple"])
-
-download_ready = False
-output_files = []
-video_output_dir = "assets/outputs"  # Directory to store generated videos
-
-
-def clean_output_directory():
-    """Removes all files from the output directory before generating new videos."""
-    if os.path.exists(video_output_dir):
-        for file in os.listdir(video_output_dir):
-            file_path = os.path.join(video_output_dir, file)
-            if os.path.isfile(file_path):
-                os.remove(file_path)
-        print("✅ Cleaned up old videos in assets/outputs/")
-    else:
-        os.makedirs(video_output_dir)  # Ensure the directory exists
-
-
-def process_video_file(script_content, voice, speed):
-    """Processes multiple videos using raw script content (without saving to a file)."""
-
-    # Split script content into lines (simulating reading from a file)
-    lines = [line.rstrip() for line in script_content.splitlines()]  # Remove trailing spaces but keep structure
-
-    videos = []
-    title_lines = []
-    body_lines = []
-    is_body = False  # Start by reading the title
-
-    for line in lines:
-        if line.startswith("##"):  # Separator detected
-            if title_lines and body_lines:  # If we have both title and body, save the video
-                title = "\n".join(title_lines).strip()
-                body = "\n".join(body_lines).strip()
-                videos.append((title, body))
-                title_lines.clear()
-                body_lines.clear()
-
-            is_body = not is_body  # Toggle between title and body mode
-            continue  # Skip the ## line itself
-
-        if is_body:
-            body_lines.append(line)
-        else:
-            title_lines.append(line)
-
-    # Ensure the last video is added if the file does not end with ##
-    if title_lines and body_lines:
-        videos.append((" ".join(title_lines).strip(), "\n".join(body_lines).strip()))
-
-    if not videos:
-        print("No valid video scripts found in the content.")
-        return []
-
-    output_videos = []
-
-    for i, (t, b) in enumerate(videos):
-        print(f"\nProcessing video {i + 1}/{len(videos)}...")
-        print(f"Title: {t}")
-        print(f"Body preview: {b[:50]}...")  # Show preview of body
-
-        file_path = make_video(voice, speed, t, b)  # Call your video generation function
-        output_videos.append(file_path)
-
-    return output_videos  # Return list of generated video filenames
-
-
-def create_zip(output_files):
-    """Creates a ZIP archive from a list of file paths."""
-    os.makedirs(video_output_dir, exist_ok=True)  # Ensure the directory exists
-    zip_filename = os.path.join(video_output_dir, "generated_videos.zip")
-
-    with zipfile.ZipFile(zip_filename, "w") as zipf:
+import uuid
+from archive import StreamingZip
+from render_service import RenderService, describe_job, finished_states, job_progress
+from scripts import iter_scripts, script_format
+from preview import draft_script, make_preview, render_preview
+from jobqueue import submit_jobs, job_status
+
+# Batch ZIPs are served by Streamlit's static file handler (see .streamlit/config.toml)
+static_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+
+try:
+    # The static handler answers 404 for larger files, so archives are split into parts below it
+    from streamlit.web.server.app_static_file_handler import MAX_APP_STATIC_FILE_SIZE as max_static_size
+except ImportError:
+    max_static_size = 200 * 1024 * 1024
+
+
+@st.cache_resource
+def get_render_service():
+    """One render service per Streamlit server, shared by every session and kept across reruns."""
+    return RenderService(
+        workers=int(os.environ.get("REELSAI_UI_WORKERS", 2)),
+        tts_workers=int(os.environ.get("REELSAI_UI_TTS_WORKERS", 2)),
+        archive_dir=static_dir,
+        archive_part_size=max_static_size
+    )
+
+
+def create_zip(output_files, zip_name="generated_videos.zip"):
+    """
+    Creates a ZIP archive (stored entries, MP4 does not compress) from a list
+    of file paths, split into parts Streamlit can serve. Returns the part paths.
+    """
+    zip_path = os.path.join(static_dir, zip_name)
+    with StreamingZip(zip_path, max_static_size) as archive:
         for file_path in output_files:
-            zipf.write(file_path, os.path.basename(file_path))  # Store only the filename inside the ZIP
-
-    return zip_filename
-
-
-if mode == "Single":
-    st.subheader("Single Video Mode")
-    title = st.text_input("Enter Video Title")
-    body = st.text_area("Enter Video Script")
-
-    #background_option = st.radio("Choose Background", ["Upload", "Random"])
-    #video_file = None
-    #if background_option == "Upload":
-    #    video_file = st.file_uploader("Upload Background Video", type=["mp4"])
-
-    if st.button("Generate Video"):
-        clean_output_directory()  # Cleanup before generating new videos
-        with st.spinner("Generating video..."):
-            file_path = make_video(voice, speed, title, body)
-            output_files = [file_path]
-            download_ready = True
-        st.success(f"Video '{os.path.basename(file_path)}' is ready!")
-
-elif mode == "Multiple":
-    st.subheader("Multiple Videos Mode")
-
-    script_file = st.file_uploader("Upload Script File (TXT)", type=["txt"])
-    #background_option = st.radio("Choose Background", ["Upload", "Random"])
-    #video_file = None
-    #if background_option == "Upload":
-    #    video_file = st.file_uploader("Upload Background Video", type=["mp4"])
-
-    if st.button("Generate Videos"):
-        if script_file is not None:
-            clean_output_directory()  # Cleanup before generating new videos
-            with st.spinner("Generating multiple videos..."):
-                # Read the uploaded script file directly (without saving it)
-                script_content = script_file.read().decode("utf-8")  # Convert bytes to string
-
-                # Process the script content directly instead of reading from a file
-                output_files = process_video_file(script_content, voice, speed)  # Pass content, not path
-
-                download_ready = True
-            if output_files:
-                with st.spinner("Compressing videos into ZIP..."):
-                    zip_file = create_zip(output_files)
-                    st.success("All videos are ready!")
+            archive.add(file_path)  # Store only the filename inside the ZIP
+
+    return archive.paths
+
+
+def zip_download(zip_paths, label="Download All Videos (ZIP)"):
+    """
+    Links the parts of a ZIP for download. They are streamed from disk by
+    Streamlit's static file handler, so the server never holds an archive
+    in memory; every part is below its size limit (see StreamingZip).
+    """
+    zip_paths = [path for path in zip_paths if os.path.exists(path)]
+    if not zip_paths:
+        return
+    if not st.get_option("server.enableStaticServing"):
+        st.error(
+            "Static serving is off (server.enableStaticServing in .streamlit/config.toml), so the ZIP "
+            f"cannot be downloaded here. It is saved on the server as {', '.join(zip_paths)}"
+        )
+        return
+
+    links = []
+    for number, zip_path in enumerate(zip_paths, 1):
+        if len(zip_paths) == 1:
+            text, file_name = label, "generated_videos.zip"
         else:
-            st.error("Please upload a script file.")
-
-# Provide a single download button for ZIP file after processing multiple videos
-if download_ready and mode == "Multiple" and output_files:
-    if os.path.exists(zip_file):  # Ensure the ZIP file exists
-        with open(zip_file, "rb") as f:
-            st.download_button(
-                label="Download All Videos (ZIP)",
-                data=f,
-                file_name="generated_videos.zip",
-                mime="application/zip"
-            )
-
-# Provide a download button for single mode
-elif download_ready and mode == "Single" and output_files:
-    file_path = output_files[0]
-    if os.path.exists(file_path):  # Ensure the file exists before allowing download
-        with open(file_path, "rb") as f:
-            st.download_button(
-                label="Download Video",
-                data=f,
-                file_name=os.path.basename(file_path),  # Extract only the filename
-                mime="video/mp4"
-            )
+            text, file_name = f"{label}, part {number} of {len(zip_paths)}", f"generated_videos-{number}.zip"
+        if os.path.getsize(zip_path) > max_static_size:
+            # A single video larger than the limit
+            st.warning(f"Part {number} is over Streamlit's download size limit; it is saved on the server as {zip_path}")
+            continue
+        # The mtime query keeps browsers from serving a previous archive
+        version = int(os.path.getmtime(zip_path))
+        links.append(
+            f'<a href="app/static/{os.path.basename(zip_path)}?v={version}" download="{file_name}">⬇️ {text}</a>'
+        )
+    if links:
+        st.markdown("<br>".join(links), unsafe_allow_html=True)
+
+
+def uploaded_scripts(script_file, errors):
+    """Streams the scripts of an uploaded TXT/JSONL/CSV file; malformed entries are appended to `errors`."""
+    script_file.seek(0)
+    lines = io.TextIOWrapper(script_file, encoding="utf-8-sig", newline="")
+    try:
+        yield from iter_scripts(
+            lines, script_format(script_file.name), on_error=lambda line, message: errors.append((line, message))
+        )
+    finally:
+        lines.detach()  # Leave the upload open for later reruns
+
+
+def show_script_errors(errors, limit=10):
+    """Lists skipped malformed entries with their line numbers."""
+    if not errors:
+        return
+    lines = [f"- line {line}: {message}" for line, message in errors[:limit]]
+    if len(errors) > limit:
+        lines.append(f"- ... and {len(errors) - limit} more")
+    st.warning(f"Skipped {len(errors)} malformed script(s):\n" + "\n".join(lines))
+
+
+@st.fragment(run_every=1.0)
+def render_progress(service, session_id):
+    """Live per-job progress of this session's renders; refreshes itself every second."""
+    batches = service.session_batches(session_id)
+    finished = sum(job["state"] in finished_states for _batch, jobs in batches for job in jobs)
+    if st.session_state.setdefault("finished_jobs", finished) != finished:
+        # A job finished: rerun the whole page to show its download
+        st.session_state["finished_jobs"] = finished
+        st.rerun()
+
+    for batch, jobs in batches:
+        if all(job["state"] in finished_states for job in jobs):
+            continue
+        for job in jobs:
+            progress_col, cancel_col = st.columns([5, 1])
+            progress_col.progress(job_progress(job), text=f"{job['title'][:50]} — {describe_job(job)}")
+            if job["state"] not in finished_states and job["stage"] != "cancelling":
+                if cancel_col.button("Cancel", key=f"cancel-{job['id']}"):
+                    service.cancel(job["id"])
+
+
+def main():
+    # Streamlit UI
+    st.title("AI Video Creator 🎬")
+
+    # Sidebar settings (User selects voice and speed directly)
+    st.sidebar.header("Settings")
+    voice = st.sidebar.selectbox("Choose Voice", ["af_alloy","af_aoede","af_bella","af_heart","af_jadzia","af_jessica",
+                                                  "af_kore","af_nicole","af_nova","af_river","af_sarah","af_sky","af_v0",
+                                                  "af_v0bella","af_v0irulan","af_v0nicole","af_v0sarah","af_v0sky",
+                                                  "am_adam","am_echo","am_eric","am_fenrir","am_liam","am_michael",
+                                                  "am_onyx","am_puck","am_santa","am_v0adam","am_v0gurney","am_v0michael",
+                                                  "bf_alice","bf_emma","bf_lily","bf_v0emma","bf_v0isabella","bm_daniel",
+                                                  "bm_fable","bm_george","bm_lewis","bm_v0george","bm_v0lewis","ef_dora",
+                                                  "em_alex","em_santa","ff_siwis","hf_alpha","hf_beta","hm_omega","hm_psi",
+                                                  "if_sara","im_nicola","jf_alpha","jf_gongitsune","jf_nezumi",
+                                                  "jf_tebukuro","jm_kumo","pf_dora","pm_alex","pm_santa","zf_xiaobei",
+                                                  "zf_xiaoni","zf_xiaoxiao","zf_xiaoyi","zm_yunjian","zm_yunxi","zm_yunxia",
+                                                  "zm_yunyang"])
+    speed = st.sidebar.slider("Speech Speed", 0.5, 2.0, 1.0)
+
+    service = get_render_service()
+    render_workers = st.sidebar.number_input(
+        "Parallel Renders (shared by all users)", 1, max(os.cpu_count() or 1, service.workers), service.workers
+    )
+    if render_workers != service.workers:
+        service.set_workers(render_workers)
+
+    # Identifies this browser session's jobs in the shared service
+    session_id = st.session_state.setdefault("session_id", uuid.uuid4().hex)
+
+    # Mode selection
+    mode = st.radio("Select Mode", ["Single", "Multiple"])
+
+    if mode == "Single":
+        st.subheader("Single Video Mode")
+        title = st.text_input("Enter Video Title")
+        body = st.text_area("Enter Video Script")
+
+        #background_option = st.radio("Choose Background", ["Upload", "Random"])
+        #video_file = None
+        #if background_option == "Upload":
+        #    video_file = st.file_uploader("Upload Background Video", type=["mp4"])
+
+        # The last preview's draft is reused by "Generate Video" while the inputs are unchanged
+        draft = st.session_state.get("draft")
+        if draft is not None and draft["script"] != (voice, speed, title, body):
+            draft = None
+
+        preview_col, kind_col = st.columns([1, 3])
+        sheet = kind_col.radio("Preview as", ["Video", "Contact sheet"], horizontal=True) == "Contact sheet"
+        if preview_col.button("Preview"):
+            if title.strip() and body.strip():
+                with st.spinner("Rendering preview..."):
+                    if draft is None:
+                        draft_id, preview_path = make_preview(voice, speed, title, body, sheet=sheet)
+                    else:
+                        draft_id, preview_path = draft["id"], render_preview(draft["id"], sheet)
+                if draft_id is None:
+                    st.error("No MP4 files found in the background folder")
+                else:
+                    draft = st.session_state["draft"] = {
+                        "id": draft_id, "script": (voice, speed, title, body), "preview": preview_path,
+                        "title_end": draft_script(draft_id)[1],
+                    }
+            else:
+                st.error("Please enter a title and a script.")
+
+        if draft is not None and os.path.exists(draft["preview"]):
+            if draft["preview"].endswith(".png"):
+                st.image(draft["preview"])
+            else:
+                st.video(draft["preview"])
+            st.caption(f"Title ends at {draft['title_end']:.2f}s. Generate Video reuses this preview's speech, cover and background.")
+
+        if st.button("Generate Video"):
+            if title.strip() and body.strip():
+                # Rendered in the background; progress is shown below
+                script = {"title": title, "body": body, "draft": draft["id"] if draft is not None else None}
+                service.submit(session_id, [script], voice, speed)
+                st.success("Video queued.")
+            else:
+                st.error("Please enter a title and a script.")
+
+    elif mode == "Multiple":
+        st.subheader("Multiple Videos Mode")
+
+        script_file = st.file_uploader("Upload Script File (TXT, JSONL or CSV)", type=["txt", "jsonl", "csv"])
+        #background_option = st.radio("Choose Background", ["Upload", "Random"])
+        #video_file = None
+        #if background_option == "Upload":
+        #    video_file = st.file_uploader("Upload Background Video", type=["mp4"])
+
+        use_queue = st.checkbox("Send to background workers (python3 cli.py worker)")
+
+        if use_queue and st.button("Queue Videos"):
+            if script_file is not None:
+                errors = []
+                job_ids = submit_jobs(uploaded_scripts(script_file, errors), voice, speed)
+                show_script_errors(errors)
+                if job_ids:
+                    st.session_state["queued_job_ids"] = job_ids
+                    st.success(f"Queued {len(job_ids)} video(s).")
+                else:
+                    st.error("No valid video scripts found in the file.")
+            else:
+                st.error("Please upload a script file.")
+
+        if use_queue and st.session_state.get("queued_job_ids"):
+            st.button("Refresh Status")  # Any click reruns the script and re-reads the queue
+            queued_jobs = job_status(st.session_state["queued_job_ids"])
+            st.table([
+                {"id": job["id"], "title": job["title"][:40], "state": job["state"],
+                 "output": job["output"] or "", "error": job["error"] or ""}
+                for job in queued_jobs
+            ])
+            finished = [job["output"] for job in queued_jobs if job["state"] == "done"]
+            if finished and all(job["state"] in ("done", "failed") for job in queued_jobs):
+                # Every click reruns the page: only rebuild the ZIP when the finished videos change
+                queue_zip = st.session_state.get("queue_zip")
+                if (queue_zip is None or queue_zip["outputs"] != finished
+                        or not all(os.path.exists(path) for path in queue_zip["paths"])):
+                    queue_zip = st.session_state["queue_zip"] = {
+                        "outputs": finished, "paths": create_zip(finished, f"queue-{session_id[:12]}.zip"),
+                    }
+                zip_download(queue_zip["paths"])
+
+        if not use_queue and st.button("Generate Videos"):
+            if script_file is not None:
+                # Each script is queued as soon as it is parsed, so the first renders
+                # start while the rest of the file is read; each video goes into
+                # the batch ZIP as it finishes
+                errors = []
+                batch_id = service.submit(session_id, uploaded_scripts(script_file, errors), voice, speed, archive=True)
+                show_script_errors(errors)
+                if batch_id is not None:
+                    st.success(f"Queued {len(service.batches[batch_id]['job_ids'])} video(s).")
+                else:
+                    st.error("No valid video scripts found in the file.")
+            else:
+                st.error("Please upload a script file.")
+
+    batches = service.session_batches(session_id)
+    if batches:
+        st.subheader("Your Videos")
+        render_progress(service, session_id)
+
+    # Downloads for finished batches, newest first
+    for batch, jobs in reversed(batches):
+        if not all(job["state"] in finished_states for job in jobs):
+            continue
+        outputs = [job["output"] for job in jobs if job["state"] == "done"]
+        problems = [f"{job['title'][:50]}: {describe_job(job)}" for job in jobs if job["state"] != "done"]
+
+        with st.container(border=True):
+            if len(jobs) == 1 and outputs:
+                file_path = outputs[0]
+                if os.path.exists(file_path):  # Ensure the file exists before allowing download
+                    with open(file_path, "rb") as f:
+                        st.download_button(
+                            label=f"Download '{jobs[0]['title'][:40]}'",
+                            data=f,
+                            file_name=os.path.basename(file_path),  # Extract only the filename
+                            mime="video/mp4",
+                            key=f"download-{batch['id']}"
+                        )
+            elif batch["zip_ready"]:
+                st.write(f"{len(outputs)} of {len(jobs)} videos ready")
+                zip_download(batch["zip_paths"])
+            for problem in problems:
+                st.caption(problem)
+            if st.button("Clear", key=f"clear-{batch['id']}", help="Delete these videos from the server"):
+                service.forget(batch["id"])
+                st.rerun()
+
+
+# Render worker processes are spawned, which re-imports this script as
+# __mp_main__; only build the UI when Streamlit runs it as __main__.
+if __name__ == "__main__":
+    main()